@@ -0,0 +1,36 @@
+import time
+import warnings
+from mock_server import MockTDX
+from nycu_tdx_py import tdx, client
+
+
+# memory of the fetcher outputs as returned by default and with compact=True, measured with memory_usage(deep=True)
+
+CASES=[('Bus_StopOfRoute', ('Intercity',), {}),
+       ('Bus_TravelTime', ('Taipei', [str(i) for i in range(200)]), {}),
+       ('Bus_Schedule', ('Taipei',), {'stoptimes':True}),
+       ('Rail_TimeTable', ('TRA', 'station'), {}),
+       ('Rail_TimeTable', ('TRA', 'general'), {})]
+
+
+
+def measure(fetcher, args, kwargs):
+    start=time.perf_counter()
+    data=fetcher("mock-token", *args, **kwargs)
+    return(time.perf_counter()-start, data.memory_usage(deep=True).sum())
+
+
+
+if __name__=="__main__":
+    warnings.simplefilter("ignore")
+    with MockTDX(routes=1000, stops=40, trains=200, stations=240) as mock:
+        client.configure(base_url=mock.base_url, rate=None)
+        print("%-30s %8s %10s %10s %11s %11s %7s" % ("fetcher", "rows", "time(s)", "compact(s)", "memory(MB)", "compact(MB)", "ratio"))
+        for name, args, kwargs in CASES:
+            fetcher=getattr(tdx, name)
+            fetcher("mock-token", *args, **kwargs)
+            seconds, memory=measure(fetcher, args, kwargs)
+            seconds_compact, memory_compact=measure(fetcher, args, dict(kwargs, compact=True))
+            rows=len(fetcher("mock-token", *args, **kwargs))
+            print("%-30s %8d %10.3f %10.3f %11.1f %11.1f %7.1f" % (name+" "+args[0]+(" "+args[1] if isinstance(args[-1], str) and len(args)>1 else ""), rows,
+                                                                  seconds, seconds_compact, memory/1e6, memory_compact/1e6, memory/memory_compact))
@@ -0,0 +1,51 @@
+import json
+import time
+import requests
+import synthetic
+from nycu_tdx_py import stream
+from nycu_tdx_py.client import STREAM_CHUNK_SIZE
+
+
+# decoding a whole TRA GeneralStationTimetable body: response.text then json.loads (former), the raw bytes with the
+# standard library and with orjson, and the records decoded while they are downloaded with both backends
+
+def chunks(body):
+    for i in range(0, len(body), STREAM_CHUNK_SIZE):
+        yield(body[i:i+STREAM_CHUNK_SIZE])
+
+
+
+def response_text(body):
+    response=requests.Response()
+    response._content=body
+    response.headers['Content-Type']="application/json"
+    return(json.loads(response.text))
+
+
+
+def best(func, *args, repeat=3):
+    seconds=[]
+    for i in range(repeat):
+        start=time.perf_counter()
+        func(*args)
+        seconds.append(time.perf_counter()-start)
+    return(min(seconds))
+
+
+
+if __name__=="__main__":
+    body=json.dumps(synthetic.tra_stationtimetable(stations=240, trains=400), ensure_ascii=False).encode("utf-8")
+    fast=stream.orjson
+    results=dict()
+    results['response.text + json.loads']=best(response_text, body)
+    stream.orjson=None
+    results['loads(content), json']=best(stream.loads, body)
+    results['iter_records, json']=best(lambda body: list(stream.iter_records(chunks(body), 'StationTimetables')), body)
+    stream.orjson=fast
+    if fast is not None:
+        results['loads(content), orjson']=best(stream.loads, body)
+        results['iter_records, orjson']=best(lambda body: list(stream.iter_records(chunks(body), 'StationTimetables')), body)
+
+    print("body: %.1f MB" % (len(body)/1e6))
+    for name, seconds in results.items():
+        print("%-28s %8.3f s" % (name, seconds))
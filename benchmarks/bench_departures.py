@@ -0,0 +1,89 @@
+import argparse
+import random
+import shutil
+import tempfile
+import time
+import warnings
+import numpy as np
+import pandas as pd
+from mock_server import MockTDX
+from nycu_tdx_py import tdx, client
+from nycu_tdx_py.timetable import TimetableIndex, WEEKDAYS
+
+
+# timetable.TimetableIndex answering "next n departures from a station after a time on a weekday" against filtering the
+# timetable data frame on every request, on the TRA station and general timetables and the bus stop times of the mock server
+
+
+
+def filter_departures(data, id_col, station, seconds, weekday, n):
+    # the former lookup: the whole timetable filtered for each request
+    rows=data[(data[id_col]==station) & (data.DepartureSec>=seconds) & (data[WEEKDAYS[weekday]]==1)]
+    return(rows.nsmallest(n, 'DepartureSec'))
+
+
+
+def run(name, frames, id_col, queries, n):
+    start=time.perf_counter()
+    index=TimetableIndex.from_frames(frames)
+    build=time.perf_counter()-start
+    ids=index.stations
+    stations=np.random.choice(ids, queries)
+    seconds=np.random.randint(5*3600, 23*3600, queries)
+    weekdays=np.random.randint(0, 7, queries)
+
+    index.search(stations[:1], seconds[:1], weekdays[:1], n)
+    start=time.perf_counter()
+    positions=index.search(stations, seconds, weekdays, n)
+    batched=time.perf_counter()-start
+    single=1000
+    start=time.perf_counter()
+    for i in range(single):
+        index._search_one(stations[i], int(seconds[i]), int(weekdays[i]), n)
+    search_one=(time.perf_counter()-start)/single
+    start=time.perf_counter()
+    for i in range(single):
+        index.next_departures(stations[i], int(seconds[i]), int(weekdays[i]), n)
+    frame_one=(time.perf_counter()-start)/single
+
+    data=pd.concat(frames, ignore_index=True) if isinstance(frames, list) else frames
+    start=time.perf_counter()
+    for i in range(200):
+        expected=filter_departures(data, id_col, stations[i], seconds[i], weekdays[i], n)
+        found=index.frame(positions[i])
+        assert sorted(expected.DepartureSec)==sorted(found.DepartureSec), (stations[i], seconds[i], weekdays[i], list(expected.DepartureSec), list(found.DepartureSec))
+    filtered=(time.perf_counter()-start)/200
+
+    path=tempfile.mkdtemp()
+    index.save(path)
+    start=time.perf_counter()
+    loaded=TimetableIndex.load(path)
+    loaded.search(stations[:1], seconds[:1], weekdays[:1], n)
+    load=time.perf_counter()-start
+    shutil.rmtree(path)
+
+    print("%-28s %10d %8.2f %12.0f %10.1f %10.1f %12.1f %8.3f" % (name, len(index), build, queries/batched, search_one*1e6, frame_one*1e6, filtered*1e6, load))
+
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--stations", type=int, default=240)
+    parser.add_argument("--trains", type=int, default=1000)
+    parser.add_argument("--routes", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=100000)
+    parser.add_argument("-n", type=int, default=5)
+    args=parser.parse_args()
+    warnings.simplefilter("ignore")
+    random.seed(0)
+    np.random.seed(0)
+    with MockTDX(stations=args.stations, trains=args.trains, routes=args.routes, trips=20, stops=30) as mock:
+        client.configure(base_url=mock.base_url, rate=None)
+        tra_station=tdx.Rail_TimeTable("mock-token", "TRA", "station")
+        tra_general=tdx.Rail_TimeTable("mock-token", "TRA", "general")
+        bus=tdx.Bus_Schedule("mock-token", "Taipei", stoptimes=True)
+
+    print("%-28s %10s %8s %12s %10s %10s %12s %8s" % ("timetable", "departures", "build s", "batched q/s", "search us", "frame us", "filter us", "load s"))
+    run("TRA station", tra_station, "StationID", args.queries, args.n)
+    run("TRA station and general", [tra_station, tra_general], "StationID", args.queries, args.n)
+    run("bus stop times", bus, "StopUID", args.queries, args.n)
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import time
+import warnings
+import pandas as pd
+import geopandas as gpd
+from shapely import wkt
+import synthetic
+from nycu_tdx_py import tdx, client
+
+
+class StubClient:
+    # serves one prepared payload to every request
+    def __init__(self, payload):
+        self.payload=payload
+
+    def get_json(self, url, access_token):
+        return(self.payload)
+
+    def iter_json(self, url, access_token, key=None):
+        return(iter(self.payload))
+
+
+
+def reload_csv(path):
+    # the nightly CSVs have to rebuild the geometry from WKT or coordinates
+    data=pd.read_csv(path)
+    if 'geometry' in data.columns:
+        return(gpd.GeoDataFrame(data, geometry=data.geometry.apply(wkt.loads), crs='epsg:4326'))
+    return(gpd.GeoDataFrame(data, geometry=gpd.points_from_xy(data.PositionLon, data.PositionLat), crs='epsg:4326'))
+
+
+
+def timed(func, *args):
+    start=time.perf_counter()
+    func(*args)
+    return(time.perf_counter()-start)
+
+
+
+if __name__=="__main__":
+    warnings.simplefilter("ignore")
+    cases=[('Bus_Shape', tdx.Bus_Shape, synthetic.bus_shape(routes=1000, subroutes=2, points=300)),
+           ('Bus_StopOfRoute', tdx.Bus_StopOfRoute, synthetic.bus_stopofroute(routes=1500, subroutes=2, stops=60))]
+    folder=tempfile.mkdtemp()
+    print("%-16s %-8s %9s %9s %10s" % ("dataset", "format", "write(s)", "read(s)", "size(MB)"))
+    for name, fetcher, payload in cases:
+        client.set_client(StubClient(payload))
+        data=fetcher(None, "Taipei", dtype="sf")
+        for out_format in ['.csv', '.shp', '.parquet', '.feather']:
+            path=os.path.join(folder, name+out_format)
+            t_write=timed(tdx.write_out, data, path)
+            t_read=timed(reload_csv if out_format=='.csv' else tdx.read_out, path)
+            size=sum([os.path.getsize(os.path.join(folder, i)) for i in os.listdir(folder) if i.startswith(name+".")])
+            print("%-16s %-8s %9.2f %9.2f %10.1f" % (name, out_format, t_write, t_read, size/1e6))
+            for i in os.listdir(folder):
+                os.remove(os.path.join(folder, i))
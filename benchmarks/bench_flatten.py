@@ -0,0 +1,91 @@
+import time
+import numpy as np
+import pandas as pd
+from itertools import chain
+import synthetic
+from nycu_tdx_py import tdx
+from nycu_tdx_py.flatten import flatten
+
+
+# the per-column list comprehensions used before flatten.flatten()
+
+def legacy_stopofroute(js_data):
+    bus_stopofroute=pd.DataFrame.from_dict(js_data, orient="columns")
+    bus_stopofroute.RouteName=[bus_stopofroute.RouteName[i]['Zh_tw'] if len(bus_stopofroute.RouteName[i])!=0  else None for i in range(len(bus_stopofroute))]
+    bus_stopofroute.SubRouteName=[bus_stopofroute.SubRouteName[i]['Zh_tw'] if len(bus_stopofroute.SubRouteName[i])!=0  else None for i in range(len(bus_stopofroute))]
+    bus_info=bus_stopofroute.loc[:,['RouteUID','RouteID','RouteName','SubRouteUID','SubRouteName','SubRouteID','Direction']]
+    stopnum=[len(bus_stopofroute.Stops[i]) for i in range(len(bus_stopofroute))]
+    bus_stop=dict()
+    label_all=['StopUID','StopID','StopName','StopBoarding','StopSequence','StationID','StopPosition','LocationCityCode']
+    for label_id in label_all:
+        if label_id in ['StopName']:
+            bus_stop[label_id]=[bus_stopofroute.Stops[i][j][label_id]['Zh_tw'] if label_id in bus_stopofroute.Stops[i][j] else None for i in range(len(bus_stopofroute)) for j in range(len(bus_stopofroute.Stops[i]))]
+        else:
+            bus_stop[label_id]=[bus_stopofroute.Stops[i][j][label_id] if label_id in bus_stopofroute.Stops[i][j] else None for i in range(len(bus_stopofroute)) for j in range(len(bus_stopofroute.Stops[i]))]
+    bus_stop=pd.DataFrame(bus_stop)
+    bus_stop=pd.concat([bus_stop, pd.DataFrame(list(bus_stop.StopPosition)).loc[:,['PositionLon','PositionLat']]], axis=1)
+    bus_info=bus_info.iloc[np.repeat(np.arange(len(bus_info)), stopnum)].reset_index(drop=True)
+    bus_stop=bus_stop.loc[:,['StopUID','StopID','StopName','StationID','StopBoarding','StopSequence','PositionLon','PositionLat','LocationCityCode']]
+    return(pd.concat([bus_info, bus_stop], axis=1))
+
+
+
+def legacy_traveltime(js_data):
+    subroute_info=dict()
+    for label_id in ['RouteUID','RouteID','SubRouteUID','SubRouteID','Direction']:
+        subroute_info[label_id]=[js_data[i][label_id] if label_id in js_data[i] else None for i in range(len(js_data))]
+    subroute_info=pd.DataFrame(subroute_info)
+    num_of_week=[len(js_data[i]["TravelTimes"]) for i in range(len(js_data))]
+    subroute_info=subroute_info.iloc[np.repeat(np.arange(len(subroute_info)), num_of_week)].reset_index(drop=True)
+    week_info=dict()
+    for label_id in ['Weekday','StartHour','EndHour']:
+        week_info[label_id]=[js_data[i]["TravelTimes"][j][label_id] if label_id in js_data[i]["TravelTimes"][j] else None for i in range(len(js_data)) for j in range(len(js_data[i]["TravelTimes"]))]
+    subroute_info=pd.concat([subroute_info, pd.DataFrame(week_info)], axis=1).reset_index(drop=True)
+    num_of_od=[len(js_data[i]["TravelTimes"][j]['S2STimes']) for i in range(len(js_data)) for j in range(len(js_data[i]["TravelTimes"]))]
+    subroute_info=subroute_info.iloc[np.repeat(np.arange(len(subroute_info)), num_of_od)].reset_index(drop=True)
+    traveltime_info=dict()
+    for label_id in ['FromStopID','ToStopID','FromStationID','ToStationID','RunTime']:
+        traveltime_info[label_id]=[js_data[i]["TravelTimes"][j]['S2STimes'][k][label_id] if label_id in js_data[i]["TravelTimes"][j]['S2STimes'][k] else None for i in range(len(js_data)) for j in range(len(js_data[i]["TravelTimes"])) for k in range(len(js_data[i]["TravelTimes"][j]['S2STimes']))]
+    return(pd.concat([subroute_info, pd.DataFrame(traveltime_info)], axis=1).reset_index(drop=True))
+
+
+
+def legacy_tra_general(data_all):
+    temp=pd.DataFrame(data_all)
+    train_info=pd.DataFrame.from_records(temp.TrainInfo)
+    train_info.TrainTypeName=[train_info.TrainTypeName[i]['Zh_tw'] for i in range(len(train_info))]
+    train_info.StartingStationName=[train_info.StartingStationName[i]['Zh_tw'] for i in range(len(train_info))]
+    train_info.EndingStationName=[train_info.EndingStationName[i]['Zh_tw'] for i in range(len(train_info))]
+    train_info=pd.concat([train_info, pd.DataFrame.from_records(temp.ServiceDay)], axis=1)
+    rail_timetable_temp=pd.DataFrame({'StopSequence':list(chain(*[list(map(lambda x : x['StopSequence'], temp.StopTimes[i])) for i in range(len(temp))])),
+                                      'StationID':list(chain(*[list(map(lambda x : x['StationID'], temp.StopTimes[i])) for i in range(len(temp))])),
+                                      'StationName':list(chain(*[list(map(lambda x : x['StationName']['Zh_tw'], temp.StopTimes[i])) for i in range(len(temp))])),
+                                      'ArrivalTime':list(chain(*[list(map(lambda x : x['ArrivalTime'], temp.StopTimes[i])) for i in range(len(temp))])),
+                                      'DepartureTime':list(chain(*[list(map(lambda x : x['DepartureTime'], temp.StopTimes[i])) for i in range(len(temp))]))})
+    num_of_station=[len(temp.StopTimes[i]) for i in range(len(temp))]
+    train_info=train_info.iloc[np.repeat(np.arange(len(train_info)), num_of_station)].reset_index(drop=True)
+    return(pd.concat([train_info, rail_timetable_temp], axis=1))
+
+
+
+def timeit(func, *args, repeat=3):
+    best=float("inf")
+    for i in range(repeat):
+        start=time.perf_counter()
+        func(*args)
+        best=min(best, time.perf_counter()-start)
+    return(best)
+
+
+
+if __name__=="__main__":
+    # roughly the size of Taipei / New Taipei and of a full TRA timetable
+    cases=[('Bus_StopOfRoute', synthetic.bus_stopofroute(routes=1500, subroutes=2, stops=60), legacy_stopofroute, tdx.BUS_STOPOFROUTE_SPEC),
+           ('Bus_TravelTime', synthetic.bus_traveltime(subroutes=400, bands=14, stops=60), legacy_traveltime, tdx.BUS_TRAVELTIME_SPEC),
+           ('Rail_TimeTable TRA general', synthetic.tra_generaltimetable(trains=1000, stops=60)['TrainTimetables'], legacy_tra_general, tdx.TRA_GENERALTIMETABLE_SPEC)]
+    print("%-28s %10s %10s %10s %8s" % ("payload", "rows", "legacy(s)", "flatten(s)", "speedup"))
+    for name, js_data, legacy, spec in cases:
+        rows=len(flatten(js_data, spec))
+        t_legacy=timeit(legacy, js_data, repeat=1)
+        t_flatten=timeit(flatten, js_data, spec)
+        print("%-28s %10d %10.3f %10.3f %7.1fx" % (name, rows, t_legacy, t_flatten, t_legacy/t_flatten))
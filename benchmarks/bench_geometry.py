@@ -0,0 +1,64 @@
+import time
+import warnings
+import pandas as pd
+import geopandas as gpd
+from shapely import wkt
+from itertools import compress
+import synthetic
+from nycu_tdx_py import tdx, client
+
+
+# the Bike_Shape parsing used before: a row by row repair of the WKT text and one wkt.loads() per feature
+
+def legacy_bike_shape(js_data):
+    bike_shape=pd.DataFrame.from_dict(js_data, orient="columns")
+    bike_shape=bike_shape.loc[:,['RouteName','City','RoadSectionStart','RoadSectionEnd','CyclingLength','Direction','Geometry']].rename(columns={'Geometry':'geometry'})
+    for i in range(len(bike_shape)):
+        temp=bike_shape.loc[i, 'geometry']
+        temp=temp.replace("MULTILINESTRING ((", "")
+        temp=temp.replace("))", "")
+        temp=temp.split("),(")
+        temp_count=[temp[i].count(" ") for i in range(len(temp))]
+        fil=[temp_count[i]!=1 for i in range(len(temp_count))]
+        if sum([not elem for elem in fil])!=0:
+            temp=list(compress(temp, fil))
+            temp="MULTILINESTRING (("+("),(".join(temp))+"))"
+            bike_shape.loc[i, 'geometry']=temp
+    # the features left without any line could not be parsed at all
+    valid=~bike_shape.geometry.str.contains(r"\(\(\)\)")
+    bike_shape=bike_shape[valid].reset_index(drop=True)
+    bike_shape['geometry']=bike_shape['geometry'].apply(wkt.loads)
+    return(gpd.GeoDataFrame(bike_shape, crs='epsg:4326'))
+
+
+
+class StubClient:
+    # serves one prepared payload to every request
+    def __init__(self, payload):
+        self.payload=payload
+
+    def get_json(self, url, access_token):
+        return(self.payload)
+
+
+
+def timeit(func, *args, repeat=3):
+    best=float("inf")
+    for i in range(repeat):
+        start=time.perf_counter()
+        result=func(*args)
+        best=min(best, time.perf_counter()-start)
+    return(best, result)
+
+
+
+if __name__=="__main__":
+    warnings.simplefilter("ignore")
+    # roughly the size of the cycling network of all counties
+    js_data=synthetic.bike_shape(routes=20000, parts=4, points=40, single=0.05)
+    client.set_client(StubClient(js_data))
+    t_legacy, old=timeit(legacy_bike_shape, js_data, repeat=1)
+    t_current, new=timeit(tdx.Bike_Shape, None, "Taipei", "sf")
+    new=new[~new.geometry.is_empty].reset_index(drop=True)
+    print("features %d, legacy %.2fs, current %.2fs, speedup %.1fx, same geometries: %s"
+          % (len(new), t_legacy, t_current, t_legacy/t_current, bool(old.geometry.geom_equals_exact(new.geometry, 0).all())))
@@ -0,0 +1,82 @@
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+import requests
+from nycu_tdx_py import tdx, client, history
+
+
+# history.download() of the vehicle detector history of every road class from the mock server: throughput by number of
+# workers, a resumed download, and the peak memory of one day streamed in chunks against Road_Traffic(date=...) written whole;
+# the mock runs in its own process, so that serving the bodies does not take the interpreter from the workers
+
+
+
+def folder_size(path):
+    return(sum([os.path.getsize(os.path.join(root, name)) for root, dirs, files in os.walk(path) for name in files]))
+
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=6)
+    parser.add_argument("--vds", type=int, default=500)
+    parser.add_argument("--minutes", type=int, default=60)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args=parser.parse_args()
+    warnings.simplefilter("ignore")
+    end="2024-01-%02d" % args.days
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port=sock.getsockname()[1]
+    mock=subprocess.Popen([sys.executable, "mock_server.py", "--port", str(port), "--vds", str(args.vds), "--minutes", str(args.minutes)], stdout=subprocess.DEVNULL)
+    try:
+        base_url="http://127.0.0.1:"+str(port)
+        client.configure(base_url=base_url, rate=None)
+        # the mock generates the history of each authority once, before anything is timed
+        body=0
+        for authority in ["Freeway","Highway"]:
+            for attempt in range(100):
+                try:
+                    body+=len(requests.get(base_url+"/api/historical/v2/Historical/Road/Traffic/Live/VD/"+authority+"?Dates=2024-01-01").content)
+                    break
+                except requests.ConnectionError:
+                    time.sleep(0.1)
+
+        print("%-10s %8s %10s %10s %12s %10s" % ("workers", "seconds", "rows", "rows/s", "JSON MB/s", "disk MB"))
+        for workers in args.workers:
+            path=tempfile.mkdtemp()
+            start=time.perf_counter()
+            summary=history.download("mock-token", "vd_live", "2024-01-01", end, roadclass="ALL", path=path, max_workers=workers)
+            seconds=time.perf_counter()-start
+            print("%-10d %8.2f %10d %10.0f %12.1f %10.2f" % (workers, seconds, summary.rows.sum(), summary.rows.sum()/seconds, body*args.days/seconds/1e6, folder_size(path)/1e6))
+
+        # one day lost and the download run again
+        os.remove(history.partition_file(path, "vd_live", "2024-01-02", "0"))
+        start=time.perf_counter()
+        summary=history.download("mock-token", "vd_live", "2024-01-01", end, roadclass="ALL", path=path, max_workers=4)
+        print("resumed: %d partitions downloaded again, %d skipped, %.2f s" % ((summary.status=="done").sum(), (summary.status=="skipped").sum(), time.perf_counter()-start))
+
+        start=time.perf_counter()
+        data=history.read_history(path, "vd_live", "2024-01-02", "2024-01-03", roadclass="0", filters=[('VDID','in',['VD-F00001','VD-F00002'])])
+        print("read_history: 2 detectors over 2 days, %d rows in %.3f s" % (len(data), time.perf_counter()-start))
+        shutil.rmtree(path)
+
+        path=tempfile.mkdtemp()
+        tracemalloc.start()
+        history.download("mock-token", "vd_live", "2024-01-01", "2024-01-01", roadclass="0", path=path, max_workers=1)
+        streamed=tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        tdx.Road_Traffic("mock-token", "0", "vd_live", date="2024-01-01", out=os.path.join(path, "whole.parquet"))
+        whole=tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        shutil.rmtree(path)
+        print("peak memory of one freeway day: %.0f MB streamed in chunks, %.0f MB fetched whole" % (streamed/1e6, whole/1e6))
+    finally:
+        mock.terminate()
@@ -0,0 +1,47 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+# time of 'import nycu_tdx_py.tdx' in fresh interpreters, next to 'import pandas' which it cannot avoid;
+# --check fails when one of the modules only the 'sf' outputs need is imported at startup again
+
+HEAVY=['geopandas','shapely','pyproj','pyogrio','fiona','tqdm','pyarrow']
+
+SCRIPT="""
+import sys, time
+start=time.perf_counter()
+import {module}
+print(time.perf_counter()-start)
+print(",".join([i for i in {heavy} if i in sys.modules]))
+"""
+
+
+
+def run(module):
+    output=subprocess.run([sys.executable, "-c", SCRIPT.format(module=module, heavy=HEAVY)], capture_output=True, text=True, check=True,
+                          env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))).stdout.split("\n")
+    return(float(output[0]), set([i for i in output[1].split(",") if i!=""]))
+
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=11)
+    parser.add_argument("--check", action="store_true", help="exit with 1 if a heavy module is imported by nycu_tdx_py.tdx")
+    args=parser.parse_args()
+
+    # the two imports alternate so that both see the same state of the disk cache
+    base, seconds=[], []
+    for i in range(args.repeat):
+        base.append(run("pandas")[0])
+        package, loaded=run("nycu_tdx_py.tdx")
+        seconds.append(package)
+    loaded=loaded-run("pandas")[1]
+    print("import pandas           %7.1f ms" % (statistics.median(base)*1000))
+    print("import nycu_tdx_py.tdx  %7.1f ms" % (statistics.median(seconds)*1000))
+    print("heavy modules loaded:   %s" % (", ".join(sorted(loaded)) or "none"))
+    if args.check and len(loaded)!=0:
+        sys.exit(1)
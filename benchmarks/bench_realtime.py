@@ -0,0 +1,81 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import warnings
+import pandas as pd
+from mock_server import MockTDX
+from nycu_tdx_py import tdx, client, realtime
+
+
+# realtime.Poller on every county against the mock server: each tick of 20 seconds is polled twice, the second
+# poll is answered 304; the disk taken by the changed rows is compared with storing every snapshot whole
+
+
+
+def folder_size(path):
+    return(sum([os.path.getsize(os.path.join(root, name)) for root, dirs, files in os.walk(path) for name in files]))
+
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--ticks", type=int, default=10)
+    parser.add_argument("--buses", type=int, default=600)
+    parser.add_argument("--routes", type=int, default=100)
+    args=parser.parse_args()
+    warnings.simplefilter("ignore")
+    path=tempfile.mkdtemp()
+    counties=list(tdx.tdx_county().Code)
+    with MockTDX(buses=args.buses, routes=args.routes, stops=30) as mock:
+        client.configure(base_url=mock.base_url, rate=None)
+        poller=realtime.Poller("mock-token", records=["position","eta"], path=os.path.join(path, "store"), flush_interval=1e9)
+        seconds=[]
+        snapshots={'position':[], 'eta':[]}
+        for tick in range(args.ticks):
+            mock.tick=tick
+            # the payloads of the tick are generated by the mock before the poll is timed
+            for county in counties:
+                for record in ["RealTimeByFrequency","EstimatedTimeOfArrival"]:
+                    mock.respond("/api/basic/v2/Bus/"+record+"/City/"+county, {})
+            start=time.perf_counter()
+            poller.poll()
+            seconds.append(time.perf_counter()-start)
+            start=time.perf_counter()
+            poller.poll()
+            seconds_304=time.perf_counter()-start
+            # the same ticks stored whole, as every snapshot of Bus_RealTime
+            for record in snapshots:
+                snapshots[record].append(pd.concat([tdx.Bus_RealTime("mock-token", county, record).assign(County=county) for county in counties]))
+        start=time.perf_counter()
+        poller.flush()
+        flush=time.perf_counter()-start
+
+    stats=poller.stats
+    stored=folder_size(os.path.join(path, "store"))
+    whole=dict()
+    for out_format in ['csv','parquet']:
+        folder=os.path.join(path, out_format)
+        os.makedirs(folder)
+        for record, frames in snapshots.items():
+            for i, frame in enumerate(frames):
+                getattr(frame, "to_"+out_format)(os.path.join(folder, record+str(i)+"."+out_format), index=False)
+        whole[out_format]=folder_size(folder)
+
+    start=time.perf_counter()
+    taipei=realtime.read_realtime(os.path.join(path, "store"), "position", county="Taipei")
+    query_county=time.perf_counter()-start
+    start=time.perf_counter()
+    route=realtime.read_realtime(os.path.join(path, "store"), "eta", routes=["Taipei1"])
+    query_route=time.perf_counter()-start
+    shutil.rmtree(path)
+
+    day=86400/20/args.ticks
+    print("counties %d, ticks %d, rows per tick %d" % (len(counties), args.ticks, stats['rows']/args.ticks))
+    print("poll: %.2f s per tick, %.3f s when answered 304 (%d of %d requests)" % (sum(seconds)/len(seconds), seconds_304, stats['not_modified'], stats['requests']))
+    print("rows stored: %d of %d (%.0f%%), flush %.2f s" % (stats['changed'], stats['rows'], 100*stats['changed']/stats['rows'], flush))
+    print("%-26s %10s %14s" % ("storage", "MB", "MB per day"))
+    for name, size in [("Poller (changes, zstd)", stored), ("whole snapshots, parquet", whole['parquet']), ("whole snapshots, csv", whole['csv'])]:
+        print("%-26s %10.2f %14.0f" % (name, size/1e6, size*day/1e6))
+    print("read_realtime: one county of positions %.3f s (%d rows), one route of eta %.3f s (%d rows)" % (query_county, len(taipei), query_route, len(route)))
@@ -0,0 +1,101 @@
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import warnings
+import numpy as np
+from mock_server import MockTDX
+from nycu_tdx_py import tdx, client
+from nycu_tdx_py.routing import Router
+
+
+# routing.Router on the bus stop times of a city and the TRA general timetable of the mock server: build time, seconds per
+# origin of the connection scan, and an all-to-all travel time matrix with 1 and more worker processes, against relaxing all the
+# connections of the day with numpy until no arrival improves
+
+
+
+def relaxed_arrival(router, origin, seconds, weekday, max_duration):
+    # the former approach: every connection of the day relaxed at once, repeated until the arrivals stop improving; a trip is
+    # ridden on from the first of its connections boarded, and another vehicle is boarded 'min_transfer' after a ride
+    keep=np.nonzero(((router.mask.astype(np.int64)>>weekday)&1)==1)[0]
+    keep=keep[np.lexsort((router.dep_time[keep], router.trip[keep]))]
+    dep_stop, arr_stop, dep_time, arr_time, trip=router.dep_stop[keep], router.arr_stop[keep], router.dep_time[keep], router.arr_time[keep].astype(float), router.trip[keep]
+    start=np.concatenate([[True], trip[1:]!=trip[:-1]])
+    group=np.cumsum(start)-1
+    source=np.repeat(np.arange(len(router.stop_ids)), np.diff(router.foot_offsets))
+    seeded=np.full(len(router.stop_ids), np.inf)
+    for stop, walk in origin:
+        seeded[stop]=min(seeded[stop], seconds+walk)
+    riding=np.full(len(router.stop_ids), np.inf)
+    arrival, ready=seeded, seeded
+    while True:
+        boarded=np.cumsum(ready[dep_stop]<=dep_time)
+        ridden=boarded-(boarded-(ready[dep_stop]<=dep_time))[start][group]>0
+        ride=np.full(len(router.stop_ids), np.inf)
+        np.minimum.at(ride, arr_stop[ridden], arr_time[ridden])
+        walked=np.full(len(router.stop_ids), np.inf)
+        np.minimum.at(walked, router.foot_stop, ride[source]+router.foot_time)
+        if (ride==riding).all():
+            break
+        riding=ride
+        arrival=np.minimum(np.minimum(seeded, ride), walked)
+        ready=np.minimum(np.minimum(seeded, ride+router.min_transfer), walked)
+    arrival=arrival-seconds
+    arrival[arrival>max_duration]=np.nan
+    return(arrival)
+
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--routes", type=int, default=300)
+    parser.add_argument("--trips", type=int, default=60)
+    parser.add_argument("--stops", type=int, default=30)
+    parser.add_argument("--stations", type=int, default=240)
+    parser.add_argument("--trains", type=int, default=1000)
+    parser.add_argument("--origins", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=2)
+    args=parser.parse_args()
+    warnings.simplefilter("ignore")
+    random.seed(0)
+    np.random.seed(0)
+    with MockTDX(routes=args.routes, trips=args.trips, stops=args.stops, stations=args.stations, trains=args.trains) as mock:
+        client.configure(base_url=mock.base_url, rate=None)
+        bus=tdx.Bus_Schedule("mock-token", "Taipei", stoptimes=True)
+        bus_stops=tdx.Bus_StopOfRoute("mock-token", "Taipei")
+        tra=tdx.Rail_TimeTable("mock-token", "TRA", "general")
+        tra_station=tdx.Rail_Station("mock-token", "TRA")
+
+    start=time.perf_counter()
+    router=Router.from_frames({'Taipei':bus, 'TRA':tra}, {'Taipei':bus_stops, 'TRA':tra_station})
+    build=time.perf_counter()-start
+    print("build %.2f s: %d stops, %d connections, %d trips, %d walks" % (build, len(router.stop_ids), len(router), router.trips, len(router.foot_stop)))
+
+    origins=list(np.random.choice(router.stop_ids, args.origins, replace=False))
+    router.travel_times(origins[:1], "07:30", "Monday")
+    start=time.perf_counter()
+    matrix=router.travel_times(origins, "07:30", "Monday")
+    single=time.perf_counter()-start
+    print("scan: %.1f ms per origin, %.1f%% of the pairs reached within 2 hours" % (single/len(origins)*1e3, matrix.notna().to_numpy().mean()*100))
+    print("all-to-all: %d x %d matrix in %.0f s with 1 process (extrapolated)" % (len(router.stop_ids), len(router.stop_ids), single/len(origins)*len(router.stop_ids)))
+
+    path=tempfile.mkdtemp()
+    router.save(path)
+    loaded=Router.load(path)
+    start=time.perf_counter()
+    pooled=loaded.travel_times(origins, "07:30", "Monday", max_workers=args.workers)
+    workers=time.perf_counter()-start
+    shutil.rmtree(path)
+    assert np.array_equal(matrix.fillna(-1).to_numpy(), pooled.fillna(-1).to_numpy())
+    print("%d workers: %.1f ms per origin, %d cpus available" % (args.workers, workers/len(origins)*1e3, os.cpu_count()))
+
+    seconds=7*3600+1800
+    count=min(20, len(origins))
+    start=time.perf_counter()
+    for i in range(count):
+        expected=relaxed_arrival(router, router._seeds([origins[i]])[0][0], seconds, 0, 7200)
+        assert np.array_equal(np.nan_to_num(expected, nan=-1), matrix.iloc[i].fillna(-1).to_numpy())
+    print("relaxation: %.1f ms per origin" % ((time.perf_counter()-start)/count*1e3))
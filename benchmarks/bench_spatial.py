@@ -0,0 +1,52 @@
+import time
+import numpy as np
+import geopandas as gpd
+import synthetic
+from nycu_tdx_py import tdx, client
+from nycu_tdx_py.spatial import StopIndex
+
+
+class StubClient:
+    # serves one prepared payload to every request
+    def __init__(self, payload):
+        self.payload=payload
+
+    def get_json(self, url, access_token):
+        return(self.payload)
+
+    def iter_json(self, url, access_token, key=None):
+        return(iter(self.payload))
+
+
+
+def timed(func, *args, **kwargs):
+    start=time.perf_counter()
+    result=func(*args, **kwargs)
+    return(time.perf_counter()-start, result)
+
+
+
+if __name__=="__main__":
+    client.set_client(StubClient(synthetic.bus_stopofroute(routes=1000, subroutes=2, stops=60)))
+    stops=tdx.Bus_StopOfRoute(None, "Taipei", dtype="sf")
+    index=StopIndex.from_frame(stops)
+    print("stops %d, build %.2fs" % (len(index), timed(lambda: index.tree)[0]))
+
+    rng=np.random.default_rng(0)
+    num=20000
+    lon, lat=121.5+rng.random(num)/10, 25.0+rng.random(num)/10
+    queries=gpd.GeoDataFrame(geometry=gpd.points_from_xy(lon, lat), crs="EPSG:4326").to_crs(3826)
+    target=stops.drop_duplicates(subset="StopUID").to_crs(3826)[['StopUID','geometry']]
+
+    t_sjoin, joined=timed(gpd.sjoin_nearest, queries, target, distance_col="distance")
+    t_single, result=timed(lambda: [gpd.sjoin_nearest(queries.iloc[[i]], target) for i in range(100)])
+    t_nearest, (position, distance)=timed(index.nearest, lon, lat, k=1)
+    t_knn, result=timed(index.nearest, lon, lat, k=5)
+    t_within, result=timed(index.within, lon, lat, 200)
+    print("%d queries" % num)
+    print("  sjoin_nearest per query    %8.2fs (extrapolated from 100)" % (t_single/100*num))
+    print("  sjoin_nearest batched      %8.2fs" % t_sjoin)
+    print("  StopIndex.nearest k=1      %8.2fs" % t_nearest)
+    print("  StopIndex.nearest k=5      %8.2fs" % t_knn)
+    print("  StopIndex.within 200 m     %8.2fs (%d pairs)" % (t_within, len(result[0])))
+    print("  same distances as sjoin_nearest: %s" % np.allclose(np.sort(distance[:,0]), np.sort(joined.groupby(level=0).distance.first().to_numpy()), atol=1e-3))
@@ -0,0 +1,51 @@
+import json
+import time
+import tracemalloc
+import synthetic
+from nycu_tdx_py import tdx
+from nycu_tdx_py.client import STREAM_CHUNK_SIZE
+from nycu_tdx_py.flatten import flatten
+from nycu_tdx_py.stream import iter_records
+
+
+# the response body arrives in chunks as from requests' iter_content(), the whole body is never joined
+
+def chunks(body):
+    for i in range(0, len(body), STREAM_CHUNK_SIZE):
+        yield(body[i:i+STREAM_CHUNK_SIZE])
+
+
+
+def loaded(body, spec, key):
+    js_data=json.loads(b"".join(chunks(body)).decode("utf-8"))
+    return(flatten(js_data[key] if key is not None else js_data, spec))
+
+
+
+def streamed(body, spec, key):
+    return(flatten(iter_records(chunks(body), key), spec))
+
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    start=time.perf_counter()
+    result=func(*args)
+    seconds=time.perf_counter()-start
+    peak=tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return(seconds, peak, result)
+
+
+
+if __name__=="__main__":
+    cases=[('Bus_StopOfRoute', synthetic.bus_stopofroute(routes=1500, subroutes=2, stops=60), tdx.BUS_STOPOFROUTE_SPEC, None),
+           ('Rail_TimeTable TRA general', synthetic.tra_generaltimetable(trains=1000, stops=60), tdx.TRA_GENERALTIMETABLE_SPEC, 'TrainTimetables')]
+    print("%-28s %8s %10s %10s %11s %11s %12s" % ("payload", "body(MB)", "loads(s)", "stream(s)", "loads(MB)", "stream(MB)", "result(MB)"))
+    for name, payload, spec, key in cases:
+        body=json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        del payload
+        t_loads, m_loads, result=measure(loaded, body, spec, key)
+        t_stream, m_stream, result=measure(streamed, body, spec, key)
+        print("%-28s %8.1f %10.3f %10.3f %11.1f %11.1f %12.1f" % (name, len(body)/1e6, t_loads, t_stream, m_loads/1e6, m_stream/1e6,
+                                                                  result.memory_usage(deep=True).sum()/1e6))
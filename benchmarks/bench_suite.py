@@ -0,0 +1,130 @@
+import argparse
+import os
+import tempfile
+import time
+import warnings
+import pandas as pd
+from mock_server import MockTDX, SIZES
+from nycu_tdx_py import tdx, client
+from nycu_tdx_py.client import TDXClient
+from nycu_tdx_py.export import write_out
+
+
+# every fetcher end to end against the mock server, split into download, decode, parse and export
+
+CASES=[('Bus_Route', ('Taipei',), {}),
+       ('Bus_Shape', ('Taipei', 'sf'), {}),
+       ('Bus_StopOfRoute', ('Taipei',), {}),
+       ('Bus_Schedule', ('Taipei',), {}),
+       ('Bus_Schedule', ('Taipei',), {'stoptimes':True}),
+       ('Rail_Station', ('TRA', 'sf'), {}),
+       ('Rail_StationOfLine', ('TRTC',), {}),
+       ('Rail_TimeTable', ('TRA', 'station'), {}),
+       ('Rail_TimeTable', ('TRA', 'general'), {}),
+       ('Rail_TimeTable', ('THSR', 'general'), {}),
+       ('Bike_Shape', ('Taipei', 'sf'), {}),
+       ('Bike_Station', ('Taipei', 'sf'), {}),
+       # one route at a time, so that the stages of the requests add up to the time of the fetcher
+       ('Bus_TravelTime', ('Taipei',), {'routeid':['TPE%d' % i for i in range(20)], 'max_workers':1}),
+       ('Bus_RouteFare', ('Taipei',), {}),
+       ('Rail_Shape', ('TRA', 'sf'), {})]
+
+# sizes growing with the scale, the others (stops per route, trips per route...) stay fixed
+SCALED=['routes', 'stations', 'trains', 'lines']
+
+
+
+class StageClient(TDXClient):
+    # times the requests and the decoding of TDXClient as the fetchers run them: a whole body is downloaded by get() and
+    # decoded by _decode(), a streamed one is downloaded while iter_json() decodes it, so its time counts as decode
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.reset()
+
+    def reset(self):
+        self.stages={'download':0.0, 'decode':0.0, 'bytes':0}
+
+    def get(self, url, access_token=None, **kwargs):
+        start=time.perf_counter()
+        response=super().get(url, access_token, **kwargs)
+        if not kwargs.get('stream'):
+            response.content
+        self.stages['download']+=time.perf_counter()-start
+        self.stages['bytes']+=int(response.headers.get('Content-Length', 0))
+        return(response)
+
+    def _decode(self, response):
+        start=time.perf_counter()
+        data=super()._decode(response)
+        self.stages['decode']+=time.perf_counter()-start
+        return(data)
+
+    def iter_json(self, url, access_token, key=None):
+        records=super().iter_json(url, access_token, key)
+        while True:
+            start=time.perf_counter()
+            downloaded=self.stages['download']
+            try:
+                record=next(records)
+            except StopIteration:
+                return
+            finally:
+                # the request sent by the first next() is already counted by get()
+                self.stages['decode']+=time.perf_counter()-start-(self.stages['download']-downloaded)
+            yield record
+
+
+
+def label(name, args, kwargs):
+    # e.g. 'Bus_Schedule(stoptimes) Taipei' or 'Bus_TravelTime(20 routes) Taipei'
+    extra=["%d routes" % len(value) if isinstance(value, list) else key for key, value in kwargs.items() if isinstance(value, list) or value is True]
+    return(name+("("+", ".join(extra)+")" if len(extra)!=0 else "")+" "+" ".join(args))
+
+
+
+def run(scale, folder):
+    results=[]
+    sizes=dict(SIZES, **{i:SIZES[i]*scale for i in SCALED})
+    with MockTDX(**sizes) as mock:
+        stage_client=client.set_client(StageClient(base_url=mock.base_url, rate=None))
+        for name, args, kwargs in CASES:
+            fetcher=getattr(tdx, name)
+            fetcher("mock-token", *args, **kwargs)
+            stage_client.reset()
+            start=time.perf_counter()
+            data=fetcher("mock-token", *args, **kwargs)
+            total=time.perf_counter()-start
+            # Bus_RouteFare returns a data frame for each type of fare
+            frames=data if isinstance(data, dict) else {name:data}
+            start=time.perf_counter()
+            for key, frame in frames.items():
+                if len(frame)!=0:
+                    write_out(frame, os.path.join(folder, key+".parquet"))
+            export=time.perf_counter()-start
+            stages=stage_client.stages
+            results.append({'fetcher':label(name, args, kwargs), 'scale':scale, 'rows':sum([len(i) for i in frames.values()]),
+                            'MB':stages['bytes']/1e6, 'download':stages['download'], 'decode':stages['decode'],
+                            'parse':total-stages['download']-stages['decode'], 'export':export})
+    return(results)
+
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--out", default=None, help="CSV file collecting the results, to compare runs for regressions")
+    args=parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    folder=tempfile.mkdtemp()
+    results=pd.DataFrame([i for scale in args.scales for i in run(scale, folder)])
+    results['parse_us_per_row']=results.parse/results.rows*1e6
+    pd.set_option("display.width", 200)
+    print(results.to_string(index=False, float_format=lambda x: "%.3f" % x))
+
+    # parsing scales linearly when the time per row stays flat from the smallest to the largest scale
+    per_row=results.pivot_table(index='fetcher', columns='scale', values='parse_us_per_row', sort=False)
+    print("\nparse time per row, largest / smallest scale")
+    print((per_row[max(args.scales)]/per_row[min(args.scales)]).round(2).to_string())
+    if args.out is not None:
+        results.to_csv(args.out, index=False)
@@ -0,0 +1,99 @@
+import time
+import numpy as np
+import pandas as pd
+from itertools import chain
+import synthetic
+from nycu_tdx_py import tdx, client
+
+
+# the Rail_TimeTable parsing used before, one traversal of the payload per column
+
+def legacy_tra_station(data_all):
+    temp=pd.DataFrame(data_all['StationTimetables'])
+    temp.StationName=[temp.StationName[i]['Zh_tw'] for i in range(len(temp))]
+    temp=pd.concat([temp, pd.DataFrame.from_records(temp.ServiceDay)], axis=1)
+    station_info=temp.drop(['Timetables','ServiceDay'], axis=1)
+    rail_timetable_temp=pd.DataFrame({'Sequence':list(chain(*[list(map(lambda x : x['Sequence'], temp.Timetables[i])) for i in range(len(temp))])),
+                                      'TrainNo':list(chain(*[list(map(lambda x : x['TrainNo'], temp.Timetables[i])) for i in range(len(temp))])),
+                                      'DestinationStationID':list(chain(*[list(map(lambda x : x['DestinationStationID'], temp.Timetables[i])) for i in range(len(temp))])),
+                                      'DestinationStationName':list(chain(*[list(map(lambda x : x['DestinationStationName']['Zh_tw'], temp.Timetables[i])) for i in range(len(temp))])),
+                                      'TrainTypeID':list(chain(*[list(map(lambda x : x['TrainTypeID'], temp.Timetables[i])) for i in range(len(temp))])),
+                                      'TrainTypeCode':list(chain(*[list(map(lambda x : x['TrainTypeCode'], temp.Timetables[i])) for i in range(len(temp))])),
+                                      'TrainTypeName':list(chain(*[list(map(lambda x : x['TrainTypeName']['Zh_tw'], temp.Timetables[i])) for i in range(len(temp))])),
+                                      'ArrivalTime':list(chain(*[list(map(lambda x : x['ArrivalTime'], temp.Timetables[i])) for i in range(len(temp))])),
+                                      'DepartureTime':list(chain(*[list(map(lambda x : x['DepartureTime'], temp.Timetables[i])) for i in range(len(temp))]))})
+    num_of_table=[len(temp.Timetables[i]) for i in range(len(temp))]
+    station_info=station_info.iloc[np.repeat(np.arange(len(station_info)), num_of_table)].reset_index(drop=True)
+    return(pd.concat([station_info, rail_timetable_temp], axis=1))
+
+
+
+def legacy_tra_general(data_all):
+    temp=pd.DataFrame(data_all['TrainTimetables'])
+    train_info=pd.DataFrame.from_records(temp.TrainInfo)
+    train_info.TrainTypeName=[train_info.TrainTypeName[i]['Zh_tw'] for i in range(len(train_info))]
+    train_info.StartingStationName=[train_info.StartingStationName[i]['Zh_tw'] for i in range(len(train_info))]
+    train_info.EndingStationName=[train_info.EndingStationName[i]['Zh_tw'] for i in range(len(train_info))]
+    train_info=pd.concat([train_info, pd.DataFrame.from_records(temp.ServiceDay)], axis=1)
+    rail_timetable_temp=pd.DataFrame({'StopSequence':list(chain(*[list(map(lambda x : x['StopSequence'], temp.StopTimes[i])) for i in range(len(temp))])),
+                                      'StationID':list(chain(*[list(map(lambda x : x['StationID'], temp.StopTimes[i])) for i in range(len(temp))])),
+                                      'StationName':list(chain(*[list(map(lambda x : x['StationName']['Zh_tw'], temp.StopTimes[i])) for i in range(len(temp))])),
+                                      'ArrivalTime':list(chain(*[list(map(lambda x : x['ArrivalTime'], temp.StopTimes[i])) for i in range(len(temp))])),
+                                      'DepartureTime':list(chain(*[list(map(lambda x : x['DepartureTime'], temp.StopTimes[i])) for i in range(len(temp))]))})
+    num_of_station=[len(temp.StopTimes[i]) for i in range(len(temp))]
+    train_info=train_info.iloc[np.repeat(np.arange(len(train_info)), num_of_station)].reset_index(drop=True)
+    return(pd.concat([train_info, rail_timetable_temp], axis=1))
+
+
+
+def legacy_thsr_general(data_all):
+    temp=pd.DataFrame.from_records(pd.DataFrame(data_all)['GeneralTimetable'])
+    train_info=pd.DataFrame.from_records(temp.GeneralTrainInfo)
+    train_info.StartingStationName=[train_info.StartingStationName[i]['Zh_tw'] for i in range(len(train_info))]
+    train_info.EndingStationName=[train_info.EndingStationName[i]['Zh_tw'] for i in range(len(train_info))]
+    train_info=pd.concat([train_info, pd.DataFrame.from_records(temp.ServiceDay)], axis=1)
+    rail_timetable_temp=pd.DataFrame({'StopSequence':list(chain(*[list(map(lambda x : x['StopSequence'], temp.StopTimes[i])) for i in range(len(temp))])),
+                                      'StationID':list(chain(*[list(map(lambda x : x['StationID'], temp.StopTimes[i])) for i in range(len(temp))])),
+                                      'StationName':list(chain(*[list(map(lambda x : x['StationName']['Zh_tw'], temp.StopTimes[i])) for i in range(len(temp))])),
+                                      'ArrivalTime':list(chain(*[[temp.StopTimes[i][j]['ArrivalTime'] if 'ArrivalTime' in temp.StopTimes[i][j].keys() else None for j in range(len(temp.StopTimes[i]))] for i in range(len(temp))])),
+                                      'DepartureTime':list(chain(*[[temp.StopTimes[i][j]['DepartureTime'] if 'DepartureTime' in temp.StopTimes[i][j].keys() else None for j in range(len(temp.StopTimes[i]))] for i in range(len(temp))]))})
+    num_of_station=[len(temp.StopTimes[i]) for i in range(len(temp))]
+    train_info=train_info.iloc[np.repeat(np.arange(len(train_info)), num_of_station)].reset_index(drop=True)
+    return(pd.concat([train_info, rail_timetable_temp], axis=1))
+
+
+
+class StubClient:
+    # serves one prepared payload to every request
+    def __init__(self, payload):
+        self.payload=payload
+
+    def get_json(self, url, access_token):
+        return(self.payload)
+
+    def iter_json(self, url, access_token, key=None):
+        return(iter(self.payload[key] if key is not None and isinstance(self.payload, dict) else self.payload))
+
+
+
+def timeit(func, *args, repeat=3):
+    best=float("inf")
+    for i in range(repeat):
+        start=time.perf_counter()
+        result=func(*args)
+        best=min(best, time.perf_counter()-start)
+    return(best, result)
+
+
+
+if __name__=="__main__":
+    cases=[('TRA station', 'TRA', 'station', synthetic.tra_stationtimetable(stations=240, trains=400), legacy_tra_station),
+           ('TRA general', 'TRA', 'general', synthetic.tra_generaltimetable(trains=1000, stops=60), legacy_tra_general),
+           ('THSR general', 'THSR', 'general', synthetic.thsr_generaltimetable(trains=150, stops=12), legacy_thsr_general)]
+    print("%-14s %9s %10s %10s %8s %12s %12s" % ("timetable", "rows", "legacy(s)", "current(s)", "speedup", "legacy(MB)", "current(MB)"))
+    for name, operator, record, payload, legacy in cases:
+        client.set_client(StubClient(payload))
+        t_legacy, old=timeit(legacy, payload)
+        t_current, new=timeit(tdx.Rail_TimeTable, None, operator, record)
+        print("%-14s %9d %10.3f %10.3f %7.1fx %12.1f %12.1f" % (name, len(new), t_legacy, t_current, t_legacy/t_current,
+                                                             old.memory_usage(deep=True).sum()/1e6, new.memory_usage(deep=True).sum()/1e6))
@@ -0,0 +1,104 @@
+import argparse
+import random
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import synthetic
+from nycu_tdx_py import tdx
+from nycu_tdx_py.flatten import flatten
+from nycu_tdx_py.traveltime import TravelTimeIndex
+
+
+# traveltime.TravelTimeIndex on the Bus_TravelTime and Bus_StopOfRoute of a national-size network: build time, size,
+# batched, single and whole-subroute lookups, against summing the run times of each group of queries with groupby-apply
+
+
+
+def legacy_travel_time(traveltime, stopofroute, queries):
+    # the cumulative run time along the stop sequence of each subroute and band holding queries, recomputed for each group
+    sequence=stopofroute[['SubRouteUID','Direction','StopID','StopUID','StopSequence']]
+    runtime=traveltime.merge(sequence.rename(columns={'StopID':'FromStopID'}), on=['SubRouteUID','Direction','FromStopID'])
+    queries=queries.merge(sequence[['SubRouteUID','Direction','StopUID','StopSequence']].rename(columns={'StopUID':'FromStopUID','StopSequence':'FromSequence'}), on=['SubRouteUID','Direction','FromStopUID'])
+    queries=queries.merge(sequence[['SubRouteUID','Direction','StopUID','StopSequence']].rename(columns={'StopUID':'ToStopUID','StopSequence':'ToSequence'}), on=['SubRouteUID','Direction','ToStopUID'])
+
+    def group_time(group):
+        subroute, direction, weekday, hour=group.name
+        band=runtime[(runtime.SubRouteUID==subroute) & (runtime.Direction==direction) & (runtime.Weekday==weekday) & (runtime.StartHour<=hour) & (runtime.EndHour>hour)]
+        cumulative=band.sort_values('StopSequence').set_index('StopSequence').RunTime.cumsum()
+        before=lambda sequence: cumulative[cumulative.index<sequence].iloc[-1] if (cumulative.index<sequence).any() else 0
+        return(pd.Series([before(j)-before(i) for i, j in zip(group.FromSequence, group.ToSequence)], index=group.index))
+
+    return(queries.groupby(['SubRouteUID','Direction','Weekday','Hour'], group_keys=False).apply(group_time, include_groups=False))
+
+
+
+def random_queries(num, routes, subroutes, stops, bands):
+    route=np.random.randint(0, routes, num)
+    subroute=np.random.randint(0, subroutes, num)
+    band=np.random.randint(0, bands, num)
+    origin=np.random.randint(0, stops-1, num)
+    destination=origin+1+(np.random.random(num)*(stops-1-origin)).astype(int)
+    return(pd.DataFrame({'SubRouteUID':['TPE%d_%d' % (i, j) for i, j in zip(route, subroute)], 'Direction':subroute%2,
+                         'FromStopUID':['TPE%d' % (i*1000+k) for i, k in zip(route, origin)], 'ToStopUID':['TPE%d' % (i*1000+k) for i, k in zip(route, destination)],
+                         'Weekday':band%7, 'Hour':band}))
+
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--routes", type=int, default=2000)
+    parser.add_argument("--stops", type=int, default=40)
+    parser.add_argument("--bands", type=int, default=14)
+    parser.add_argument("--queries", type=int, default=1000000)
+    parser.add_argument("--legacy-queries", type=int, default=20000)
+    args=parser.parse_args()
+    random.seed(0)
+    np.random.seed(0)
+    stopofroute=flatten(synthetic.bus_stopofroute(routes=args.routes, subroutes=2, stops=args.stops), tdx.BUS_STOPOFROUTE_SPEC)
+    traveltime=flatten(sum([synthetic.bus_traveltime(2, args.bands, args.stops, route=i) for i in range(args.routes)], []), tdx.BUS_TRAVELTIME_SPEC)
+    print("subroutes %d, run times %d" % (2*args.routes, len(traveltime)))
+
+    start=time.perf_counter()
+    index=TravelTimeIndex.from_frames(traveltime, stopofroute)
+    build=time.perf_counter()-start
+    size=sum([getattr(index, name).nbytes for name in ['offsets','stops','band_of','band_start','cumulative','missing']])
+    print("build %.2f s, %.1f MB of arrays (Bus_TravelTime takes %.1f MB)" % (build, size/1e6, traveltime.memory_usage(deep=True).sum()/1e6))
+
+    queries=random_queries(args.queries, args.routes, 2, args.stops, args.bands)
+    start=time.perf_counter()
+    index.lookup(queries)
+    first=time.perf_counter()-start
+    start=time.perf_counter()
+    seconds=index.lookup(queries)
+    batched=time.perf_counter()-start
+    print("batched: %d queries in %.2f s, %.0f queries/s (%.2f s with the hash tables built on first use)" % (len(queries), batched, len(queries)/batched, first))
+
+    single=queries.iloc[:10000]
+    rows=list(zip(single.SubRouteUID, single.Direction, single.FromStopUID, single.ToStopUID, single.Weekday, single.Hour))
+    start=time.perf_counter()
+    for row in rows:
+        index.travel_time(*row)
+    print("single: %.1f us per travel_time() call" % ((time.perf_counter()-start)/len(rows)*1e6))
+
+    subroutes=min(1000, args.routes)
+    start=time.perf_counter()
+    for i in range(subroutes):
+        index.matrix("TPE%d_0" % i, 0, 0, 0)
+    print("matrix: %.2f ms per subroute of %d stops" % ((time.perf_counter()-start)/subroutes*1e3, args.stops))
+
+    path=tempfile.mkdtemp()
+    index.save(path)
+    start=time.perf_counter()
+    loaded=TravelTimeIndex.load(path)
+    loaded.lookup(queries.iloc[:1])
+    print("load: %.2f s memory-mapped, first lookup included" % (time.perf_counter()-start))
+    shutil.rmtree(path)
+
+    legacy=queries.iloc[:args.legacy_queries]
+    start=time.perf_counter()
+    expected=legacy_travel_time(traveltime, stopofroute, legacy)
+    seconds_legacy=time.perf_counter()-start
+    assert np.allclose(expected.sort_index().to_numpy(), seconds.iloc[:len(legacy)].to_numpy())
+    print("groupby-apply: %d queries in %.2f s, %.0f queries/s" % (len(legacy), seconds_legacy, len(legacy)/seconds_legacy))
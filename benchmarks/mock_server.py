@@ -0,0 +1,211 @@
+import argparse
+import json
+import re
+import threading
+import time
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+import synthetic
+
+
+# a local stand-in for tdx.transportdata.tw serving synthetic payloads, used through
+# client.configure(base_url=...) or the environment variable TDX_BASE_URL
+
+SIZES={'routes':200, 'subroutes':2, 'stops':30, 'trips':20, 'points':200, 'lines':20, 'stations':120, 'trains':100, 'buses':300, 'sections':300, 'vds':300, 'minutes':60}
+
+# path of every endpoint used by tdx.py -> payload for the sizes, and the key wrapping the records if any
+ENDPOINTS=[(r"/api/basic/v2/Bus/Route/", lambda s: synthetic.bus_route(s['routes'], s['subroutes']), None),
+           (r"/api/basic/v2/Bus/Shape/", lambda s: synthetic.bus_shape(s['routes'], s['subroutes'], s['points']), None),
+           (r"/api/basic/v2/Bus/StopOfRoute/", lambda s: synthetic.bus_stopofroute(s['routes'], s['subroutes'], s['stops']), None),
+           (r"/api/basic/v2/Bus/S2STravelTime/", lambda s: synthetic.bus_traveltime(s['subroutes'], 14, s['stops']), None),
+           (r"/api/basic/v2/Bus/Schedule/", lambda s: synthetic.bus_schedule(s['routes'], s['subroutes'], s['trips'], s['stops']), None),
+           (r"/api/basic/v2/Bus/RouteFare/", lambda s: synthetic.bus_routefare(s['routes'], (0, 1, 2), s['stops']//2), None),
+           (r"/api/basic/v2/Cycling/Shape/", lambda s: synthetic.bike_shape(s['routes'], 4, s['points']//5), None),
+           (r"/api/basic/v2/Bike/Station/", lambda s: synthetic.bike_station(s['stations']*5), None),
+           (r"/api/basic/v2/Rail/(TRA|THSR|Metro)/Shape", lambda s: synthetic.rail_shape(s['lines'], s['points']), None),
+           (r"/api/basic/v2/Rail/(TRA|THSR|Metro)/Station(/|\?|$)", lambda s: synthetic.rail_station(s['stations']), None),
+           (r"/api/basic/v3/Rail/AFR/Station(\?|$)", lambda s: {'UpdateTime':'2024-01-01T00:00:00+08:00', 'Stations':synthetic.rail_station(s['stations'])}, 'Stations'),
+           (r"/api/basic/v2/Rail/TRA/StationOfLine", lambda s: synthetic.rail_stationofline(s['lines'], s['stations']//s['lines']+1, plain_name=True), None),
+           (r"/api/basic/v2/Rail/Metro/StationOfLine/", lambda s: synthetic.rail_stationofline(s['lines'], s['stations']//s['lines']+1), None),
+           (r"/api/basic/v3/Rail/AFR/StationOfLine", lambda s: {'UpdateTime':'2024-01-01T00:00:00+08:00', 'StationOfLines':synthetic.rail_stationofline(s['lines'], s['stations']//s['lines']+1)}, 'StationOfLines'),
+           (r"/api/basic/v2/Rail/TRA/Line", lambda s: synthetic.rail_line(s['lines'], plain_name=True), None),
+           (r"/api/basic/v2/Rail/Metro/Line/", lambda s: synthetic.rail_line(s['lines']), None),
+           (r"/api/basic/v3/Rail/AFR/Line", lambda s: {'UpdateTime':'2024-01-01T00:00:00+08:00', 'Lines':synthetic.rail_line(s['lines'])}, 'Lines'),
+           (r"/api/basic/v2/Rail/Metro/StationTimeTable/", lambda s: synthetic.metro_stationtimetable(s['stations']//2, s['trains']), None),
+           (r"/api/basic/v3/Rail/TRA/GeneralStationTimetable", lambda s: synthetic.tra_stationtimetable(s['stations'], s['trains']), 'StationTimetables'),
+           (r"/api/basic/v3/Rail/(TRA|AFR)/GeneralTrainTimetable", lambda s: synthetic.tra_generaltimetable(s['trains']*5, s['stops']), 'TrainTimetables'),
+           (r"/api/basic/v2/Rail/THSR/GeneralTimetable", lambda s: synthetic.thsr_generaltimetable(s['trains']//2, 12), None)]
+
+# real-time endpoints, whose payload is that of the current 'tick' (20 seconds of buses on the road), advanced by the caller;
+# they answer 304 to a conditional request of the same tick like TDX does, and every county has its own buses
+REALTIME=[(r"/api/basic/v2/Bus/RealTimeByFrequency/", lambda s, t, c: synthetic.bus_realtime_position(s['buses'], t, s['routes'], s['subroutes'], c)),
+          (r"/api/basic/v2/Bus/RealTimeNearStop/", lambda s, t, c: synthetic.bus_realtime_nearstop(s['buses'], t, s['routes'], s['subroutes'], s['stops'], c)),
+          (r"/api/basic/v2/Bus/EstimatedTimeOfArrival/", lambda s, t, c: synthetic.bus_realtime_eta(s['routes'], s['subroutes'], s['stops'], t, c))]
+
+# road traffic of each authority ('Freeway' or 'Highway', the last part of the path), live or historical: the history
+# of a day ('Dates=') holds 'minutes' snapshots
+ROAD=[(r"/Road/Traffic/SectionShape/", lambda s, a, m: synthetic.road_shape(s['sections'], a)),
+      (r"/Road/Traffic/Section/", lambda s, a, m: synthetic.road_section(s['sections'], a)),
+      (r"/Road/Traffic/VD/", lambda s, a, m: synthetic.road_vd(s['vds'], a)),
+      (r"/Road/Traffic/Live/VD/", lambda s, a, m: synthetic.road_vd_live(s['vds'], a, m)),
+      (r"/Road/Traffic/Live/ETag/", lambda s, a, m: synthetic.road_etag_live(s['sections'], m)),
+      (r"/Road/Traffic/Live/(Freeway|Highway)", lambda s, a, m: synthetic.road_live(s['sections'], a, m))]
+
+TOKEN_PATH="/auth/realms/TDXConnect/protocol/openid-connect/token"
+
+
+
+class Server(ThreadingHTTPServer):
+    # hundreds of clients may connect at once, e.g. the async fetchers
+    request_queue_size=1024
+    daemon_threads=True
+
+
+
+def _odata(records, query):
+    # the OData options used by tdx.py: $filter on UpdateTime, then $skip and $top
+    if '$filter' in query:
+        match=re.match(r"\s*UpdateTime\s+gt\s+(\S+)", query['$filter'][0])
+        if match is not None:
+            records=[i for i in records if i.get('UpdateTime', '')>match.group(1)]
+    skip=int(query['$skip'][0]) if '$skip' in query else 0
+    top=int(query['$top'][0]) if '$top' in query else len(records)
+    return(records[skip:skip+top])
+
+
+
+class MockTDX:
+    def __init__(self, port=0, **sizes):
+        self.sizes=dict(SIZES, **sizes)
+        self.bodies=dict()
+        self.lock=threading.Lock()
+        self.requests=0
+        self.tick=0
+        self.failures=[]
+        # seconds each response is held back, and the most requests seen in flight at once
+        self.delay=0
+        self.in_flight=0
+        self.peak=0
+        self.server=Server(("127.0.0.1", port), self._handler())
+        self.thread=None
+
+    @property
+    def base_url(self):
+        return("http://127.0.0.1:"+str(self.server.server_port))
+
+    def body(self, pattern, build):
+        # every payload is generated once and only its encoded body is kept
+        with self.lock:
+            if pattern not in self.bodies:
+                self.bodies[pattern]=json.dumps(build(self.sizes), ensure_ascii=False).encode("utf-8")
+            return(self.bodies[pattern])
+
+    def fail(self, count, status=429, retry_after=None):
+        # the next 'count' requests are answered with 'status', e.g. 429 Too Many Requests with a Retry-After of seconds
+        with self.lock:
+            self.failures.extend([(status, retry_after)]*count)
+
+    def respond(self, path, query, headers=None):
+        with self.lock:
+            failure=self.failures.pop(0) if len(self.failures)!=0 else None
+        if failure is not None:
+            status, retry_after=failure
+            return(status, json.dumps({'Message':'Mock failure'}).encode("utf-8"), {'Retry-After':str(retry_after)} if retry_after is not None else {})
+        if path==TOKEN_PATH:
+            return(200, json.dumps({'access_token':'mock-token', 'expires_in':86400, 'token_type':'Bearer'}).encode("utf-8"))
+        for pattern, build in ROAD:
+            if re.search(pattern, path) is not None:
+                authority=path.rstrip("/").split("/")[-1]
+                minutes=self.sizes['minutes'] if 'Dates' in query else 1
+                return(200, self.body((pattern, authority, minutes), lambda s: build(s, authority, minutes)))
+        for pattern, build in REALTIME:
+            if re.search(pattern, path) is not None:
+                tick=self.tick
+                modified=formatdate(1704067200+tick*20, usegmt=True)
+                if headers is not None and headers.get('If-Modified-Since')==modified:
+                    return(304, b"", {'Last-Modified':modified})
+                # only the bodies of the current tick are kept
+                with self.lock:
+                    for key in [key for key in self.bodies if isinstance(key, tuple) and key[0]==pattern and key[1]!=tick]:
+                        del self.bodies[key]
+                county=path.rstrip("/").split("/")[-1]
+                return(200, self.body((pattern, tick, county), lambda s: build(s, tick, county)), {'Last-Modified':modified})
+        for pattern, build, key in ENDPOINTS:
+            if re.search(pattern, path) is not None:
+                body=self.body(pattern, build)
+                if not any([i in query for i in ['$filter', '$skip', '$top']]):
+                    return(200, body)
+                payload=json.loads(body)
+                if key is None:
+                    return(200, json.dumps(_odata(payload, query), ensure_ascii=False).encode("utf-8"))
+                return(200, json.dumps(dict(payload, **{key:_odata(payload[key], query)}), ensure_ascii=False).encode("utf-8"))
+        return(404, json.dumps({'Message':'No such endpoint: '+path}).encode("utf-8"))
+
+    def _handler(self):
+        mock=self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version="HTTP/1.1"
+
+            def _send(self):
+                parts=urlsplit(self.path)
+                with mock.lock:
+                    mock.in_flight+=1
+                    mock.peak=max(mock.peak, mock.in_flight)
+                try:
+                    if mock.delay:
+                        time.sleep(mock.delay)
+                    status, body, *headers=mock.respond(parts.path, parse_qs(parts.query), self.headers)
+                finally:
+                    with mock.lock:
+                        mock.in_flight-=1
+                with mock.lock:
+                    mock.requests+=1
+                self.send_response(status)
+                for key, value in (headers[0] if len(headers)!=0 else {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._send()
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self._send()
+
+            def log_message(self, *args):
+                pass
+
+        return(Handler)
+
+    def start(self):
+        self.thread=threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return(self.base_url)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return(self)
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description="Serve synthetic TDX payloads, then set TDX_BASE_URL to the printed address.")
+    parser.add_argument("--port", type=int, default=8080)
+    for size, default in SIZES.items():
+        parser.add_argument("--"+size, type=int, default=default)
+    args=vars(parser.parse_args())
+    mock=MockTDX(**args)
+    print("Serving TDX at "+mock.base_url)
+    mock.server.serve_forever()
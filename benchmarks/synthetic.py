@@ -0,0 +1,300 @@
+import random
+
+
+# TDX-shaped payloads of configurable size for the benchmarks
+
+def _name(text):
+    return({'Zh_tw':text, 'En':text})
+
+
+
+def _time(minute):
+    minute=minute%1440
+    return("%02d:%02d" % (minute//60, minute%60))
+
+
+
+def bus_route(routes=500, subroutes=2):
+    return([{'RouteUID':'TPE'+str(i), 'RouteID':str(i), 'RouteName':_name('路線'+str(i)), 'BusRouteType':11,
+             'DepartureStopNameZh':'起站'+str(i), 'DestinationStopNameZh':'迄站'+str(i),
+             'SubRoutes':[{'SubRouteUID':'TPE'+str(i)+'_'+str(j), 'SubRouteID':str(i)+'_'+str(j), 'SubRouteName':_name('路線'+str(i)),
+                           'Direction':j%2, 'OperatorIDs':['100', '200'], 'FirstBusTime':'0530', 'LastBusTime':'2300'} for j in range(subroutes)],
+             'UpdateTime':'2024-01-01T00:00:00+08:00'} for i in range(routes)])
+
+
+
+def bus_stopofroute(routes=500, subroutes=2, stops=40):
+    return([{'RouteUID':'TPE'+str(i), 'RouteID':str(i), 'RouteName':_name('路線'+str(i)),
+             'SubRouteUID':'TPE'+str(i)+'_'+str(j), 'SubRouteID':str(i)+'_'+str(j), 'SubRouteName':_name('路線'+str(i)), 'Direction':j%2,
+             'Stops':[{'StopUID':'TPE'+str(i*1000+k), 'StopID':str(i*1000+k), 'StopName':_name('站牌'+str(k)), 'StopBoarding':0,
+                       'StopSequence':k+1, 'StopPosition':{'PositionLon':121.5+random.random()/10, 'PositionLat':25.0+random.random()/10, 'GeoHash':'wsqqq'},
+                       'StationID':str(i*1000+k), 'LocationCityCode':'TPE'} for k in range(stops)],
+             'UpdateTime':'2024-01-01T00:00:00+08:00'} for i in range(routes) for j in range(subroutes)])
+
+
+
+def bus_traveltime(subroutes=2, bands=14, stops=40, route=1):
+    # the stops of 'route' in bus_stopofroute()
+    return([{'RouteUID':'TPE'+str(route), 'RouteID':str(route), 'SubRouteUID':'TPE'+str(route)+'_'+str(j), 'SubRouteID':str(route)+'_'+str(j), 'Direction':j%2,
+             'TravelTimes':[{'Weekday':b%7, 'StartHour':b, 'EndHour':b+1,
+                             'S2STimes':[{'FromStopID':str(route*1000+k), 'ToStopID':str(route*1000+k+1), 'FromStationID':str(route*1000+k), 'ToStationID':str(route*1000+k+1),
+                                          'RunTime':random.randint(30, 300)} for k in range(stops-1)]} for b in range(bands)]} for j in range(subroutes)])
+
+
+
+def bus_shape(routes=500, subroutes=2, points=200):
+    def geometry(i, j):
+        x, y=121.0+random.random(), 24.0+random.random()
+        return("LINESTRING ("+", ".join(["%.6f %.6f" % (x+k*1e-4, y+(-1)**j*k*1e-4) for k in range(points)])+")")
+    return([{'RouteUID':'TPE'+str(i), 'RouteID':str(i), 'RouteName':_name('路線'+str(i)),
+             'SubRouteUID':'TPE'+str(i)+'_'+str(j), 'SubRouteID':str(i)+'_'+str(j), 'SubRouteName':_name('路線'+str(i)), 'Direction':j%2,
+             'Geometry':geometry(i, j), 'UpdateTime':'2024-01-01T00:00:00+08:00'} for i in range(routes) for j in range(subroutes)])
+
+
+
+def bike_shape(routes=10000, parts=4, points=40, single=0.05):
+    # every part has a share 'single' of being a degenerate single coordinate, as found in the TDX cycling network
+    def part():
+        x, y=120.0+random.random()*2, 22.0+random.random()*3
+        num=1 if random.random()<single else random.randint(2, points)
+        return("("+",".join(["%.6f %.6f" % (x+k*1e-4, y+k*1e-4) for k in range(num)])+")")
+    return([{'RouteName':'自行車道'+str(i), 'City':'Taipei', 'RoadSectionStart':'起點', 'RoadSectionEnd':'終點', 'CyclingLength':random.random()*5000, 'Direction':'雙向',
+             'Geometry':"MULTILINESTRING ("+",".join([part() for j in range(random.randint(1, parts))])+")", 'UpdateTime':'2024-01-01T00:00:00+08:00'} for i in range(routes)])
+
+
+
+def rail_stationofline(lines=20, stations=30, plain_name=False):
+    # TRA gives the station name as plain text
+    name=(lambda text: text) if plain_name else _name
+    return([{'LineID':'L'+str(i), 'LineNo':'L'+str(i),
+             'Stations':[{'Sequence':k+1, 'StationID':str(i*100+k), 'StationName':name('車站'+str(k)), 'CumulativeDistance':k*1.5} for k in range(stations)]} for i in range(lines)])
+
+
+
+def rail_line(lines=20, plain_name=False):
+    if plain_name:
+        return([{'LineID':'L'+str(i), 'LineNameZh':'路線'+str(i), 'LineSectionNameZh':'區段'+str(i)} for i in range(lines)])
+    return([{'LineID':'L'+str(i), 'LineName':_name('路線'+str(i)), 'LineSectionName':_name('區段'+str(i))} for i in range(lines)])
+
+
+
+def rail_shape(lines=20, points=500):
+    return([{'LineID':'L'+str(i), 'LineName':_name('路線'+str(i)),
+             'Geometry':"LINESTRING ("+", ".join(["%.6f %.6f" % (120.2+k*1e-3, 22.6+i*1e-2+k*1e-3) for k in range(points)])+")",
+             'UpdateTime':'2024-01-01T00:00:00+08:00'} for i in range(lines)])
+
+
+
+def rail_station(stations=240):
+    return([{'StationUID':'TRA-'+str(i), 'StationID':str(i), 'StationName':_name('車站'+str(i)), 'StationAddress':'地址'+str(i), 'StationPhone':'02-0000000',
+             'LocationCity':'臺北市', 'LocationTown':'中正區', 'StationClass':str(i%4),
+             'StationPosition':{'PositionLon':120.2+random.random()*1.8, 'PositionLat':22.0+random.random()*3.2, 'GeoHash':'wsqqq'},
+             'UpdateTime':'2024-01-01T00:00:00+08:00'} for i in range(stations)])
+
+
+
+def bike_station(stations=1500):
+    return([{'StationUID':'TPE'+str(i), 'StationID':str(i), 'StationName':_name('YouBike2.0_站'+str(i)), 'StationAddress':_name('地址'+str(i)),
+             'StationPosition':{'PositionLon':121.5+random.random()/10, 'PositionLat':25.0+random.random()/10, 'GeoHash':'wsqqq'},
+             'BikesCapacity':random.randint(10, 60), 'ServiceType':2, 'UpdateTime':'2024-01-01T00:00:00+08:00'} for i in range(stations)])
+
+
+
+def tra_stationtimetable(stations=240, trains=200):
+    return({'UpdateTime':'2024-01-01T00:00:00+08:00',
+            'StationTimetables':[{'StationID':str(i), 'StationName':_name('車站'+str(i)), 'Direction':d,
+                                  'ServiceDay':{'Monday':1, 'Tuesday':1, 'Wednesday':1, 'Thursday':1, 'Friday':1, 'Saturday':1, 'Sunday':1},
+                                  'Timetables':[{'Sequence':k+1, 'TrainNo':str(k), 'DestinationStationID':'1000', 'DestinationStationName':_name('臺北'),
+                                                 'TrainTypeID':str(k%5), 'TrainTypeCode':str(k%5), 'TrainTypeName':_name('區間車'),
+                                                 'ArrivalTime':_time(300+k*5), 'DepartureTime':_time(301+k*5)} for k in range(trains)]} for i in range(stations) for d in range(2)]})
+
+
+
+def metro_stationtimetable(stations=100, trains=200):
+    return([{'RouteID':'BL-1', 'LineID':'BL', 'StationID':'BL'+str(i), 'StationName':_name('車站'+str(i)), 'Direction':d,
+             'DestinationStaionID':'BL23', 'DestinationStationName':_name('南港展覽館'),
+             'Timetables':[{'Sequence':k+1, 'ArrivalTime':_time(360+k*4), 'DepartureTime':_time(360+k*4), 'TrainType':1} for k in range(trains)],
+             'ServiceDay':{'Monday':True, 'Tuesday':True, 'Wednesday':True, 'Thursday':True, 'Friday':True, 'Saturday':False, 'Sunday':False},
+             'SrcUpdateTime':'2024-01-01T00:00:00+08:00', 'UpdateTime':'2024-01-01T00:00:00+08:00', 'VersionID':1} for i in range(stations) for d in range(2)])
+
+
+
+def tra_generaltimetable(trains=1000, stops=40):
+    return({'UpdateTime':'2024-01-01T00:00:00+08:00',
+            'TrainTimetables':[{'TrainInfo':{'TrainNo':str(i), 'Direction':i%2, 'TrainTypeID':str(i%5), 'TrainTypeCode':str(i%5), 'TrainTypeName':_name('區間車'),
+                                             'StartingStationID':'0', 'StartingStationName':_name('基隆'), 'EndingStationID':'1', 'EndingStationName':_name('新竹')},
+                                'ServiceDay':{'Monday':1, 'Tuesday':1, 'Wednesday':1, 'Thursday':1, 'Friday':1, 'Saturday':1, 'Sunday':1},
+                                'StopTimes':[{'StopSequence':k+1, 'StationID':str(k), 'StationName':_name('車站'+str(k)),
+                                              'ArrivalTime':_time(300+i+k*4), 'DepartureTime':_time(301+i+k*4)} for k in range(stops)]} for i in range(trains)]})
+
+
+
+def thsr_generaltimetable(trains=150, stops=12):
+    return([{'GeneralTimetable':{'GeneralTrainInfo':{'TrainNo':str(i), 'Direction':i%2, 'StartingStationID':'0990', 'StartingStationName':_name('南港'), 'EndingStationID':'1070', 'EndingStationName':_name('左營')},
+                                 'StopTimes':[dict({'StopSequence':k+1, 'StationID':str(k), 'StationName':_name('車站'+str(k))}, **({'DepartureTime':_time(360+i*5+k*15)} if k<stops-1 else {}), **({'ArrivalTime':_time(359+i*5+k*15)} if k>0 else {})) for k in range(stops)],
+                                 'ServiceDay':{'Monday':1, 'Tuesday':1, 'Wednesday':1, 'Thursday':1, 'Friday':1, 'Saturday':0, 'Sunday':0}}} for i in range(trains)])
+
+
+
+def bus_schedule(routes=300, subroutes=2, trips=60, stops=40, frequency=0.2):
+    # a share of the subroutes is operated by frequency instead of a timetable
+    service={'Sunday':1, 'Monday':1, 'Tuesday':1, 'Wednesday':1, 'Thursday':1, 'Friday':1, 'Saturday':1}
+    records=[]
+    for i in range(routes):
+        for j in range(subroutes):
+            record={'RouteUID':'TPE'+str(i), 'RouteID':str(i), 'RouteName':_name('路線'+str(i)),
+                    'SubRouteUID':'TPE'+str(i)+'_'+str(j), 'SubRouteID':str(i)+'_'+str(j), 'SubRouteName':_name('路線'+str(i)), 'Direction':j%2}
+            if frequency and (i*subroutes+j)%round(1/frequency)==0:
+                record['Frequencys']=[{'StartTime':'06:00', 'EndTime':'09:00', 'MinHeadwayMins':5, 'MaxHeadwayMins':10, 'ServiceDay':service},
+                                      {'StartTime':'09:00', 'EndTime':'22:00', 'MinHeadwayMins':10, 'MaxHeadwayMins':20, 'ServiceDay':service}]
+            else:
+                record['Timetables']=[{'TripID':str(t), 'ServiceDay':service,
+                                       'StopTimes':[{'StopSequence':k+1, 'StopUID':'TPE'+str(i*1000+k), 'StopID':str(i*1000+k), 'StopName':_name('站牌'+str(k)),
+                                                     'ArrivalTime':_time(330+t*15+k*2), 'DepartureTime':_time(330+t*15+k*2)} for k in range(stops)]} for t in range(trips)]
+            record['UpdateTime']='2024-01-01T00:00:00+08:00'
+            records.append(record)
+    return(records)
+
+
+
+def bus_routefare(routes=200, pricing=(0, 1, 2), stops=30):
+    # routes cycle through the pricing types, origin-destination fares cover every pair of stops
+    fares=[{'TicketType':1, 'FareClass':1, 'Price':30}, {'TicketType':1, 'FareClass':2, 'Price':15}]
+    stop=lambda k: {'StopID':str(k), 'StopName':'站牌'+str(k)}
+    records=[]
+    for i in range(routes):
+        fare_type=pricing[i%len(pricing)]
+        record={'RouteID':str(i), 'RouteName':'路線'+str(i), 'OperatorID':'100', 'OperatorNo':'1', 'SubRouteID':str(i)+'0', 'SubRouteName':'路線'+str(i),
+                'FarePricingType':fare_type, 'IsFreeBus':0, 'IsForAllSubRoutes':1}
+        if fare_type==0:
+            record['SectionFares']=[{'BufferZones':[{'SectionSequence':1, 'Direction':0, 'FareBufferZoneOrigin':stop(10), 'FareBufferZoneDestination':stop(12)}] if i%2==0 else [],
+                                     'Fares':fares}]
+        elif fare_type==1:
+            record['ODFares']=[{'Direction':0, 'OriginStop':stop(a), 'DestinationStop':stop(b), 'Fares':fares} for a in range(stops) for b in range(a+1, stops)]
+        else:
+            record['StageFares']=[{'Direction':0, 'OriginStage':dict(stop(a), Sequence=a), 'DestinationStage':dict(stop(a+1), Sequence=a+1), 'Fares':fares} for a in range(stops//5)]
+        records.append(record)
+    return(records)
+
+
+
+def _clock(seconds):
+    return("2024-01-01T%02d:%02d:%02d+08:00" % (seconds//3600%24, seconds//60%60, seconds%60))
+
+
+
+def _bus(i, step, routes, subroutes, city):
+    # bus i reports every 1 to 3 steps of 20 seconds, the other polls see its previous report again
+    last=step-step%(1+i%3)
+    r=i%routes
+    return({'PlateNumb':city+'-'+str(1000+i), 'OperatorID':'100', 'RouteUID':city+str(r), 'RouteID':str(r), 'RouteName':_name('路線'+str(r)),
+            'SubRouteUID':city+str(r)+'_'+str(i%subroutes), 'SubRouteID':str(r)+'_'+str(i%subroutes), 'SubRouteName':_name('路線'+str(r)),
+            'Direction':i%subroutes%2}, last, random.Random(hash((city, i, last))))
+
+
+
+def bus_realtime_position(buses=300, step=0, routes=200, subroutes=2, city="TPE"):
+    records=[]
+    for i in range(buses):
+        record, last, rng=_bus(i, step, routes, subroutes, city)
+        record.update({'BusPosition':{'PositionLon':round(121.4+rng.random()/5, 6), 'PositionLat':round(24.9+rng.random()/5, 6), 'GeoHash':'wsqqq'},
+                       'Speed':float(rng.randint(0, 60)), 'Azimuth':float(rng.randint(0, 359)), 'DutyStatus':0, 'BusStatus':0, 'MessageType':0,
+                       'GPSTime':_clock(28800+last*20), 'SrcUpdateTime':_clock(28800+step*20), 'UpdateTime':_clock(28800+step*20)})
+        records.append(record)
+    return(records)
+
+
+
+def bus_realtime_nearstop(buses=300, step=0, routes=200, subroutes=2, stops=30, city="TPE"):
+    records=[]
+    for i in range(buses):
+        record, last, rng=_bus(i, step, routes, subroutes, city)
+        k=(i+last//3)%stops
+        record.update({'StopUID':city+str(i%routes*1000+k), 'StopID':str(i%routes*1000+k), 'StopName':_name('站牌'+str(k)), 'StopSequence':k+1,
+                       'DutyStatus':0, 'BusStatus':0, 'A2EventType':last//3%2, 'MessageType':0,
+                       'GPSTime':_clock(28800+last*20), 'SrcUpdateTime':_clock(28800+step*20), 'UpdateTime':_clock(28800+step*20)})
+        records.append(record)
+    return(records)
+
+
+
+def bus_realtime_eta(routes=200, subroutes=2, stops=30, step=0, city="TPE"):
+    # the estimate of a stop is renewed every 1 to 4 steps, one stop in ten has no bus coming
+    records=[]
+    for i in range(routes):
+        for j in range(subroutes):
+            for k in range(stops):
+                r=(i*subroutes+j)*stops+k
+                last=step-step%(1+r%4)
+                coming=r%10!=0
+                records.append({'PlateNumb':city+'-'+str(1000+i) if coming else '', 'RouteUID':city+str(i), 'RouteID':str(i), 'RouteName':_name('路線'+str(i)),
+                                'SubRouteUID':city+str(i)+'_'+str(j), 'SubRouteID':str(i)+'_'+str(j), 'SubRouteName':_name('路線'+str(i)), 'Direction':j%2,
+                                'StopUID':city+str(i*1000+k), 'StopID':str(i*1000+k), 'StopName':_name('站牌'+str(k)), 'StopSequence':k+1,
+                                'EstimateTime':(k*90+r*7-last*20)%1800 if coming else None, 'StopStatus':0 if coming else 1, 'MessageType':0,
+                                'NextBusTime':_clock(28800+step*20+1800) if not coming else None, 'IsLastBus':False,
+                                'DataTime':_clock(28800+last*20), 'SrcUpdateTime':_clock(28800+step*20), 'UpdateTime':_clock(28800+step*20)})
+    return(records)
+
+
+
+def _road_class(i, authority):
+    # the Freeway Bureau publishes the freeways (0), the Highway Bureau the expressways (1) and provincial highways (3)
+    return(0 if authority=="Freeway" else (1, 3)[i%2])
+
+
+
+def road_section(sections=300, authority="Freeway"):
+    return({'UpdateTime':'2024-01-01T00:00:00+08:00', 'AuthorityCode':authority,
+            'Sections':[{'SectionID':authority[0]+"%05d" % i, 'SectionName':'交流道'+str(i)+'到交流道'+str(i+1), 'RoadID':str(i%20), 'RoadName':'路'+str(i%20),
+                         'RoadClass':_road_class(i, authority), 'RoadDirection':'NS'[i%2], 'RoadSection':{'Start':'交流道'+str(i), 'End':'交流道'+str(i+1)},
+                         'SectionLength':round(1+i%20/10, 1), 'SpeedLimit':100, 'SectionMile':{'StartKM':str(i)+'K+000', 'EndKM':str(i+1)+'K+000'}} for i in range(sections)]})
+
+
+
+def road_shape(sections=300, authority="Freeway"):
+    return({'UpdateTime':'2024-01-01T00:00:00+08:00', 'AuthorityCode':authority,
+            'SectionShapes':[{'SectionID':authority[0]+"%05d" % i,
+                              'Geometry':"LINESTRING ("+", ".join(["%.6f %.6f" % (120.2+i*1e-3+k*1e-4, 22.6+i*1e-3) for k in range(20)])+")"} for i in range(sections)]})
+
+
+
+def road_vd(vds=300, authority="Freeway"):
+    return({'UpdateTime':'2024-01-01T00:00:00+08:00', 'AuthorityCode':authority,
+            'VDs':[{'VDID':'VD-'+authority[0]+"%05d" % i, 'SubAuthorityCode':authority, 'BiDirectional':1, 'LocationType':1,
+                    'PositionLon':round(120.2+i*1e-3, 6), 'PositionLat':round(22.6+i*1e-3, 6), 'RoadID':str(i%20), 'RoadName':'路'+str(i%20),
+                    'RoadClass':_road_class(i, authority), 'RoadSection':{'Start':'交流道'+str(i), 'End':'交流道'+str(i+1)}, 'LocationMile':str(i)+'K+500',
+                    'DetectionLinks':[{'LinkID':"%06d" % (i*2+d), 'Bearing':'NS'[d], 'RoadDirection':'NS'[d], 'LaneNum':3, 'ActualLaneNum':3} for d in range(2)]} for i in range(vds)]})
+
+
+
+def _minutes(minutes):
+    # 'minutes' snapshots spread over the day
+    return([_clock(m*86400//minutes) for m in range(minutes)])
+
+
+
+def road_live(sections=300, authority="Freeway", minutes=1):
+    rng=random.Random(authority)
+    return({'UpdateTime':'2024-01-01T00:00:00+08:00', 'AuthorityCode':authority,
+            'LiveTraffics':[{'SectionID':authority[0]+"%05d" % i, 'TravelTime':rng.randint(30, 300), 'TravelSpeed':rng.randint(20, 110), 'CongestionLevelID':'1',
+                             'CongestionLevel':str(rng.randint(1, 5)), 'DataCollectTime':time} for time in _minutes(minutes) for i in range(sections)]})
+
+
+
+def road_vd_live(vds=300, authority="Freeway", minutes=1, lanes=3):
+    rng=random.Random(authority)
+    return({'UpdateTime':'2024-01-01T00:00:00+08:00', 'AuthorityCode':authority,
+            'VDLives':[{'VDID':'VD-'+authority[0]+"%05d" % i, 'Status':0,
+                        'LinkFlows':[{'LinkID':"%06d" % (i*2+d),
+                                      'Lanes':[{'LaneID':l, 'LaneType':1, 'Speed':rng.randint(40, 110), 'Occupancy':rng.randint(0, 60),
+                                                'Vehicles':[{'VehicleType':t, 'Volume':rng.randint(0, 30), 'Speed':rng.randint(40, 110)} for t in 'SLT']} for l in range(lanes)]} for d in range(2)],
+                        'DataCollectTime':time} for time in _minutes(minutes) for i in range(vds)]})
+
+
+
+def road_etag_live(pairs=300, minutes=1):
+    rng=random.Random(pairs)
+    return({'UpdateTime':'2024-01-01T00:00:00+08:00', 'AuthorityCode':'Freeway',
+            'ETagPairLives':[{'ETagPairID':"01F%04dS-01F%04dS" % (i, i+1), 'StartETagStatus':0, 'EndETagStatus':0,
+                              'Flows':[{'VehicleType':t, 'TravelTime':rng.randint(60, 600), 'StandardDeviation':0, 'SpaceMeanSpeed':rng.randint(40, 110), 'VehicleCount':rng.randint(0, 200)} for t in ['31','32','41','42','5']],
+                              'StartTime':time, 'EndTime':time, 'DataCollectTime':time} for time in _minutes(minutes) for i in range(pairs)]})
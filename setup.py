@@ -26,4 +26,9 @@ setup(
           'requests',
           'tqdm'
       ],
+    extras_require={
+          'parquet': ['pyarrow'],
+          'fast': ['orjson'],
+          'async': ['aiohttp']
+      },
 )
@@ -0,0 +1,321 @@
+import asyncio
+import functools
+import random
+from . import tdx
+from .client import TDXClient, TDXError, TDXAuthError, TDX_URL, get_client, _retry_after, _token_manager, _context_client
+from .stream import loads
+try:
+    import aiohttp
+except ImportError:
+    aiohttp=None
+
+
+# async counterparts of the fetchers for asyncio services, e.g.
+#   bus_routes=await aio.Bus_Route(access_token, "Taipei")
+#   bus_routes=await aio.gather_counties(aio.Bus_Route, access_token, ["Taipei","NewTaipei","Taoyuan"])
+# the requests are sent by one aiohttp session on the event loop, hundreds of them can be in flight at once;
+# decoding and parsing a response is CPU work, which runs in worker threads so that it does not block the loop.
+# A fetcher is run in a worker thread against the responses downloaded so far: the first time it stops at the
+# requests it needs, which are awaited on the loop, and it is run again with them, so that no thread waits for TDX
+
+
+
+class Response:
+    # the parts of a requests.Response read by the fetchers
+    def __init__(self, status_code, headers, content):
+        self.status_code=status_code
+        self.headers=headers
+        self.content=content
+
+    @property
+    def text(self):
+        return(self.content.decode("utf-8-sig", errors="replace"))
+
+    def json(self):
+        return(loads(self.content))
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield(self.content[i:i+chunk_size])
+
+    def close(self):
+        pass
+
+
+
+def _shared(name):
+    # the setting given to the async client, otherwise the one of the shared TDXClient at the time it is read,
+    # so that a later client.configure() applies to both
+    def value(self):
+        setting=self._settings[name]
+        return(setting if setting is not None else getattr(get_client(), name))
+    return(property(value))
+
+
+
+class AsyncTDXClient:
+    # the rate limiter, base_url and retry policy of the shared TDXClient unless given,
+    # so that the async and blocking fetchers of one process keep together within the quota
+    def __init__(self, pool_size=100, max_retries=None, backoff=None, max_backoff=None, timeout=None, base_url=None, limiter=None):
+        self.pool_size=pool_size
+        self._settings=dict(max_retries=max_retries, backoff=backoff, max_backoff=max_backoff, timeout=timeout, base_url=base_url, limiter=limiter)
+        self._session=None
+        self._loop=None
+
+    max_retries=_shared('max_retries')
+    backoff=_shared('backoff')
+    max_backoff=_shared('max_backoff')
+    timeout=_shared('timeout')
+    base_url=_shared('base_url')
+    limiter=_shared('limiter')
+
+    def resolve(self, url):
+        if self.base_url and url.startswith(TDX_URL):
+            return(self.base_url.rstrip("/")+url[len(TDX_URL):])
+        return(url)
+
+    def _sleep_time(self, attempt):
+        return(random.uniform(0, min(self.max_backoff, self.backoff*2**attempt)))
+
+    def session(self):
+        # one connection pool per event loop
+        if aiohttp is None:
+            raise ImportError("The async API requires aiohttp, please install it with 'pip install nycu-tdx-py[async]'.")
+        loop=asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._session=aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+            self._loop=loop
+        return(self._session)
+
+    async def _send_once(self, method, url, headers, kwargs):
+        timeout=kwargs.get('timeout', self.timeout)
+        if not isinstance(timeout, aiohttp.ClientTimeout):
+            kwargs=dict(kwargs, timeout=aiohttp.ClientTimeout(total=timeout))
+        async with self.session().request(method, url, headers=headers, **kwargs) as response:
+            return(Response(response.status, response.headers, await response.read()))
+
+    async def _send(self, method, url, access_token, headers, **kwargs):
+        headers=dict(headers or {})
+        if access_token is not None:
+            headers['authorization']='Bearer '+access_token
+        # read once, so that every attempt of one request keeps the same settings
+        limiter, max_retries=self.limiter, self.max_retries
+
+        for attempt in range(max_retries+1):
+            if limiter is not None:
+                wait=limiter.reserve()
+                if wait>0:
+                    await asyncio.sleep(wait)
+            try:
+                response=await self._send_once(method, url, headers, kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt==max_retries:
+                    raise TDXError("Failed to connect to TDX: "+str(e)) from e
+                await asyncio.sleep(self._sleep_time(attempt))
+                continue
+
+            if response.status_code!=429 and response.status_code<500:
+                break
+            if attempt==max_retries:
+                raise TDXError("TDX responded with status "+str(response.status_code)+" after "+str(attempt+1)+" attempts.")
+            delay=_retry_after(response)
+            if delay is None:
+                delay=self._sleep_time(attempt)
+            if response.status_code==429 and limiter is not None:
+                limiter.pause(delay)
+            else:
+                await asyncio.sleep(delay)
+        return(response)
+
+    async def request(self, method, url, access_token=None, headers=None, **kwargs):
+        url=self.resolve(url)
+        kwargs.pop('stream', None)
+        token=_token_manager(access_token)
+        # a token is requested from TDX at most once a day, through the blocking client in a worker thread
+        if token is not None:
+            access_token=await asyncio.to_thread(token.get)
+        response=await self._send(method, url, access_token, headers, **kwargs)
+        if token is not None and response.status_code==401:
+            access_token=await asyncio.to_thread(token.refresh, access_token)
+            response=await self._send(method, url, access_token, headers, **kwargs)
+
+        if access_token is not None and response.status_code in (401, 403):
+            raise TDXAuthError()
+        return(response)
+
+    async def get(self, url, access_token=None, **kwargs):
+        return(await self.request('GET', url, access_token, **kwargs))
+
+    async def post(self, url, data=None, **kwargs):
+        return(await self.request('POST', url, data=data, **kwargs))
+
+    async def get_json(self, url, access_token, cache=None):
+        # like TDXClient.get_json, the body and the cache files are decoded and written in worker threads
+        url=self.resolve(url)
+        if cache is None:
+            response=await self.get(url, access_token)
+            return(await asyncio.to_thread(loads, response.content))
+
+        entry, fresh=cache.lookup(url)
+        if fresh:
+            data=await asyncio.to_thread(cache.load, url)
+            if data is not None:
+                return(data)
+            entry=None
+        headers=cache.validators(entry) if entry is not None else None
+        response=await self.get(url, access_token, headers=headers)
+        if response.status_code==304 and entry is not None:
+            data=await asyncio.to_thread(cache.load, url, True)
+            if data is not None:
+                return(data)
+            response=await self.get(url, access_token)
+        data=await asyncio.to_thread(loads, response.content)
+        if response.status_code==200:
+            await asyncio.to_thread(cache.store, url, data, response)
+        return(data)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session=None
+
+    async def __aenter__(self):
+        return(self)
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+
+class _Pending(BaseException):
+    # a response the fetcher needs is not downloaded yet; not an Exception, so that the fetchers handling failed
+    # requests (e.g. the routes of Bus_TravelTime) let it through
+    pass
+
+
+
+class _ReplayClient(TDXClient):
+    # the client of a fetcher running in a worker thread: it answers from the responses downloaded on the loop,
+    # and collects the urls of the others in 'pending' before stopping the fetcher
+    def __init__(self, responses, pending):
+        self.responses=responses
+        self.pending=pending
+        self.base_url=None
+        self.cache=None
+        self.limiter=None
+
+    def request(self, method, url, access_token=None, headers=None, **kwargs):
+        raise TDXError("The async fetchers only send the requests of get_json() and iter_json().")
+
+    def get_json(self, url, access_token):
+        if url not in self.responses:
+            self.pending[url]=access_token
+            raise _Pending()
+        data=self.responses[url]
+        if isinstance(data, TDXError):
+            raise data
+        return(data)
+
+    def iter_json(self, url, access_token, key=None):
+        data=self.get_json(url, access_token)
+        if key is not None and isinstance(data, dict) and key in data:
+            data=data[key]
+        elif isinstance(data, dict):
+            raise TDXError(str(data.get('Message', data))[:300])
+        yield from data
+
+
+
+_async_client=None
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client=AsyncTDXClient()
+    return(_async_client)
+
+
+
+def configure(**kwargs):
+    # e.g. configure(pool_size=200) before the first request
+    global _async_client
+    _async_client=AsyncTDXClient(**kwargs)
+    return(_async_client)
+
+
+
+async def close():
+    if _async_client is not None:
+        await _async_client.close()
+
+
+
+def _replay(fetcher, client, args, kwargs):
+    # in the copy of the context made by to_thread(), where get_client() is the replay client
+    _context_client.set(client)
+    return(fetcher(*args, **kwargs))
+
+
+
+async def _download(client, responses, url, access_token):
+    try:
+        responses[url]=await client.get_json(url, access_token, get_client().cache)
+    except TDXError as e:
+        # raised again by the fetcher, which warns as it does for the blocking requests
+        responses[url]=e
+
+
+
+def _on_loop(fetcher):
+    @functools.wraps(fetcher)
+    async def wrapper(*args, **kwargs):
+        client=get_async_client()
+        responses=dict()
+        while True:
+            pending=dict()
+            try:
+                return(await asyncio.to_thread(_replay, fetcher, _ReplayClient(responses, pending), args, kwargs))
+            except _Pending:
+                pass
+            await asyncio.gather(*[_download(client, responses, url, access_token) for url, access_token in pending.items()])
+    return(wrapper)
+
+
+
+async def get_token(client_id, client_secret):
+    # a token is requested at most once a day, by the blocking client in a worker thread
+    return(await asyncio.to_thread(tdx.get_token, client_id, client_secret))
+
+
+
+
+Bus_Route=_on_loop(tdx.Bus_Route)
+Bus_Shape=_on_loop(tdx.Bus_Shape)
+Bus_StopOfRoute=_on_loop(tdx.Bus_StopOfRoute)
+Bus_TravelTime=_on_loop(tdx.Bus_TravelTime)
+Bus_Schedule=_on_loop(tdx.Bus_Schedule)
+Bus_RouteFare=_on_loop(tdx.Bus_RouteFare)
+Bus_RealTime=_on_loop(tdx.Bus_RealTime)
+Rail_Shape=_on_loop(tdx.Rail_Shape)
+Rail_Station=_on_loop(tdx.Rail_Station)
+Rail_StationOfLine=_on_loop(tdx.Rail_StationOfLine)
+Rail_TimeTable=_on_loop(tdx.Rail_TimeTable)
+Bike_Shape=_on_loop(tdx.Bike_Shape)
+Bike_Station=_on_loop(tdx.Bike_Station)
+Road_Section=_on_loop(tdx.Road_Section)
+Road_VD=_on_loop(tdx.Road_VD)
+Road_Traffic=_on_loop(tdx.Road_Traffic)
+sync=_on_loop(tdx.sync)
+
+
+
+async def gather_counties(fetcher, access_token, counties=None, *args, **kwargs):
+    # one fetcher for many counties at once, every county in tdx_county() by default;
+    # returns county -> result, or the exception raised for that county
+    counties=list(counties) if counties is not None else list(tdx.tdx_county().Code)
+    fetcher=globals()[fetcher] if isinstance(fetcher, str) else fetcher
+    if not asyncio.iscoroutinefunction(fetcher):
+        fetcher=globals()[fetcher.__name__]
+    results=await asyncio.gather(*[fetcher(access_token, county, *args, **kwargs) for county in counties], return_exceptions=True)
+    return(dict(zip(counties, results)))
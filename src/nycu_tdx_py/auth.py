@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from .client import get_client, register_token, TDXAuthError
+from .cache import file_lock
+
+
+TOKEN_URL="https://tdx.transportdata.tw/auth/realms/TDXConnect/protocol/openid-connect/token"
+
+
+
+class TDXToken:
+    def __init__(self, client_id, client_secret, cache_dir=None, margin=600):
+        if cache_dir is None:
+            cache_dir=os.path.join(os.path.expanduser("~"), ".cache", "nycu_tdx_py")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.client_id=client_id
+        self.client_secret=client_secret
+        # refresh the token 'margin' seconds before it expires
+        self.margin=margin
+        self.cache_file=os.path.join(cache_dir, "token_"+hashlib.sha1(client_id.encode("utf-8")).hexdigest()[:16]+".json")
+        self.access_token=None
+        self.expires_at=0
+        self.source=None
+        self.lock=threading.Lock()
+
+    def __str__(self):
+        return(self.get())
+
+    def _valid(self, expires_at):
+        return(time.time()<expires_at-self.margin)
+
+    def get(self):
+        with self.lock:
+            if self.access_token is None or not self._valid(self.expires_at):
+                self._refresh(None)
+            return(self.access_token)
+
+    def refresh(self, stale=None):
+        # called when TDX rejects 'stale', another thread may have replaced it already
+        with self.lock:
+            if stale is None or stale==self.access_token:
+                self._refresh(self.access_token)
+            return(self.access_token)
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_file, "r") as f:
+                return(json.load(f))
+        except (OSError, ValueError):
+            return(None)
+
+    def _write_cache(self):
+        temp=self.cache_file+".tmp"
+        with open(temp, "w") as f:
+            json.dump({'access_token':self.access_token, 'expires_at':self.expires_at}, f)
+        os.chmod(temp, 0o600)
+        os.replace(temp, self.cache_file)
+
+    def _refresh(self, stale):
+        with file_lock(self.cache_file+".lock"):
+            cached=self._read_cache()
+            if cached is not None and cached['access_token']!=stale and self._valid(cached['expires_at']):
+                self.access_token=cached['access_token']
+                self.expires_at=cached['expires_at']
+                self.source="cache"
+            else:
+                response=get_client().post(TOKEN_URL, {'content-type':'application/x-www-form-urlencoded',
+                                                       'grant_type':'client_credentials',
+                                                       'client_id':self.client_id,
+                                                       'client_secret':self.client_secret})
+                js_data=json.loads(response.text)
+                if 'error' in js_data:
+                    raise TDXAuthError(js_data.get('error_description', js_data['error']))
+                self.access_token=js_data['access_token']
+                self.expires_at=time.time()+js_data.get('expires_in', 86400)
+                self.source="server"
+                self._write_cache()
+        register_token(self.access_token, self)
+
+
+
+_tokens=dict()
+_tokens_lock=threading.Lock()
+
+
+def token_manager(client_id, client_secret, cache_dir=None):
+    # one token object per client id within a process
+    with _tokens_lock:
+        if client_id not in _tokens or _tokens[client_id].client_secret!=client_secret:
+            _tokens[client_id]=TDXToken(client_id, client_secret, cache_dir)
+        return(_tokens[client_id])
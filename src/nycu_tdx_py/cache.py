@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+
+DAY=86400
+
+# seconds for which a cached response is used without asking TDX, by dataset type in the url path
+DEFAULT_TTL={'Shape':30*DAY,
+             'StationOfLine':30*DAY,
+             'Station':7*DAY,
+             'Line':30*DAY,
+             'StopOfRoute':DAY,
+             'Route':DAY,
+             'RouteFare':7*DAY,
+             'S2STravelTime':7*DAY,
+             'Schedule':DAY,
+             'GeneralStationTimetable':DAY,
+             'StationTimeTable':DAY,
+             'GeneralTrainTimetable':DAY,
+             'GeneralTimetable':DAY,
+             'SectionShape':30*DAY,
+             'Section':7*DAY,
+             'VD':7*DAY,
+             'ETagPair':7*DAY,
+             # real-time data is always revalidated, history never changes
+             'RealTimeByFrequency':0,
+             'RealTimeNearStop':0,
+             'EstimatedTimeOfArrival':0,
+             'Live':0,
+             'Historical':30*DAY,
+             'default':DAY}
+
+
+
+@contextmanager
+def file_lock(path):
+    # exclusive lock shared by every process using the same file, e.g. the token cache or the index of the response cache
+    with open(path, "a+") as f:
+        if os.name=="nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+
+def _normalize_url(url):
+    # the same query in a different parameter order must hit the same entry
+    parts=urlsplit(url)
+    query=sorted([(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key!=''])
+    return(parts.scheme+"://"+parts.netloc+parts.path+"?"+urlencode(query))
+
+
+
+class ResponseCache:
+    # the index of the entries is shared by every process using the same directory: it is read again and written back
+    # under a file lock whenever it changes, so that entries and sizes stored by the others are kept
+    def __init__(self, path=None, max_size=2*1024**3, ttl=None):
+        if path is None:
+            path=os.path.join(os.path.expanduser("~"), ".cache", "nycu_tdx_py")
+        os.makedirs(path, exist_ok=True)
+        self.path=path
+        self.max_size=max_size
+        self.ttl=dict(DEFAULT_TTL)
+        self.ttl.update(ttl or {})
+        self.lock=threading.Lock()
+        self.index_file=os.path.join(path, "index.json")
+        self.index=self._read_index()
+
+    def key(self, url):
+        return(hashlib.sha1(_normalize_url(url).encode("utf-8")).hexdigest())
+
+    def ttl_for(self, url):
+        for segment in urlsplit(url).path.split("/"):
+            if segment in self.ttl:
+                return(self.ttl[segment])
+        return(self.ttl['default'])
+
+    def _file(self, key):
+        return(os.path.join(self.path, key+".pkl"))
+
+    def _read_index(self):
+        try:
+            with open(self.index_file, "r") as f:
+                return(json.load(f))
+        except (OSError, ValueError):
+            return(dict())
+
+    def _save_index(self):
+        temp=self.index_file+".tmp"
+        with open(temp, "w") as f:
+            json.dump(self.index, f)
+        os.replace(temp, self.index_file)
+
+    @contextmanager
+    def _updating(self):
+        # the latest index saved by any process, written back after the changes of the block
+        with self.lock, file_lock(self.index_file+".lock"):
+            self.index=self._read_index()
+            yield self.index
+            self._save_index()
+
+    def lookup(self, url):
+        # return (entry, is_fresh), or (None, False) when nothing is cached
+        key=self.key(url)
+        with self.lock:
+            # index.json is replaced atomically, so it is read without the file lock
+            self.index=self._read_index()
+            entry=self.index.get(key)
+            if entry is None or not os.path.exists(self._file(key)):
+                return(None, False)
+            return(entry, time.time()-entry['stored']<self.ttl_for(url))
+
+    def validators(self, entry):
+        headers=dict()
+        if entry.get('etag'):
+            headers['If-None-Match']=entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since']=entry['last_modified']
+        return(headers)
+
+    def load(self, url, revalidated=False):
+        # None when the entry is missing or cannot be read, e.g. evicted by another thread or process since lookup(),
+        # which the caller treats as a miss
+        key=self.key(url)
+        try:
+            with open(self._file(key), "rb") as f:
+                data=pickle.load(f)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            with self._updating() as index:
+                if index.pop(key, None) is not None:
+                    try:
+                        os.remove(self._file(key))
+                    except OSError:
+                        pass
+            return(None)
+        with self._updating() as index:
+            entry=index.get(key)
+            if entry is not None:
+                entry['accessed']=time.time()
+                if revalidated:
+                    entry['stored']=entry['accessed']
+        return(data)
+
+    def store(self, url, data, response):
+        key=self.key(url)
+        temp=self._file(key)+".tmp."+str(os.getpid())+"."+str(threading.get_ident())
+        with open(temp, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, self._file(key))
+        now=time.time()
+        with self._updating() as index:
+            index[key]={'url':_normalize_url(url),
+                        'etag':response.headers.get('ETag'),
+                        'last_modified':response.headers.get('Last-Modified'),
+                        'stored':now,
+                        'accessed':now,
+                        'size':os.path.getsize(self._file(key))}
+            self._evict()
+
+    def _evict(self):
+        # drop the least recently used entries until the cache fits in max_size
+        total=sum([entry['size'] for entry in self.index.values()])
+        for key in sorted(self.index, key=lambda k: self.index[k]['accessed']):
+            if total<=self.max_size:
+                break
+            total-=self.index[key]['size']
+            del self.index[key]
+            try:
+                os.remove(self._file(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._updating() as index:
+            for key in index:
+                try:
+                    os.remove(self._file(key))
+                except OSError:
+                    pass
+            index.clear()
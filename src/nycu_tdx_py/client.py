@@ -0,0 +1,298 @@
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from .cache import ResponseCache
+from .stream import iter_records, loads
+from .metrics import stage, timed, counted
+
+
+# every request to TDX is sent to 'base_url' instead when one is configured, e.g. a local mock server
+TDX_URL="https://tdx.transportdata.tw"
+
+# TDX allows 5 requests per second for each API key of a general member
+TDX_RATE_LIMIT=5
+
+# bytes read from the connection at a time when a response is decoded while it is downloaded
+STREAM_CHUNK_SIZE=64*1024
+
+
+
+class TDXError(Exception):
+    pass
+
+
+
+class TDXAuthError(TDXError):
+    def __init__(self, message="Your access token is invalid!"):
+        super().__init__(message)
+
+
+
+class RateLimiter:
+    # token bucket shared by every thread sending requests through one client
+    def __init__(self, rate=TDX_RATE_LIMIT, burst=None):
+        self.rate=float(rate)
+        self.capacity=float(burst if burst is not None else rate)
+        self.tokens=self.capacity
+        self.updated=time.monotonic()
+        self.lock=threading.Lock()
+
+    def reserve(self):
+        # take one token now and return the seconds to wait before it may be used
+        with self.lock:
+            now=time.monotonic()
+            self.tokens=min(self.capacity, self.tokens+(now-self.updated)*self.rate)
+            self.updated=now
+            self.tokens-=1
+            return(max(0.0, -self.tokens/self.rate))
+
+    def acquire(self):
+        wait=self.reserve()
+        if wait>0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # empty the bucket so that no thread sends anything for the next 'seconds'; the tokens refilled until now are counted
+        # first, otherwise the next reserve() would add them back and shorten the pause
+        with self.lock:
+            now=time.monotonic()
+            self.tokens=min(self.capacity, self.tokens+(now-self.updated)*self.rate)
+            self.updated=now
+            self.tokens=min(self.tokens, -seconds*self.rate)
+
+
+
+def _retry_after(response):
+    value=response.headers.get('Retry-After')
+    if value is None:
+        return(None)
+    try:
+        return(max(0.0, float(value)))
+    except ValueError:
+        pass
+    try:
+        return(max(0.0, parsedate_to_datetime(value).timestamp()-time.time()))
+    except (TypeError, ValueError):
+        return(None)
+
+
+
+class TDXClient:
+    def __init__(self, pool_size=10, max_retries=5, backoff=0.5, max_backoff=60, rate=TDX_RATE_LIMIT, burst=None, timeout=120, cache=None, base_url=None):
+        self.session=requests.Session()
+        adapter=HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.limiter=RateLimiter(rate, burst) if rate else None
+        self.max_retries=max_retries
+        self.backoff=backoff
+        self.max_backoff=max_backoff
+        self.timeout=timeout
+        self.cache=cache
+        self.base_url=base_url if base_url is not None else os.environ.get('TDX_BASE_URL')
+
+    def resolve(self, url):
+        if self.base_url and url.startswith(TDX_URL):
+            return(self.base_url.rstrip("/")+url[len(TDX_URL):])
+        return(url)
+
+    def _sleep_time(self, attempt):
+        # exponential backoff with full jitter
+        return(random.uniform(0, min(self.max_backoff, self.backoff*2**attempt)))
+
+    def _send(self, method, url, access_token, headers, **kwargs):
+        headers=dict(headers or {})
+        if access_token is not None:
+            headers['authorization']='Bearer '+access_token
+        kwargs.setdefault('timeout', self.timeout)
+
+        for attempt in range(self.max_retries+1):
+            if self.limiter is not None:
+                with stage("throttle"):
+                    self.limiter.acquire()
+            try:
+                response=self.session.request(method, url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt==self.max_retries:
+                    raise TDXError("Failed to connect to TDX: "+str(e)) from e
+                time.sleep(self._sleep_time(attempt))
+                continue
+
+            if response.status_code!=429 and response.status_code<500:
+                break
+            if attempt==self.max_retries:
+                raise TDXError("TDX responded with status "+str(response.status_code)+" after "+str(attempt+1)+" attempts.")
+            response.close()
+            delay=_retry_after(response)
+            if delay is None:
+                delay=self._sleep_time(attempt)
+            if response.status_code==429 and self.limiter is not None:
+                # the next acquire() waits until the whole client may send again
+                self.limiter.pause(delay)
+            else:
+                time.sleep(delay)
+        return(response)
+
+    def request(self, method, url, access_token=None, headers=None, **kwargs):
+        url=self.resolve(url)
+        token=_token_manager(access_token)
+        if token is not None:
+            access_token=token.get()
+        response=self._send(method, url, access_token, headers, **kwargs)
+        if token is not None and response.status_code==401:
+            # the token expired or was revoked partway through a batch, refresh it once
+            access_token=token.refresh(access_token)
+            response.close()
+            response=self._send(method, url, access_token, headers, **kwargs)
+
+        if access_token is not None and response.status_code in (401, 403):
+            raise TDXAuthError()
+        return(response)
+
+    def get(self, url, access_token=None, **kwargs):
+        return(self.request('GET', url, access_token, **kwargs))
+
+    def post(self, url, data=None, **kwargs):
+        return(self.request('POST', url, data=data, **kwargs))
+
+    def get_json(self, url, access_token):
+        url=self.resolve(url)
+        if self.cache is None:
+            return(self._decode(self._get_whole(url, access_token)))
+
+        entry, fresh=self.cache.lookup(url)
+        if fresh:
+            with stage("cache"):
+                data=self.cache.load(url)
+            if data is not None:
+                return(data)
+            entry=None
+        headers=self.cache.validators(entry) if entry is not None else None
+        response=self._get_whole(url, access_token, headers=headers)
+        if response.status_code==304 and entry is not None:
+            with stage("cache"):
+                data=self.cache.load(url, revalidated=True)
+            if data is not None:
+                return(data)
+            # the entry went away since it was validated, the whole response is requested again
+            response=self._get_whole(url, access_token)
+        data=self._decode(response)
+        if response.status_code==200:
+            self.cache.store(url, data, response)
+        return(data)
+
+    def get_json_changed(self, url, access_token, validators=None):
+        # conditional request of a polled url: (None, validators) when TDX answers 304 Not Modified,
+        # otherwise the decoded body and the validators to send with the next request
+        response=self._get_whole(self.resolve(url), access_token, headers=validators)
+        if response.status_code==304 and validators:
+            return(None, validators)
+        data=self._decode(response)
+        validators=dict()
+        if response.headers.get('ETag'):
+            validators['If-None-Match']=response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            validators['If-Modified-Since']=response.headers['Last-Modified']
+        return(data, validators)
+
+    def _get_whole(self, url, access_token, **kwargs):
+        with stage("request") as info:
+            response=self.get(url, access_token, **kwargs)
+            info['bytes']=len(response.content)
+        return(response)
+
+    def _decode(self, response):
+        with stage("decode"):
+            return(loads(response.content))
+
+    def iter_json(self, url, access_token, key=None):
+        # records of the response decoded while it is downloaded, see stream.iter_records
+        if self.cache is not None:
+            data=self.get_json(url, access_token)
+            if key is not None and isinstance(data, dict) and key in data:
+                data=data[key]
+            elif isinstance(data, dict):
+                raise TDXError(str(data.get('Message', data))[:300])
+            yield from data
+            return
+
+        with stage("request"):
+            response=self.get(url, access_token, stream=True)
+        info=dict()
+        try:
+            yield from timed(iter_records(counted(response.iter_content(chunk_size=STREAM_CHUNK_SIZE), info), key), "stream", info)
+        except ValueError as e:
+            raise TDXError("Unexpected response of TDX: "+str(e)) from e
+        except requests.RequestException as e:
+            # the connection dropped partway through the body
+            raise TDXError("Failed to download the response of TDX: "+str(e)) from e
+        finally:
+            response.close()
+
+    def enable_cache(self, path=None, max_size=2*1024**3, ttl=None):
+        # ttl overrides the seconds of DEFAULT_TTL by dataset type, e.g. {'Shape':86400}
+        self.cache=ResponseCache(path, max_size, ttl)
+        return(self.cache)
+
+    def disable_cache(self):
+        self.cache=None
+
+
+
+# access tokens issued by auth.TDXToken, so that a plain token string can still be refreshed
+_tokens=dict()
+
+
+def register_token(access_token, token):
+    _tokens[access_token]=token
+
+
+
+def _token_manager(access_token):
+    if hasattr(access_token, 'refresh'):
+        return(access_token)
+    return(_tokens.get(access_token))
+
+
+
+_client=None
+_client_lock=threading.Lock()
+
+# the client of the current context instead of the shared one, e.g. the fetchers run by aio send their requests
+# through the event loop
+_context_client=ContextVar("client", default=None)
+
+
+def get_client():
+    global _client
+    client=_context_client.get()
+    if client is not None:
+        return(client)
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client=TDXClient()
+    return(_client)
+
+
+
+def set_client(client):
+    global _client
+    _client=client
+    return(client)
+
+
+
+def configure(**kwargs):
+    # e.g. configure(pool_size=20, rate=50) for a key with a higher quota
+    return(set_client(TDXClient(**kwargs)))
+
+
+
+def enable_cache(path=None, max_size=2*1024**3, ttl=None):
+    return(get_client().enable_cache(path, max_size, ttl))
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+
+# coordinates in degrees kept as float32 by compact_dtypes(), which is exact to about 1e-5 degree (1 metre) across Taiwan
+COORDINATE_COLUMNS=['PositionLon','PositionLat','Lon','Lat']
+COORDINATE_TOLERANCE=1e-5
+
+
+
+def categorize(data, ratio=0.5):
+    # names of stops, routes and stations repeat on many rows, store each of them once;
+    # a column becomes a category when its distinct values are at most 'ratio' of the rows
+    columns=dict()
+    for label_id in data.columns:
+        values=data[label_id]
+        if not isinstance(values.dtype, pd.CategoricalDtype) and pd.api.types.is_string_dtype(values) and values.nunique()<=len(data)*ratio:
+            columns[label_id]=values.astype("category")
+    return(data.assign(**columns) if len(columns)!=0 else data)
+
+
+
+def _narrow(values, label_id):
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return(values)
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return(pd.to_numeric(values, downcast="integer"))
+    if pd.api.types.is_float_dtype(values.dtype):
+        valid=values.dropna()
+        if label_id in COORDINATE_COLUMNS:
+            narrow=values.astype(np.float32)
+            if len(valid)==0 or np.abs(narrow[valid.index].astype(np.float64)-valid).max()<=COORDINATE_TOLERANCE:
+                return(narrow)
+            return(values)
+        # sequences, directions and run times with missing values are floats, keep them as nullable integers
+        if len(valid)!=0 and (valid==np.round(valid)).all() and np.abs(valid).max()<2**31:
+            return(pd.to_numeric(values.astype("Int64"), downcast="integer"))
+        if (values.astype(np.float32).astype(np.float64)==values)[values.notna()].all():
+            return(values.astype(np.float32))
+    return(values)
+
+
+
+def compact_dtypes(data):
+    # compact=True of the fetchers: repeated strings as categories, integers in the narrowest type holding them
+    # and float32 for coordinates and the floats it represents exactly
+    data=categorize(data)
+    columns=dict()
+    for label_id in data.columns:
+        values=data[label_id]
+        if pd.api.types.is_numeric_dtype(values.dtype):
+            narrow=_narrow(values, label_id)
+            if narrow.dtype!=values.dtype:
+                columns[label_id]=narrow
+    return(data.assign(**columns) if len(columns)!=0 else data)
+
+
+
+def fixed_dtypes(data, dtypes, times=(), timezone="Asia/Taipei"):
+    # the same types whatever the content, so that the files of one dataset written chunk by chunk share their schema:
+    # 'dtypes' by column, the 'times' as datetimes in seconds, any other column but the datetimes as strings
+    columns=dict()
+    for label_id in data.columns:
+        if label_id in times:
+            columns[label_id]=pd.to_datetime(data[label_id], format="ISO8601", utc=True, errors="coerce").dt.tz_convert(timezone).astype("datetime64[s, "+timezone+"]")
+        elif label_id in dtypes:
+            values=data[label_id] if dtypes[label_id]=='boolean' else pd.to_numeric(data[label_id], errors="coerce")
+            columns[label_id]=values.astype(dtypes[label_id])
+        elif not pd.api.types.is_datetime64_any_dtype(data[label_id].dtype):
+            columns[label_id]=data[label_id].astype("string")
+    return(data.assign(**columns))
@@ -0,0 +1,71 @@
+import os
+import warnings
+import pandas as pd
+from .metrics import stage
+from .dtypes import categorize
+from .lazy import LazyModule
+
+
+gpd=LazyModule("geopandas")
+
+
+# export formats of 'out' by extension, Parquet and Feather keep the geometry of 'sf' as WKB (GeoParquet)
+TEXT_FORMATS=['.csv','.txt','.parquet','.feather']
+SF_FORMATS=['.shp','.parquet','.feather']
+
+
+
+def _format(path):
+    return(os.path.splitext(str(path))[1].lower())
+
+
+
+def valid_out(out, dtype="text"):
+    return(_format(out) in (SF_FORMATS if dtype=="sf" else TEXT_FORMATS))
+
+
+
+def write_out(data, out):
+    out_format=_format(out)
+    if out_format not in TEXT_FORMATS+SF_FORMATS:
+        raise ValueError("'"+str(out)+"' is not a supported export file.")
+    with stage("export", records=len(data)) as info:
+        if out_format in ['.csv','.txt']:
+            data.to_csv(out, index=False)
+        elif out_format=='.shp':
+            data.to_file(out, index=False)
+        elif out_format=='.parquet':
+            categorize(data).to_parquet(out, index=False)
+        elif out_format=='.feather':
+            categorize(data).reset_index(drop=True).to_feather(out)
+        info['bytes']=os.path.getsize(out) if os.path.isfile(out) else None
+
+
+
+def _is_geo(path, out_format):
+    # GeoParquet and GeoArrow files describe their geometry columns in the 'geo' metadata
+    import pyarrow
+    if out_format=='.parquet':
+        import pyarrow.parquet
+        schema=pyarrow.parquet.read_schema(path)
+    else:
+        import pyarrow.ipc
+        with pyarrow.memory_map(path) as source:
+            schema=pyarrow.ipc.open_file(source).schema
+    return(schema.metadata is not None and b"geo" in schema.metadata)
+
+
+
+def read_out(path):
+    # load a file exported through 'out' back into a data frame, or a geo data frame for geometries
+    out_format=_format(path)
+    if out_format in ['.csv','.txt']:
+        return(pd.read_csv(path))
+    elif out_format=='.shp':
+        return(gpd.read_file(path))
+    elif out_format=='.parquet':
+        return(gpd.read_parquet(path) if _is_geo(path, out_format) else pd.read_parquet(path))
+    elif out_format=='.feather':
+        return(gpd.read_feather(path) if _is_geo(path, out_format) else pd.read_feather(path))
+    else:
+        return(warnings.warn("'"+str(path)+"' is not a supported file. Please use '.csv', '.txt', '.shp', '.parquet' or '.feather'.", UserWarning))
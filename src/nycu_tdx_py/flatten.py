@@ -0,0 +1,166 @@
+import gc
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from .metrics import stage
+from .dtypes import categorize
+
+
+def _path(path):
+    if path is None:
+        return(None)
+    if isinstance(path, str):
+        return((path,))
+    return(tuple(path))
+
+
+
+class Level:
+    # one nesting level of a TDX payload
+    #   fields:   output column -> key or path of keys, e.g. ('RouteName','Zh_tw') or ('StopTimes',0,'StopID')
+    #   children: key or path of the nested list walked by the next level
+    #   expand:   paths of dicts whose keys all become columns, e.g. 'ServiceDay', () for the record itself
+    #   exclude:  columns dropped from the expanded dicts
+    #   keep_empty: keep the records without children as one row with empty inner columns
+    # fields named like an expanded column replace it in place, the others come before the expanded columns
+    def __init__(self, fields=None, children=None, expand=(), exclude=(), keep_empty=False):
+        self.fields=[(name, _path(path)) for name, path in dict(fields or {}).items()]
+        self.children=_path(children)
+        self.expand=[_path(path) for path in expand]
+        self.exclude=set(exclude)
+        self.keep_empty=keep_empty
+
+
+
+def _step(node, key):
+    if type(node) is dict:
+        return(node.get(key))
+    if type(node) is list and type(key) is int and -len(node)<=key<len(node):
+        return(node[key])
+    return(None)
+
+
+
+def _get(node, path):
+    for key in path:
+        node=_step(node, key)
+    return(node)
+
+
+
+def _column(values, path):
+    # resolve the remaining keys of a path on a whole column at once
+    for key in path:
+        values=[value.get(key) if type(value) is dict else _step(value, key) for value in values]
+    return(values)
+
+
+
+@contextmanager
+def _gc_paused():
+    # flattening allocates millions of small containers next to a payload of millions of dicts,
+    # the cyclic garbage collector would rescan all of them again and again
+    collect=gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if collect:
+            gc.enable()
+
+
+
+def flatten(records, levels, compact=False):
+    with stage("flatten") as info, _gc_paused():
+        data=_flatten(records, levels, compact)
+        info['records']=len(data)
+        return(data)
+
+
+
+def _flatten(records, levels, compact):
+    # walk the payload once: each record adds one tuple with the top keys of all its fields,
+    # the tuples are transposed into columns and the nested keys resolved column by column;
+    # the rows of each outer level are then repeated once per innermost record
+    depth=len(levels)
+    keys=[]
+    for level in levels:
+        level_keys=[]
+        for path in [path for name, path in level.fields]+level.expand:
+            if len(path)!=0 and path[0] not in level_keys:
+                level_keys.append(path[0])
+        keys.append(tuple(level_keys))
+    rows=[[] for level in levels]
+    nodes=[[] if () in level.expand else None for level in levels]
+    counts=[[] for level in levels]
+
+    def walk(level_nodes, d):
+        level_keys=keys[d]
+        level_rows=rows[d]
+        if d==depth-1 and nodes[d] is None:
+            before=len(level_rows)
+            level_rows.extend([tuple(map(node.get, level_keys)) for node in level_nodes])
+            return(len(level_rows)-before)
+
+        children=levels[d].children
+        total=0
+        for node in level_nodes:
+            level_rows.append(tuple(map(node.get, level_keys)))
+            if nodes[d] is not None:
+                nodes[d].append(node)
+            if d==depth-1:
+                total+=1
+            else:
+                num=walk(_get(node, children) or (), d+1)
+                if num==0 and levels[d].keep_empty:
+                    for e in range(d+1, depth):
+                        rows[e].append((None,)*len(keys[e]))
+                        if nodes[e] is not None:
+                            nodes[e].append({})
+                        if e<depth-1:
+                            counts[e].append(1)
+                    num=1
+                counts[d].append(num)
+                total+=num
+        return(total)
+
+    walk(records, 0)
+
+    frames=[]
+    for d, level in enumerate(levels):
+        num=len(rows[d])
+        columns=dict(zip(keys[d], [list(col) for col in zip(*rows[d])])) if num!=0 else {key:[] for key in keys[d]}
+        rows[d]=None
+        values=lambda path: nodes[d] if len(path)==0 else _column(columns[path[0]], path[1:])
+
+        level_frame=pd.DataFrame(index=pd.RangeIndex(num))
+        for path in level.expand:
+            temp=pd.DataFrame.from_records([value if type(value) is dict else {} for value in values(path)])
+            temp=temp.drop([i for i in temp.columns if i in level.exclude or i in level_frame.columns], axis=1)
+            level_frame=pd.concat([level_frame, temp], axis=1)
+        new_fields=dict()
+        for name, path in level.fields:
+            if name in level_frame.columns:
+                level_frame[name]=values(path)
+            else:
+                new_fields[name]=values(path)
+        level_frame=pd.concat([pd.DataFrame(new_fields, index=pd.RangeIndex(num)), level_frame], axis=1)
+
+        if d<depth-1:
+            # with compact, the names of the outer levels are repeated as category codes rather than strings
+            if compact:
+                level_frame=categorize(level_frame, ratio=1)
+            level_frame=level_frame.iloc[np.repeat(np.arange(len(counts[d])), counts[d])].reset_index(drop=True)
+        frames.append(level_frame)
+    return(pd.concat(frames, axis=1))
+
+
+
+def time_to_seconds(values):
+    # 'HH:MM' or 'HH:MM:SS' to int32 seconds since midnight, -1 for missing times
+    text=pd.Series(values).fillna("").to_numpy(dtype="U8")
+    digit=text.view(np.uint32).reshape(len(text), 8).astype(np.int32)-48
+    colon=ord(":")-48
+    seconds=(digit[:,0]*10+digit[:,1])*3600+(digit[:,3]*10+digit[:,4])*60
+    seconds=seconds+np.where(digit[:,5]==colon, digit[:,6]*10+digit[:,7], 0)
+    return(np.where(digit[:,2]==colon, seconds, -1).astype(np.int32))
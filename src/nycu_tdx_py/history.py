@@ -0,0 +1,161 @@
+import os
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+from itertools import islice
+import pandas as pd
+from . import tdx
+from .client import TDXError
+from .flatten import flatten, _gc_paused
+from .dtypes import fixed_dtypes
+from .metrics import stage
+from .lazy import LazyModule
+
+
+pa=LazyModule("pyarrow")
+pq=LazyModule("pyarrow.parquet")
+tqdm=LazyModule("tqdm")
+
+
+# bulk download of the road traffic history, e.g. three months of freeway vehicle detectors:
+#   summary=history.download(access_token, "vd_live", "2024-01-01", "2024-03-31", roadclass="0", path="road_history")
+#   vd=history.read_history("road_history", "vd_live", "2024-02-01", "2024-02-07")
+# every day of every road class is one partition, fetched by a pool of workers within the rate limit of the shared client,
+# decoded while it is downloaded and written chunk by chunk to one Parquet file, e.g.
+#   road_history/vd_live/date=2024-01-01/roadclass=0.parquet
+# the file of a partition appears only once it is complete, so a download stopped or failed on some days resumes from them
+
+ROAD_TIMES=['DataCollectTime','StartTime','EndTime']
+ROAD_DTYPES={'TravelTime':'Int32', 'TravelSpeed':'Int16', 'CongestionLevelID':'Int8', 'Status':'Int8', 'LaneID':'Int8', 'LaneType':'Int8',
+             'Speed':'Int16', 'Occupancy':'Int16', 'Volume':'Int16', 'VehicleSpeed':'Int16',
+             'StartETagStatus':'Int8', 'EndETagStatus':'Int8', 'StandardDeviation':'Int32', 'SpaceMeanSpeed':'Int16', 'VehicleCount':'Int32'}
+
+# records flattened and written at a time, bounding the memory of a partition whatever its size
+CHUNKSIZE=5000
+
+
+
+def partition_file(path, record, date, roadclass):
+    return(os.path.join(path, record, "date="+str(date), "roadclass="+str(roadclass)+".parquet"))
+
+
+
+def _write_chunks(access_token, record, date, authority, ids, chunksize, files, writers, rows):
+    id_col=tdx.ROAD_CLASS_OF[record][1] if ids is not None else None
+    records=iter(tdx._fetch_records(tdx._road_url(record, authority, date), access_token, tdx.ROAD_API[record][1]))
+    while True:
+        chunk=list(islice(records, chunksize))
+        # a day without any record still writes its empty partition
+        if len(chunk)==0 and len(writers)!=0:
+            return
+        data=fixed_dtypes(flatten(chunk, tdx.ROAD_SPEC[record]), ROAD_DTYPES, ROAD_TIMES)
+        for i in files:
+            part=data[data[id_col].isin(ids[i])] if ids is not None else data
+            table=pa.Table.from_pandas(part.reset_index(drop=True), preserve_index=False)
+            if i not in writers:
+                os.makedirs(os.path.dirname(files[i]), exist_ok=True)
+                writers[i]=pq.ParquetWriter(files[i]+".tmp", table.schema, compression="zstd")
+            with stage("export", records=len(part)):
+                writers[i].write_table(table)
+            rows[i]+=len(part)
+        if len(chunk)==0:
+            return
+
+
+
+def _write_partition(access_token, record, date, authority, classes, ids, path, chunksize):
+    # streams the records of one day and authority into the files of its road classes
+    files={i:partition_file(path, record, date, i) for i in classes}
+    writers=dict()
+    rows={i:0 for i in classes}
+    try:
+        # the collector would otherwise rescan the records of the chunk after every piece of the body decoded
+        with _gc_paused():
+            _write_chunks(access_token, record, date, authority, ids, chunksize, files, writers, rows)
+    except BaseException:
+        for i, writer in writers.items():
+            writer.close()
+            os.remove(files[i]+".tmp")
+        raise
+    for i, writer in writers.items():
+        writer.close()
+        os.replace(files[i]+".tmp", files[i])
+    return({i:(rows[i], os.path.getsize(files[i])) for i in classes})
+
+
+
+def download(access_token, record, start, end, roadclass="0", path="road_history", max_workers=4, chunksize=CHUNKSIZE):
+    # every day from 'start' to 'end' of 'record' ('live', 'vd_live' or 'etag_live'), skipping the partitions already in 'path';
+    # returns one row for every partition with its status ('done', 'skipped' or 'failed'), rows, bytes and seconds
+    if record not in ['live','vd_live','etag_live']:
+        return(warnings.warn("'"+str(record)+"' is not valid traffic record. Please use 'live', 'vd_live' or 'etag_live'.", UserWarning))
+    authorities=tdx._road_classes(roadclass)
+    if authorities is None:
+        print(tdx.tdx_roadclass())
+        return(warnings.warn("'"+str(roadclass)+"' is not valid road class. Please check out the table of road class code above.", UserWarning))
+    if record=="etag_live":
+        authorities={'Freeway':['0']} if 'Freeway' in authorities else dict()
+    dates=[i.strftime("%Y-%m-%d") for i in pd.date_range(start, end, freq="D")]
+
+    summary=[]
+    tasks=[]
+    ids=dict()
+    for authority, classes in authorities.items():
+        # the traffic of an authority publishing several road classes is split by the ids in its current road description
+        if record in tdx.ROAD_CLASS_OF and len([i for i in tdx.ROAD_AUTHORITY if tdx.ROAD_AUTHORITY[i]==authority])>1:
+            try:
+                ids[authority]=tdx._road_ids(access_token, record, authority, classes)
+            except TDXError as e:
+                return(warnings.warn(str(e), UserWarning))
+        for date in dates:
+            if all([os.path.exists(partition_file(path, record, date, i)) for i in classes]):
+                summary.extend([{'date':date, 'roadclass':i, 'status':'skipped', 'rows':None, 'bytes':os.path.getsize(partition_file(path, record, date, i)), 'seconds':0.0} for i in classes])
+            else:
+                tasks.append((date, authority, classes))
+
+    def run(date, authority, classes):
+        start_time=time.perf_counter()
+        result=_write_partition(access_token, record, date, authority, classes, ids.get(authority), path, chunksize)
+        return(result, time.perf_counter()-start_time)
+
+    failed=dict()
+    if len(tasks)!=0:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures={executor.submit(copy_context().run, run, *task): task for task in tasks}
+            for future in tqdm.tqdm(as_completed(futures), total=len(futures)):
+                date, authority, classes=futures[future]
+                try:
+                    result, seconds=future.result()
+                    summary.extend([{'date':date, 'roadclass':i, 'status':'done', 'rows':result[i][0], 'bytes':result[i][1], 'seconds':seconds} for i in classes])
+                except Exception as e:
+                    failed[date+" "+authority]=str(e)
+                    summary.extend([{'date':date, 'roadclass':i, 'status':'failed', 'rows':None, 'bytes':None, 'seconds':None} for i in classes])
+    if len(failed)!=0:
+        warnings.warn("Failed to download "+str(len(failed))+" partition(s), run it again to resume: "+", ".join([key+" ("+value+")" for key, value in failed.items()]), UserWarning)
+    return(pd.DataFrame(summary, columns=['date','roadclass','status','rows','bytes','seconds']).sort_values(['date','roadclass'], ignore_index=True))
+
+
+
+def read_history(path, record, start=None, end=None, roadclass=None, columns=None, filters=None):
+    # the partitions of 'record' from 'start' to 'end' (all by default) as one data frame, with the columns 'date' and 'roadclass';
+    # 'columns' and 'filters' (e.g. [('VDID','in',ids)]) are applied while reading
+    folder=os.path.join(path, record)
+    if not os.path.isdir(folder):
+        return(warnings.warn("'"+folder+"' does not contain any downloaded partition.", UserWarning))
+    classes=None if roadclass is None else set(sum(tdx._road_classes(roadclass).values(), []))
+    start=pd.Timestamp(start).strftime("%Y-%m-%d") if start is not None else None
+    end=pd.Timestamp(end).strftime("%Y-%m-%d") if end is not None else None
+    frames=[]
+    for name in sorted(os.listdir(folder)):
+        date=name[5:]
+        if not name.startswith("date=") or (start is not None and date<start) or (end is not None and date>end):
+            continue
+        for file in sorted(os.listdir(os.path.join(folder, name))):
+            if not file.endswith(".parquet") or (classes is not None and file[10:-8] not in classes):
+                continue
+            data=pd.read_parquet(os.path.join(folder, name, file), columns=columns, filters=filters)
+            frames.append(data.assign(date=date, roadclass=file[10:-8]))
+    if len(frames)==0:
+        return(None)
+    return(pd.concat(frames, ignore_index=True))
@@ -0,0 +1,19 @@
+import importlib
+
+
+class LazyModule:
+    # a module imported on the first access to one of its attributes, e.g. geopandas and shapely are only
+    # loaded by the 'sf' outputs, which spares the import of GDAL to the jobs reading text outputs
+    def __init__(self, name):
+        self._name=name
+        self._module=None
+
+    def __getattr__(self, attr):
+        if attr.startswith("__") or attr in ['_name','_module']:
+            raise AttributeError(attr)
+        if self._module is None:
+            self._module=importlib.import_module(self._name)
+        return(getattr(self._module, attr))
+
+    def __repr__(self):
+        return("<lazy module '"+self._name+"'"+(", loaded" if self._module is not None else "")+">")
@@ -0,0 +1,222 @@
+import functools
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+import pandas as pd
+
+
+# stages of the fetch pipeline reported to the hooks, each event being a dict of
+#   fetcher:  the public function running, e.g. 'Bus_Schedule', None outside of one
+#   stage:    'throttle' (waiting for the rate limiter), 'request' (response from TDX, the whole body unless streamed),
+#             'decode' (json of a whole body), 'stream' (body downloaded and decoded record by record), 'cache',
+#             'flatten', 'geometry', 'export' and 'total' (the whole fetcher)
+#   seconds:  wall time of the stage, self_seconds without the stages nested in it
+#   bytes, records: downloaded or written bytes and number of records or rows, None when not known
+#   memory:   peak of the memory allocated above the start of the stage, only while tracing memory
+STAGES=['throttle','request','decode','stream','cache','flatten','geometry','export','total']
+
+_hooks=[]
+_hooks_lock=threading.Lock()
+_traced=[False, 0]
+_frames=threading.local()
+_fetcher=ContextVar("fetcher", default=None)
+
+
+
+def _stack():
+    if not hasattr(_frames, 'stack'):
+        _frames.stack=[]
+    return(_frames.stack)
+
+
+
+def add_hook(hook, memory=False):
+    # hook(event) is called after each stage, from the thread running it; memory=True traces the allocations,
+    # which slows down the fetchers noticeably
+    with _hooks_lock:
+        _hooks.append(hook)
+        if memory:
+            _traced[1]+=1
+            if _traced[1]==1 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _traced[0]=True
+    return(hook)
+
+
+
+def remove_hook(hook, memory=False):
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+            if memory:
+                _traced[1]-=1
+                if _traced[1]==0 and _traced[0]:
+                    tracemalloc.stop()
+                    _traced[0]=False
+
+
+
+def _emit(event):
+    for hook in tuple(_hooks):
+        hook(event)
+
+
+
+def _memory(frame):
+    # the peak of a nested stage also counts for the stage around it
+    if frame is not None and _traced[1]!=0 and tracemalloc.is_tracing():
+        frame['peak']=max(frame['peak'], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+
+
+@contextmanager
+def stage(name, **info):
+    # the body may fill info['bytes'] and info['records'] of the event
+    if len(_hooks)==0:
+        yield info
+        return
+    stack=_stack()
+    _memory(stack[-1] if len(stack)!=0 else None)
+    tracing=_traced[1]!=0 and tracemalloc.is_tracing()
+    current=tracemalloc.get_traced_memory()[0] if tracing else 0
+    frame={'child':0.0, 'peak':current}
+    stack.append(frame)
+    wall=time.time()
+    start=time.perf_counter()
+    try:
+        yield info
+    finally:
+        seconds=time.perf_counter()-start
+        stack.pop()
+        memory=None
+        if tracing and tracemalloc.is_tracing():
+            _memory(frame)
+            memory=frame['peak']-current
+        if len(stack)!=0:
+            stack[-1]['child']+=seconds
+            stack[-1]['peak']=max(stack[-1]['peak'], frame['peak'])
+        _emit({'fetcher':_fetcher.get(), 'stage':name, 'time':wall, 'seconds':seconds, 'self_seconds':seconds-frame['child'],
+               'bytes':info.get('bytes'), 'records':info.get('records'), 'memory':memory})
+
+
+
+def timed(records, name, info):
+    # time spent producing each record of a lazy iterable, e.g. a response decoded while it is downloaded,
+    # reported as one event when it is exhausted or closed and taken out of the stage consuming it
+    if len(_hooks)==0:
+        yield from records
+        return
+    records=iter(records)
+    seconds=0.0
+    num=0
+    wall=time.time()
+    try:
+        while True:
+            start=time.perf_counter()
+            try:
+                record=next(records)
+            except StopIteration:
+                break
+            finally:
+                elapsed=time.perf_counter()-start
+                seconds+=elapsed
+                stack=_stack()
+                if len(stack)!=0:
+                    stack[-1]['child']+=elapsed
+            num+=1
+            yield record
+    finally:
+        _emit({'fetcher':_fetcher.get(), 'stage':name, 'time':wall, 'seconds':seconds, 'self_seconds':seconds,
+               'bytes':info.get('bytes'), 'records':num, 'memory':None})
+
+
+
+def counted(chunks, info):
+    # bytes of a streamed body, added to info['bytes'] as they are read
+    info['bytes']=0
+    for chunk in chunks:
+        info['bytes']+=len(chunk)
+        yield chunk
+
+
+
+def profiled(fetcher):
+    # the events of a fetcher carry its name, and the whole call is reported as the stage 'total'
+    @functools.wraps(fetcher)
+    def wrapper(*args, **kwargs):
+        if len(_hooks)==0:
+            return(fetcher(*args, **kwargs))
+        reset=_fetcher.set(fetcher.__name__)
+        try:
+            with stage("total") as info:
+                result=fetcher(*args, **kwargs)
+                info['records']=len(result) if hasattr(result, '__len__') else None
+                return(result)
+        finally:
+            _fetcher.reset(reset)
+    return(wrapper)
+
+
+
+class Profiler:
+    # collects the events while it is a hook, e.g.
+    #   with metrics.profile() as profiler:
+    #       tdx.Bus_Schedule(access_token, "Taipei", out="schedule.csv")
+    #   print(profiler.summary())
+    def __init__(self, memory=False):
+        self.memory=memory
+        self.events=[]
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def to_frame(self):
+        return(pd.DataFrame(list(self.events), columns=['fetcher','stage','time','seconds','self_seconds','bytes','records','memory']))
+
+    def summary(self):
+        # per fetcher and stage: calls, total and self seconds, bytes, records and the largest memory peak;
+        # the self seconds of the stages of one fetcher add up to its 'total'
+        data=self.to_frame()
+        data['fetcher']=data.fetcher.fillna("")
+        data['stage']=pd.Categorical(data.stage, categories=STAGES+sorted(set(data.stage)-set(STAGES)), ordered=True)
+        total=lambda x: x.sum(min_count=1)
+        return(data.groupby(['fetcher','stage'], observed=True).agg(calls=('seconds','size'), seconds=('seconds','sum'), self_seconds=('self_seconds','sum'),
+                                                                     bytes=('bytes',total), records=('records',total), memory=('memory','max')))
+
+    def export(self, out):
+        from .export import write_out
+        write_out(self.to_frame(), out)
+        return(out)
+
+    def clear(self):
+        self.events=[]
+
+
+
+@contextmanager
+def profile(hook=None, memory=False):
+    # a Profiler collecting the events of the block, and 'hook' called with each of them, e.g. to send them to a metrics backend
+    profiler=Profiler(memory)
+    add_hook(profiler, memory)
+    if hook is not None:
+        add_hook(hook)
+    try:
+        yield profiler
+    finally:
+        if hook is not None:
+            remove_hook(hook)
+        remove_hook(profiler, memory)
+
+
+
+def log_hook(logger=None, level=logging.INFO):
+    # structured logging: one JSON line per event, which is also attached to the record as 'tdx_event'
+    logger=logger if logger is not None else logging.getLogger("nycu_tdx_py")
+    def hook(event):
+        logger.log(level, json.dumps(event, default=str), extra={'tdx_event':event})
+    return(hook)
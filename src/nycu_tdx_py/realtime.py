@@ -0,0 +1,264 @@
+import os
+import shutil
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+import numpy as np
+import pandas as pd
+from . import tdx
+from .client import get_client, TDXError
+from .flatten import flatten
+from .dtypes import fixed_dtypes
+from .metrics import stage
+
+
+# continuous snapshots of the real-time bus data of every county, e.g.
+#   poller=realtime.Poller(access_token, records=["position","eta"], path="bus_realtime")
+#   poller.run(hours=24)
+#   taipei=realtime.read_realtime("bus_realtime", "position", start="2024-01-01 08:00", end="2024-01-01 09:00", county="Taipei")
+# every poll sends conditional requests and keeps only the rows that changed since the previous poll; they are
+# buffered and written every 'flush_interval' seconds as one Parquet file per record and day, e.g.
+#   bus_realtime/position/date=2024-01-01/part-083000-000001.parquet
+# so that a day of national positions takes little disk and a query reads only the days and row groups it needs
+
+TIMEZONE="Asia/Taipei"
+
+# columns identifying one row of each record, a row is stored again only when its other columns change
+REALTIME_KEYS={'position':['PlateNumb'],
+               'nearstop':['PlateNumb'],
+               'eta':['RouteUID','SubRouteUID','Direction','StopUID']}
+
+# columns renewed by TDX on every upload, which alone do not make a change
+REALTIME_VOLATILE=['UpdateTime','DataTime']
+
+# storage types of the Parquet files, the same in every file so that the days can be read as one dataset
+REALTIME_TIMES=['GPSTime','UpdateTime','DataTime','NextBusTime']
+REALTIME_DTYPES={'Direction':'Int8', 'StopSequence':'Int16', 'PositionLon':'float32', 'PositionLat':'float32', 'Speed':'float32', 'Azimuth':'float32',
+                 'DutyStatus':'Int8', 'BusStatus':'Int8', 'A2EventType':'Int8', 'EstimateTime':'Int32', 'StopStatus':'Int8', 'IsLastBus':'boolean'}
+
+# rows of a Parquet row group, whose statistics let read_realtime() skip the groups of other counties and routes
+ROW_GROUP_SIZE=32*1024
+
+
+
+def _hash(data, columns):
+    if len(columns)==0:
+        return(np.zeros(len(data), dtype=np.uint64))
+    return(pd.util.hash_pandas_object(data[columns], index=False).to_numpy())
+
+
+
+class _Changes:
+    # hash of every row by its key at the previous poll; rows that left the feed are forgotten,
+    # so a bus back on the road is stored again
+    def __init__(self, keys):
+        self.keys=keys
+        self.previous=pd.Index(np.array([], dtype=np.uint64))
+        self.values=np.array([], dtype=np.uint64)
+
+    def __call__(self, data):
+        keys=[i for i in self.keys if i in data.columns]
+        values=[i for i in data.columns if i not in keys and i not in REALTIME_VOLATILE]
+        key=_hash(data, keys)
+        last=~pd.Series(key).duplicated(keep="last").to_numpy()
+        data, key=data[last], key[last]
+        value=_hash(data, values)
+        position=self.previous.get_indexer(key)
+        changed=position==-1
+        changed[~changed]=self.values[position[~changed]]!=value[~changed]
+        self.previous=pd.Index(key)
+        self.values=value
+        return(data[changed])
+
+
+
+def _timestamp(value):
+    # times without a zone are taken in Taiwan time
+    if value is None:
+        return(None)
+    value=pd.Timestamp(value)
+    return(value.tz_localize(TIMEZONE) if value.tzinfo is None else value.tz_convert(TIMEZONE))
+
+
+
+def _keys(values, label_id):
+    # RouteUID or StopUID given as a list or as the output of Bus_Route or Bus_StopOfRoute
+    if values is None:
+        return(None)
+    if isinstance(values, pd.DataFrame):
+        values=values[label_id]
+    return(set(values))
+
+
+
+class Poller:
+    # polls Bus_RealTime of every record and county every 'interval' seconds; 'routes' and 'stops' keep only those RouteUID and StopUID,
+    # 'keep_days' drops the days older than that from 'path' like a ring buffer
+    def __init__(self, access_token, counties=None, records=("position","eta"), path="bus_realtime", interval=20, flush_interval=300,
+                 routes=None, stops=None, keep_days=None, max_workers=8):
+        counties=list(tdx.tdx_county().Code) if counties is None else list(counties)
+        invalid=[i for i in counties if i not in list(tdx.tdx_county().Code)]+[i for i in records if i not in tdx.BUS_REALTIME_API]
+        if len(invalid)!=0:
+            raise ValueError("'"+"', '".join(invalid)+"' is not valid county or real-time record.")
+        self.access_token=access_token
+        self.counties=counties
+        self.records=list(records)
+        self.path=path
+        self.interval=interval
+        self.flush_interval=flush_interval
+        self.routes=_keys(routes, 'RouteUID')
+        self.stops=_keys(stops, 'StopUID')
+        self.keep_days=keep_days
+        self.max_workers=max_workers
+        self.validators=dict()
+        self.changes={(record, county):_Changes(REALTIME_KEYS[record]) for record in self.records for county in self.counties}
+        self.buffer={record:[] for record in self.records}
+        self.stats={'polls':0, 'requests':0, 'not_modified':0, 'errors':0, 'rows':0, 'changed':0, 'files':0}
+        self.flushed=time.monotonic()
+        self.parts=0
+        self.lock=threading.Lock()
+        self._stop=threading.Event()
+        self._thread=None
+
+    def _poll(self, record, county, poll_time):
+        url=tdx._bus_realtime_url(county, record)
+        js_data, self.validators[(record, county)]=get_client().get_json_changed(url, self.access_token, self.validators.get((record, county)))
+        if js_data is None:
+            return(None, 0)
+        if isinstance(js_data, dict):
+            raise TDXError(str(js_data.get('Message', js_data))[:300])
+        data=flatten(js_data, tdx.BUS_REALTIME_SPEC[record])
+        if self.routes is not None:
+            data=data[data.RouteUID.isin(self.routes)]
+        if self.stops is not None and 'StopUID' in data.columns:
+            data=data[data.StopUID.isin(self.stops)]
+        rows=len(data)
+        data=self.changes[(record, county)](data)
+        return(data.assign(PollTime=poll_time, County=county), rows)
+
+    def poll(self):
+        # one request for every record and county, returns the changed rows of each record
+        poll_time=pd.Timestamp.now(tz=TIMEZONE).floor("s")
+        tasks=[(record, county) for record in self.records for county in self.counties]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures=[executor.submit(copy_context().run, self._poll, record, county, poll_time) for record, county in tasks]
+            results=[]
+            for (record, county), future in zip(tasks, futures):
+                try:
+                    results.append((record, future.result()))
+                except Exception as e:
+                    # a failed request or a payload that cannot be parsed loses only this county, whose next request asks
+                    # for the whole data again rather than a 304 for the data that was lost
+                    self.stats['errors']+=1
+                    self.validators.pop((record, county), None)
+                    warnings.warn(county+" "+record+": "+(str(e) if isinstance(e, TDXError) else type(e).__name__+": "+str(e)), UserWarning)
+
+        changes={record:[] for record in self.records}
+        for record, (data, rows) in results:
+            if data is None:
+                self.stats['not_modified']+=1
+                continue
+            self.stats['rows']+=rows
+            self.stats['changed']+=len(data)
+            if len(data)!=0:
+                changes[record].append(data)
+        self.stats['polls']+=1
+        self.stats['requests']+=len(tasks)
+        changes={record:pd.concat(frames, ignore_index=True) if len(frames)!=0 else None for record, frames in changes.items()}
+        with self.lock:
+            for record, data in changes.items():
+                if data is not None:
+                    self.buffer[record].append(data)
+        if time.monotonic()-self.flushed>=self.flush_interval:
+            self.flush()
+        return(changes)
+
+    def flush(self):
+        # writes the buffered rows, one file per record and day of the poll
+        with self.lock:
+            buffer, self.buffer=self.buffer, {record:[] for record in self.records}
+            self.flushed=time.monotonic()
+            for record, frames in buffer.items():
+                if len(frames)==0:
+                    continue
+                data=fixed_dtypes(pd.concat(frames, ignore_index=True), REALTIME_DTYPES, REALTIME_TIMES, TIMEZONE)
+                # rows of one county and route next to each other compress better and let the readers skip row groups
+                data=data.sort_values([i for i in ['County','RouteUID','PollTime'] if i in data.columns], kind="stable")
+                for date, day in data.groupby(data.PollTime.dt.normalize(), sort=True):
+                    folder=os.path.join(self.path, record, "date="+date.strftime("%Y-%m-%d"))
+                    os.makedirs(folder, exist_ok=True)
+                    self.parts+=1
+                    out=os.path.join(folder, "part-"+day.PollTime.min().strftime("%H%M%S")+"-"+"%06d" % self.parts+".parquet")
+                    # plain strings rather than categories: every file has the same schema whatever its content
+                    with stage("export", records=len(day)) as info:
+                        day.to_parquet(out, index=False, compression="zstd", row_group_size=ROW_GROUP_SIZE)
+                        info['bytes']=os.path.getsize(out)
+                    self.stats['files']+=1
+            if self.keep_days is not None:
+                self._drop_days()
+
+    def _drop_days(self):
+        first=(pd.Timestamp.now(tz=TIMEZONE)-pd.Timedelta(days=self.keep_days)).strftime("%Y-%m-%d")
+        for record in self.records:
+            folder=os.path.join(self.path, record)
+            for name in os.listdir(folder) if os.path.isdir(folder) else []:
+                if name.startswith("date=") and name[5:]<first:
+                    shutil.rmtree(os.path.join(folder, name), ignore_errors=True)
+
+    def run(self, hours=None, polls=None):
+        # polls every 'interval' seconds until stop(), 'hours' or the number of 'polls', then writes the buffer
+        end=time.monotonic()+hours*3600 if hours is not None else None
+        num=0
+        try:
+            while not self._stop.is_set():
+                start=time.monotonic()
+                self.poll()
+                num+=1
+                if (polls is not None and num>=polls) or (end is not None and start+self.interval>=end):
+                    break
+                self._stop.wait(max(0.0, self.interval-(time.monotonic()-start)))
+        finally:
+            self.flush()
+        return(self.stats)
+
+    def start(self, hours=None):
+        # run() in a background thread
+        self._stop.clear()
+        self._thread=threading.Thread(target=copy_context().run, args=(self.run, hours), daemon=True)
+        self._thread.start()
+        return(self)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread=None
+        return(self.stats)
+
+
+
+def read_realtime(path, record="position", start=None, end=None, county=None, routes=None, stops=None):
+    # the stored rows of one record polled between 'start' and 'end', reading only those days and the matching row groups
+    folder=os.path.join(path, record)
+    if not os.path.isdir(folder):
+        return(warnings.warn("'"+folder+"' does not contain any real-time record.", UserWarning))
+    start, end=_timestamp(start), _timestamp(end)
+    days=sorted([name for name in os.listdir(folder) if name.startswith("date=")])
+    days=[name for name in days if (start is None or name[5:]>=start.strftime("%Y-%m-%d")) and (end is None or name[5:]<=end.strftime("%Y-%m-%d"))]
+    filters=[]
+    if start is not None:
+        filters.append(('PollTime', '>=', start))
+    if end is not None:
+        filters.append(('PollTime', '<=', end))
+    if county is not None:
+        filters.append(('County', 'in', [county] if isinstance(county, str) else list(county)))
+    for label_id, values in [('RouteUID', _keys(routes, 'RouteUID')), ('StopUID', _keys(stops, 'StopUID'))]:
+        if values is not None:
+            filters.append((label_id, 'in', list(values)))
+    frames=[pd.read_parquet(os.path.join(folder, name), filters=filters if len(filters)!=0 else None) for name in days]
+    frames=[i for i in frames if len(i)!=0]
+    if len(frames)==0:
+        return(None)
+    return(pd.concat(frames, ignore_index=True).sort_values('PollTime', kind="stable").reset_index(drop=True))
@@ -0,0 +1,288 @@
+import json
+import os
+import shutil
+import tempfile
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from .lazy import LazyModule
+from .timetable import ID_COLUMNS, _departures, _seconds, _weekday
+
+
+spatial=LazyModule("nycu_tdx_py.spatial")
+
+
+# travel times over the bus and rail timetables with walking transfers, e.g.
+#   router=routing.Router.from_frames({'TRA':tra_general, 'Taipei':bus_stoptimes}, {'TRA':tra_station, 'Taipei':bus_stops})
+#   router.earliest_arrival("Taipei:TPE38353", "08:00", "Monday")
+#   matrix=router.travel_times(origins, "08:00", "Monday", max_workers=8)
+# every pair of consecutive stops of a trip is a connection, kept in flat arrays sorted by departure time; a query scans
+# them once from its departure time (connection scan), walking from a reached stop to the stops within 'max_walk' metres
+
+# metres per second of a walk, and the longest walk between two stops in metres
+WALK_SPEED=1.2
+MAX_WALK=500
+
+# seconds between arriving at a stop by one vehicle and leaving it by another, a walk to another stop is not added to it
+MIN_TRANSFER=60
+
+# columns identifying a trip of the timetables, together with its service days
+TRIP_COLUMNS=['RouteUID','SubRouteUID','Direction','TrainNo','TripID']
+
+DAY=86400
+ARRAYS=['stop_ids','lon','lat','dep_stop','arr_stop','dep_time','arr_time','trip','mask','foot_offsets','foot_stop','foot_time']
+
+
+
+def _named(frames):
+    # a frame, a list of them, or a dict of them whose ids are prefixed by its keys, e.g. 'TRA:1000' and 'THSR:1000'
+    if isinstance(frames, pd.DataFrame):
+        return([(None, frames)])
+    if isinstance(frames, dict):
+        return(list(frames.items()))
+    return([(None, i) for i in frames])
+
+
+
+def _ids(name, values):
+    values=pd.Series(values).astype(str)
+    return((values if name is None else name+":"+values).to_numpy())
+
+
+
+def _connections(data, name, number):
+    # consecutive stops of every trip of one timetable, with the times past midnight counted from the day the trip starts
+    if 'StopSequence' not in data.columns:
+        raise ValueError("The timetable must list the stops of each trip, e.g. Rail_TimeTable(record='general') or Bus_Schedule(stoptimes=True).")
+    keys=[i for i in TRIP_COLUMNS if i in data.columns]
+    stops=_departures(data, None, keys+['StopSequence']).reset_index(drop=True)
+    # a trip is a run of rows, as the timetable lists them, with the same keys and service days and increasing stop sequences,
+    # so that the rows of different trips are never joined when a TripID or TrainNo is missing
+    sequence=pd.to_numeric(stops.StopSequence, errors="coerce").to_numpy(dtype=np.float64)
+    start=np.ones(len(stops), dtype=bool)
+    start[1:]=~(sequence[1:]>sequence[:-1])
+    for codes in [pd.factorize(stops[i])[0] for i in keys]+[stops['mask'].to_numpy()]:
+        start[1:]|=codes[1:]!=codes[:-1]
+    stops['trip']=np.cumsum(start)-1+number
+    same=np.concatenate([[False], stops.trip.to_numpy()[1:]==stops.trip.to_numpy()[:-1]])
+    departure=stops.departure.to_numpy()
+    days=pd.Series(same & (departure<np.concatenate([[0], departure[:-1]]))).groupby(stops.trip.to_numpy()).cumsum().to_numpy()
+    departure=departure+days*DAY
+    arrival=np.where(stops.arrival.to_numpy()>=0, stops.arrival.to_numpy()+days*DAY, departure)
+    arrival=np.where(arrival>departure, arrival-DAY, arrival)
+    row=np.nonzero(same[1:])[0]
+    return(pd.DataFrame({'dep_stop':_ids(name, stops.station.to_numpy()[row]), 'arr_stop':_ids(name, stops.station.to_numpy()[row+1]),
+                         'dep_time':departure[row], 'arr_time':arrival[row+1], 'trip':stops.trip.to_numpy()[row], 'mask':stops['mask'].to_numpy()[row]}))
+
+
+
+def _scan(router, seeds, seconds, weekday, max_duration):
+    # earliest arrival at every stop leaving at 'seconds' on 'weekday', from the stops of 'seeds' reached after walking their seconds;
+    # one walk follows each ride, from the earliest arrival by a vehicle at a stop, and another vehicle leaves a stop
+    # 'min_transfer' seconds after a ride arrives there at the earliest ('ready')
+    dep_stop, arr_stop, dep_time, arr_time, trip=router._day(weekday)
+    foot_offsets, foot_stop, foot_time=router._footpaths()
+    transfer=router.min_transfer
+    end=seconds+max_duration
+    arrival=[end+1]*len(router.stop_ids)
+    riding=list(arrival)
+    ready=list(arrival)
+    reached=bytearray(router.trips)
+    for stop, walk in seeds:
+        arrival[stop]=min(arrival[stop], seconds+walk)
+        ready[stop]=arrival[stop]
+    for i in range(bisect_left(dep_time, seconds), len(dep_time)):
+        time=dep_time[i]
+        if time>end:
+            break
+        j=trip[i]
+        if reached[j] or ready[dep_stop[i]]<=time:
+            reached[j]=1
+            time=arr_time[i]
+            stop=arr_stop[i]
+            if time<riding[stop]:
+                riding[stop]=time
+                if time<arrival[stop]:
+                    arrival[stop]=time
+                if time+transfer<ready[stop]:
+                    ready[stop]=time+transfer
+                for k in range(foot_offsets[stop], foot_offsets[stop+1]):
+                    walk=time+foot_time[k]
+                    if walk<arrival[foot_stop[k]]:
+                        arrival[foot_stop[k]]=walk
+                    if walk<ready[foot_stop[k]]:
+                        ready[foot_stop[k]]=walk
+    arrival=np.array(arrival, dtype=np.float64)-seconds
+    arrival[arrival>max_duration]=np.nan
+    return(arrival)
+
+
+
+_worker_router=None
+
+
+def _init_worker(path):
+    # every worker memory-maps the saved router, the pages are shared by the processes
+    global _worker_router
+    _worker_router=Router.load(path)
+
+
+
+def _worker_scan(task):
+    seeds, seconds, weekday, max_duration, destinations=task
+    return([_scan(_worker_router, i, seconds, weekday, max_duration)[destinations] for i in seeds])
+
+
+
+class Router:
+    # the connections of the timetables sorted by departure time ('dep_stop', 'arr_stop', 'dep_time', 'arr_time' in seconds, 'trip'
+    # and its service-day 'mask'), and the walks between stops ('foot_offsets' into 'foot_stop' and 'foot_time')
+    def __init__(self, stop_ids, lon, lat, dep_stop, arr_stop, dep_time, arr_time, trip, mask, foot_offsets, foot_stop, foot_time, walk_speed=WALK_SPEED, max_walk=MAX_WALK,
+                 min_transfer=MIN_TRANSFER):
+        self.stop_ids=stop_ids
+        self.lon=lon
+        self.lat=lat
+        self.dep_stop=dep_stop
+        self.arr_stop=arr_stop
+        self.dep_time=dep_time
+        self.arr_time=arr_time
+        self.trip=trip
+        self.mask=mask
+        self.foot_offsets=foot_offsets
+        self.foot_stop=foot_stop
+        self.foot_time=foot_time
+        self.walk_speed=walk_speed
+        self.max_walk=max_walk
+        self.min_transfer=min_transfer
+        self.trips=int(trip.max())+1 if len(trip)!=0 else 0
+        self.path=None
+        self._days=dict()
+        self._foot=None
+        self._index=None
+        self._stop_index=None
+
+    @classmethod
+    def from_frames(cls, timetables, stops, walk_speed=WALK_SPEED, max_walk=MAX_WALK, min_transfer=MIN_TRANSFER):
+        # 'timetables' of Rail_TimeTable(record="general") and Bus_Schedule(stoptimes=True), 'stops' with their coordinates
+        # from Rail_Station and Bus_StopOfRoute; a dict of each, by the same keys, prefixes the ids of the stops by its key
+        connections=[]
+        number=0
+        for name, data in _named(timetables):
+            connections.append(_connections(data, name, number))
+            number=int(connections[-1].trip.max())+1 if len(connections[-1])!=0 else number
+        connections=pd.concat(connections, ignore_index=True)
+        stop_ids, codes=np.unique(np.concatenate([connections.dep_stop.to_numpy(), connections.arr_stop.to_numpy()]).astype(str), return_inverse=True)
+        dep_stop, arr_stop=codes[:len(connections)], codes[len(connections):]
+        order=np.lexsort((connections.arr_time.to_numpy(), connections.dep_time.to_numpy()))
+
+        # the coordinates of the stops, those without any take no walks
+        positions=[]
+        for name, data in _named(stops):
+            id_col=next((i for i in ID_COLUMNS if i in data.columns), None)
+            positions.append(pd.DataFrame({'stop':_ids(name, data[id_col].to_numpy()), 'lon':pd.to_numeric(data.PositionLon, errors="coerce").to_numpy(),
+                                           'lat':pd.to_numeric(data.PositionLat, errors="coerce").to_numpy()}))
+        positions=pd.concat(positions, ignore_index=True).dropna().drop_duplicates(subset='stop').set_index('stop').reindex(stop_ids)
+        lon, lat=positions.lon.to_numpy(), positions.lat.to_numpy()
+        located=np.nonzero(~np.isnan(lon))[0]
+        if len(located)!=0:
+            query, stop, distance=spatial.StopIndex(lon[located], lat[located]).within(lon[located], lat[located], max_walk)
+            query, stop=located[query], located[stop]
+            walk=query!=stop
+            query, stop, distance=query[walk], stop[walk], distance[walk]
+        else:
+            query, stop, distance=np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([])
+        foot_offsets=np.concatenate([[0], np.cumsum(np.bincount(query, minlength=len(stop_ids)))]).astype(np.int64)
+        return(cls(stop_ids, lon, lat, dep_stop[order].astype(np.int32), arr_stop[order].astype(np.int32), connections.dep_time.to_numpy()[order].astype(np.int32),
+                   connections.arr_time.to_numpy()[order].astype(np.int32), connections.trip.to_numpy()[order].astype(np.int32), connections['mask'].to_numpy()[order].astype(np.uint8),
+                   foot_offsets, stop.astype(np.int32), np.ceil(distance/walk_speed).astype(np.int32), walk_speed, max_walk, min_transfer))
+
+    def __len__(self):
+        return(len(self.dep_time))
+
+    def _day(self, weekday):
+        # the connections running on 'weekday' as lists, which the scan reads faster than arrays; a trip starting the day before
+        # and running past midnight is not included
+        if weekday not in self._days:
+            keep=((self.mask.astype(np.int64)>>weekday)&1)==1
+            self._days[weekday]=tuple([i[keep].tolist() for i in [self.dep_stop, self.arr_stop, self.dep_time, self.arr_time, self.trip]])
+        return(self._days[weekday])
+
+    def _footpaths(self):
+        if self._foot is None:
+            self._foot=(self.foot_offsets.tolist(), self.foot_stop.tolist(), self.foot_time.tolist())
+        return(self._foot)
+
+    def _seeds(self, origins):
+        # the stops to start from for each origin and the seconds walked to them: a stop id and the stops within 'max_walk' of it, or the
+        # stops within 'max_walk' of a point in the columns PositionLon and PositionLat
+        if isinstance(origins, pd.DataFrame):
+            located=np.nonzero(~np.isnan(self.lon))[0]
+            if self._stop_index is None:
+                self._stop_index=spatial.StopIndex(self.lon[located], self.lat[located])
+            query, stop, distance=self._stop_index.within(origins.PositionLon.to_numpy(dtype=float), origins.PositionLat.to_numpy(dtype=float), self.max_walk)
+            walk=np.ceil(distance/self.walk_speed).astype(np.int64)
+            seeds=[[] for i in range(len(origins))]
+            for i, j, k in zip(query.tolist(), located[stop].tolist(), walk.tolist()):
+                seeds[i].append((j, k))
+            return(seeds, origins.index)
+        if self._index is None:
+            self._index=pd.Index(self.stop_ids, dtype=object)
+        origins=np.atleast_1d(np.asarray(origins, dtype=object))
+        code=self._index.get_indexer(pd.Index(origins, dtype=object))
+        foot_offsets, foot_stop, foot_time=self._footpaths()
+        seeds=[[(i, 0)]+[(foot_stop[k], foot_time[k]) for k in range(foot_offsets[i], foot_offsets[i+1])] if i>=0 else [] for i in code.tolist()]
+        return(seeds, origins)
+
+    def earliest_arrival(self, origin, time, weekday=None, max_duration=2*3600):
+        # seconds from 'origin' (a stop id) leaving at 'time' ('HH:MM', seconds or a datetime) to every stop reached within 'max_duration'
+        seeds, labels=self._seeds([origin])
+        arrival=_scan(self, seeds[0], _seconds(time), _weekday(weekday, time), max_duration)
+        arrival=pd.Series(arrival, index=self.stop_ids, name="TravelTime")
+        return(arrival.dropna())
+
+    def travel_times(self, origins, time, weekday=None, destinations=None, max_duration=2*3600, max_workers=None, chunksize=16):
+        # seconds from every origin (stop ids, or a data frame of PositionLon and PositionLat) to every destination (all the stops by default),
+        # NaN where not reached within 'max_duration'; 'max_workers' processes share the queries
+        seeds, labels=self._seeds(origins)
+        seconds, weekday=_seconds(time), _weekday(weekday, time)
+        if destinations is None:
+            columns, destinations=self.stop_ids, np.arange(len(self.stop_ids))
+        else:
+            columns=np.asarray(destinations, dtype=object)
+            destinations=pd.Index(self.stop_ids, dtype=object).get_indexer(pd.Index(columns, dtype=object))
+        matrix=np.full((len(seeds), len(columns)), np.nan, dtype=np.float32)
+        found=destinations>=0
+        if max_workers is None or max_workers<=1:
+            for i, seed in enumerate(seeds):
+                matrix[i, found]=_scan(self, seed, seconds, weekday, max_duration)[destinations[found]]
+        else:
+            # the workers load the saved router rather than receiving a copy of its arrays
+            path=self.path if self.path is not None else self.save(tempfile.mkdtemp())
+            try:
+                tasks=[(seeds[i:i+chunksize], seconds, weekday, max_duration, destinations[found]) for i in range(0, len(seeds), chunksize)]
+                with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(path,)) as executor:
+                    for i, rows in zip(range(0, len(seeds), chunksize), executor.map(_worker_scan, tasks)):
+                        matrix[i:i+len(rows), found]=np.array(rows)
+            finally:
+                if self.path is None:
+                    shutil.rmtree(path, ignore_errors=True)
+        return(pd.DataFrame(matrix, index=labels, columns=columns))
+
+    def save(self, path):
+        # plain .npy files, so that load() can memory-map them and worker processes share the pages
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(path, name+".npy"), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(path, "index.json"), "w") as f:
+            json.dump({'walk_speed':self.walk_speed, 'max_walk':self.max_walk, 'min_transfer':self.min_transfer, 'size':len(self)}, f)
+        return(path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, "index.json")) as f:
+            meta=json.load(f)
+        arrays={name:np.load(os.path.join(path, name+".npy"), mmap_mode="r" if mmap else None) for name in ARRAYS}
+        router=cls(walk_speed=meta['walk_speed'], max_walk=meta['max_walk'], min_transfer=meta.get('min_transfer', MIN_TRANSFER), **arrays)
+        router.path=path
+        return(router)
@@ -0,0 +1,122 @@
+import json
+import os
+import numpy as np
+import shapely
+from pyproj import Transformer
+
+
+# TWD97 / TM2 zone 121, metres across Taiwan
+METRIC_CRS="EPSG:3826"
+
+# columns identifying a stop or station in the outputs of Bus_StopOfRoute, Rail_Station and Bike_Station
+ID_COLUMNS=['StopUID','StationUID','StationID','StopID']
+
+
+
+class StopIndex:
+    # stops and stations projected to metres and packed into an STRtree, answering batches of queries given in longitude and latitude
+    def __init__(self, lon, lat, ids=None, crs=METRIC_CRS):
+        self.crs=crs
+        self.transformer=Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+        self.xy=np.column_stack(self.transformer.transform(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)))
+        self.ids=np.asarray(ids if ids is not None else np.arange(len(self.xy))).astype(str)
+        self._tree=None
+
+    @classmethod
+    def from_frame(cls, data, id_col=None, crs=METRIC_CRS):
+        # a stop served by several routes is indexed once
+        if id_col is None:
+            id_col=next((i for i in ID_COLUMNS if i in data.columns), None)
+        if id_col is not None:
+            data=data.drop_duplicates(subset=id_col)
+        if 'PositionLon' in data.columns:
+            lon, lat=data.PositionLon.to_numpy(dtype=float), data.PositionLat.to_numpy(dtype=float)
+        else:
+            lon, lat=shapely.get_x(data.geometry.to_crs(4326).values), shapely.get_y(data.geometry.to_crs(4326).values)
+        return(cls(lon, lat, data[id_col].to_numpy() if id_col is not None else None, crs))
+
+    def __len__(self):
+        return(len(self.xy))
+
+    @property
+    def tree(self):
+        # built on first use, from the memory-mapped coordinates after load()
+        if self._tree is None:
+            self._tree=shapely.STRtree(shapely.points(self.xy))
+        return(self._tree)
+
+    def _project(self, lon, lat):
+        x, y=self.transformer.transform(np.atleast_1d(np.asarray(lon, dtype=float)), np.atleast_1d(np.asarray(lat, dtype=float)))
+        return(np.column_stack([x, y]))
+
+    def _distance(self, xy, query, stop):
+        return(np.hypot(xy[query,0]-self.xy[stop,0], xy[query,1]-self.xy[stop,1]))
+
+    def _within(self, xy, radius):
+        pairs=self.tree.query(shapely.points(xy), predicate="dwithin", distance=radius)
+        distance=self._distance(xy, pairs[0], pairs[1])
+        order=np.lexsort((distance, pairs[0]))
+        return(pairs[0][order], pairs[1][order], distance[order])
+
+    def within(self, lon, lat, radius):
+        # every stop within 'radius' metres: arrays of query position, stop position and distance, sorted by query then distance
+        return(self._within(self._project(lon, lat), radius))
+
+    def _nearest(self, xy, k, max_distance):
+        num=len(xy)
+        index=np.full((num, k), -1, dtype=np.int64)
+        distance=np.full((num, k), np.inf)
+        (query, stop), dist=self.tree.query_nearest(shapely.points(xy), max_distance=max_distance, return_distance=True, all_matches=False)
+        index[query,0]=stop
+        distance[query,0]=dist
+        if k==1:
+            return(index, distance)
+
+        # the k nearest lie a little beyond the nearest one: start from the ring holding k stops at the average density
+        # and double it for the queries still short of k
+        extent=np.ptp(self.xy, axis=0)
+        step=np.full(num, max(np.sqrt(k*max(float(extent[0]*extent[1]), 1.0)/(np.pi*len(self))), 1.0))
+        diameter=float(np.hypot(*(np.maximum(self.xy.max(axis=0), xy.max(axis=0))-np.minimum(self.xy.min(axis=0), xy.min(axis=0)))))
+        limit=diameter if max_distance is None else max_distance
+        pending=query
+        while len(pending)!=0:
+            radius=np.minimum(distance[pending,0]+step[pending], limit)
+            found_query, found_stop, found_dist=self._within(xy[pending], radius)
+            found=np.bincount(found_query, minlength=len(pending))
+            first=np.concatenate([[0], np.cumsum(found)[:-1]])
+            rank=np.arange(len(found_query))-np.repeat(first, found)
+            keep=rank<k
+            index[pending[found_query[keep]], rank[keep]]=found_stop[keep]
+            distance[pending[found_query[keep]], rank[keep]]=found_dist[keep]
+            pending=pending[(found<k)&(radius<limit)]
+            step[pending]*=2
+        return(index, distance)
+
+    def nearest(self, lon, lat, k=1, max_distance=None, batch_size=100000):
+        # positions and distances of the k nearest stops, shape (queries, k); -1 and inf where fewer stops are found
+        xy=self._project(lon, lat)
+        if len(xy)==0 or len(self)==0:
+            return(np.full((len(xy), k), -1, dtype=np.int64), np.full((len(xy), k), np.inf))
+        result=[self._nearest(xy[i:i+batch_size], k, max_distance) for i in range(0, len(xy), batch_size)]
+        return(np.concatenate([i[0] for i in result]), np.concatenate([i[1] for i in result]))
+
+    def save(self, path):
+        # plain .npy files, so that load() can memory-map them and worker processes share the pages
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "xy.npy"), np.ascontiguousarray(self.xy))
+        np.save(os.path.join(path, "ids.npy"), self.ids)
+        with open(os.path.join(path, "index.json"), "w") as f:
+            json.dump({'crs':self.crs, 'size':len(self)}, f)
+        return(path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, "index.json")) as f:
+            meta=json.load(f)
+        index=cls.__new__(cls)
+        index.crs=meta['crs']
+        index.transformer=Transformer.from_crs("EPSG:4326", index.crs, always_xy=True)
+        index.xy=np.load(os.path.join(path, "xy.npy"), mmap_mode="r" if mmap else None)
+        index.ids=np.load(os.path.join(path, "ids.npy"), mmap_mode="r" if mmap else None)
+        index._tree=None
+        return(index)
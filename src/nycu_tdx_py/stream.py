@@ -0,0 +1,181 @@
+import codecs
+import json
+import re
+import numpy as np
+try:
+    import orjson
+except ImportError:
+    orjson=None
+from .flatten import _gc_paused
+
+
+_decoder=json.JSONDecoder()
+_nonspace=re.compile(r"\S")
+_number="0123456789+-.eE"
+
+
+
+def loads(content):
+    # JSON straight from the bytes of a response, skipping the charset detection and str of response.text;
+    # orjson decodes several times faster than the standard library when it is installed
+    if content[:3]==codecs.BOM_UTF8:
+        content=content[3:]
+    with _gc_paused():
+        if orjson is not None:
+            return(orjson.loads(content))
+        return(json.loads(content))
+
+
+
+class _Reader:
+    # text of a JSON document decoded chunk by chunk, only the unread tail is kept
+    def __init__(self, chunks):
+        self.chunks=iter(chunks)
+        self.decoder=codecs.getincrementaldecoder("utf-8-sig")()
+        self.text=""
+        self.pos=0
+        self.eof=False
+
+    def _more(self):
+        while not self.eof:
+            chunk=next(self.chunks, None)
+            if chunk is None:
+                text=self.decoder.decode(b"", final=True)
+                self.eof=True
+            else:
+                text=self.decoder.decode(chunk)
+            if text:
+                self.text=self.text[self.pos:]+text
+                self.pos=0
+                return(True)
+        return(False)
+
+    def peek(self):
+        # next character that is not whitespace, "" at the end of the document
+        while True:
+            match=_nonspace.search(self.text, self.pos)
+            if match is not None:
+                self.pos=match.start()
+                return(self.text[self.pos])
+            self.pos=len(self.text)
+            if not self._more():
+                return("")
+
+    def take(self, chars):
+        char=self.peek()
+        if char=="" or char not in chars:
+            raise ValueError("Expected "+" or ".join(["'"+i+"'" for i in chars])+" in the response of TDX but found '"+char+"'.")
+        self.pos+=1
+        return(char)
+
+    def value(self):
+        # a value is complete once a delimiter follows it, a number cut at the end of a chunk is not
+        self.peek()
+        while True:
+            try:
+                value, end=_decoder.raw_decode(self.text, self.pos)
+                if (end<len(self.text) and self.text[end] not in _number) or self.eof:
+                    self.pos=end
+                    return(value)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._more()
+
+    def rest(self):
+        # the bytes not read yet: the decoded tail and whatever the decoder still holds of a split character
+        return(self.text[self.pos:].encode("utf-8")+self.decoder.getstate()[0])
+
+
+
+_QUOTE, _BACKSLASH=ord('"'), ord("\\")
+_OPEN=np.zeros(256, dtype=np.int8)
+_OPEN[[ord("{"), ord("[")]]=1
+_OPEN[[ord("}"), ord("]")]]=-1
+_SPECIAL=(_OPEN!=0)
+_SPECIAL[[_QUOTE, _BACKSLASH]]=True
+
+
+def _quotes(raw, position, state):
+    # a quote is escaped by an odd run of backslashes right before it, which may start in the previous chunk
+    quote=raw[position]==_QUOTE
+    if state['backslashes']==0 and _BACKSLASH not in raw:
+        return(quote)
+    index=np.arange(len(raw))
+    last=np.maximum.accumulate(np.where(raw==_BACKSLASH, -1, index))
+    before=np.concatenate([[-1], last[:-1]])
+    run=np.where(before==-1, index+state['backslashes'], index-1-before)
+    state['backslashes']=len(raw)-1-int(last[-1]) if last[-1]!=-1 else len(raw)+state['backslashes']
+    return(quote&(run[position]%2==0))
+
+
+def _scan(data, state):
+    # positions of the brackets and quotes of 'data' with the depth after each of them, strings skipped;
+    # the state carries the depth, whether a string is open and the trailing backslashes
+    raw=np.frombuffer(data, dtype=np.uint8)
+    position=np.flatnonzero(_SPECIAL[raw])
+    quote=_quotes(raw, position, state)
+    inside=(np.cumsum(quote)+state['inside'])%2==1
+    step=np.where(inside|quote, 0, _OPEN[raw[position]])
+    depth=state['depth']+np.cumsum(step, dtype=np.int64)
+    if len(position)!=0:
+        state['depth']=int(depth[-1])
+        state['inside']=int(inside[-1])
+    return(position, step, depth)
+
+
+
+def _decode(region):
+    region=region.lstrip(b" \t\r\n,")
+    return(loads(b"["+region+b"]") if len(region)!=0 else [])
+
+
+
+def _iter_array(head, chunks):
+    # records of an array whose '[' has been read: the bytes are split after the last record completed in each chunk
+    # and all the records up to there are decoded at once, which is many times faster than one by one
+    # the bytes of the records not completed yet grow in place, a record spanning many chunks is not copied for each of them
+    state={'depth':1, 'inside':0, 'backslashes':0}
+    buffer=bytearray()
+    data=head
+    while True:
+        if len(data)!=0:
+            offset=len(buffer)
+            buffer+=data
+            position, step, depth=_scan(data, state)
+            end=np.flatnonzero((step==-1)&(depth<=1))
+            closed=end[depth[end]==0]
+            if len(closed)!=0:
+                yield from _decode(buffer[:offset+int(position[closed[0]])])
+                return
+            if len(end)!=0:
+                last=offset+int(position[end[-1]])+1
+                yield from _decode(buffer[:last])
+                del buffer[:last]
+        data=next(chunks, None)
+        if data is None:
+            raise ValueError("The response of TDX ended before the end of its records.")
+
+
+
+def iter_records(chunks, key=None):
+    # records of the top-level array of a JSON document given as chunks of bytes,
+    # or of the array under 'key' when the records are wrapped, e.g. {'UpdateTime':..., 'TrainTimetables':[...]}
+    reader=_Reader(chunks)
+    char=reader.peek()
+    if char=="{":
+        reader.take("{")
+        other=dict()
+        while reader.peek()!="}":
+            name=reader.value()
+            reader.take(":")
+            if name==key and reader.peek()=="[":
+                break
+            other[name]=reader.value()
+            if reader.peek()!="}":
+                reader.take(",")
+        else:
+            # TDX answers errors with an object such as {'Message':...}
+            raise ValueError(str(other.get('Message', other))[:300])
+    reader.take("[")
+    yield from _iter_array(reader.rest(), reader.chunks)
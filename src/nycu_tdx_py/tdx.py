@@ -1,39 +1,130 @@
 import pandas as pd
 import numpy as np
-import geopandas as gpd
-from shapely import wkt
-import requests
-import json
-from tqdm import tqdm
 import warnings
-from itertools import compress, chain
+from itertools import chain
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import ContextVar, copy_context
+from contextlib import contextmanager
+from urllib.parse import quote
+from .client import get_client, TDXError
+from .auth import token_manager
+from .flatten import flatten, Level, time_to_seconds
+from .export import valid_out, write_out, read_out
+from .dtypes import compact_dtypes
+from .metrics import stage, profiled
+from .lazy import LazyModule
+
+
+# only the 'sf' outputs and Bus_TravelTime need them
+gpd=LazyModule("geopandas")
+shapely=LazyModule("shapely")
+tqdm=LazyModule("tqdm")
+
 
 
 def get_token(client_id, client_secret):
-    json_post={'content-type':'application/x-www-form-urlencoded',
-               'grant_type':'client_credentials',
-               'client_id':client_id,
-               'client_secret':client_secret}
-    
-    if 'TDX_ACCESS_TOKEN' not in os.environ:
-        access_token=requests.post("https://tdx.transportdata.tw/auth/realms/TDXConnect/protocol/openid-connect/token", json_post)
-    else:
-        access_token=os.environ['TDX_ACCESS_TOKEN']
-        test_api=requests.get('https://tdx.transportdata.tw/api/basic/v2/Basic/City?%24format=JSON', headers={'authorization': 'Bearer '+access_token})
-        if test_api.status_code==200:
-            print('The access token in the environment is still valid. Use it!')
-            return(access_token)
-        else:
-            access_token=requests.post("https://tdx.transportdata.tw/auth/realms/TDXConnect/protocol/openid-connect/token", json_post)
+    token=token_manager(client_id, client_secret)
+    before=token.access_token
+    try:
+        access_token=token.get()
+    except TDXError as e:
+        return(warnings.warn(str(e), UserWarning))
     
-    if 'error' in json.loads(access_token.text):
-        return(warnings.warn(json.loads(access_token.text)['error_description'], UserWarning))
+    os.environ['TDX_ACCESS_TOKEN']=access_token
+    if access_token!=before and token.source=="server":
+        print('Connect Successfully! This token will expire in 1 day. It is cached and refreshed automatically before it expires.\n')
     else:
-        access_token=json.loads(access_token.text)['access_token']
-        os.environ['TDX_ACCESS_TOKEN']=access_token
-        print('Connect Successfully! This token will expire in 1 day. And it is stored temporarily in the environment.\n')
-        return(access_token)
+        print('The cached access token is still valid. Use it!')
+    return(access_token)
+
+
+
+# extra OData query options of the requests made in the current context, e.g. one page of iter_chunks()
+# or the changes since the last sync(); the state also collects the number of records and their latest UpdateTime
+_odata=ContextVar("odata", default=None)
+
+
+class _EmptyPage(Exception):
+    pass
+
+
+
+@contextmanager
+def _odata_params(**params):
+    state={'params':params, 'records':None, 'updated':None}
+    reset=_odata.set(state)
+    try:
+        yield state
+    finally:
+        _odata.reset(reset)
+
+
+
+def _with_params(url, params):
+    return(url+"".join(["&%24"+key+"="+quote(str(value), safe="") for key, value in params.items()]))
+
+
+
+def _num_records(js_data):
+    # the v3 rail APIs wrap the records in a dict, e.g. {'UpdateTime':..., 'TrainTimetables':[...]}
+    if isinstance(js_data, dict):
+        return(max([len(value) for value in js_data.values() if isinstance(value, list)], default=0))
+    return(len(js_data))
+
+
+
+def _latest(updated, record):
+    value=record.get('UpdateTime') if type(record) is dict else None
+    if value is not None and (updated is None or value>updated):
+        return(value)
+    return(updated)
+
+
+
+def _fetch_json(url, access_token):
+    state=_odata.get()
+    if state is None:
+        return(get_client().get_json(url, access_token))
+    js_data=get_client().get_json(_with_params(url, state['params']), access_token)
+    state['records']=_num_records(js_data)
+    if isinstance(js_data, list):
+        for record in js_data:
+            state['updated']=_latest(state['updated'], record)
+    if state['records']==0 and len(state['params'])!=0:
+        raise _EmptyPage()
+    return(js_data)
+
+
+
+def _track_records(records, state):
+    state['records']=0
+    for record in records:
+        state['records']+=1
+        state['updated']=_latest(state['updated'], record)
+        yield(record)
+
+
+
+def _fetch_records(url, access_token, key=None):
+    # like _fetch_json, but the records are decoded while they are downloaded and handed to the
+    # flattener one by one; the first one is read here so that a failed request raises TDXError now,
+    # a failure later in the body raises TDXError from the flattener, so it is flattened inside the same try
+    state=_odata.get()
+    if state is not None:
+        url=_with_params(url, state['params'])
+    records=get_client().iter_json(url, access_token, key)
+    first=next(records, None)
+    if first is None:
+        if state is not None:
+            state['records']=0
+            if len(state['params'])!=0:
+                raise _EmptyPage()
+        return([])
+    records=chain([first], records)
+    if state is not None:
+        records=_track_records(records, state)
+    return(records)
 
 
 
@@ -58,9 +149,99 @@ def tdx_roadclass():
     
     
     
+# layouts of the nested TDX payloads, see flatten.Level
+BUS_ROUTE_SPEC=[Level({'RouteUID':'RouteUID','RouteID':'RouteID','RouteName':('RouteName','Zh_tw'),'BusRouteType':'BusRouteType','DepartureStopNameZh':'DepartureStopNameZh','DestinationStopNameZh':'DestinationStopNameZh'}, 'SubRoutes'),
+                Level({'SubRouteUID':'SubRouteUID','SubRouteID':'SubRouteID','SubRouteName':('SubRouteName','Zh_tw'),'Direction':'Direction','OperatorIDs':'OperatorIDs','FirstBusTime':'FirstBusTime','LastBusTime':'LastBusTime'})]
+
+BUS_STOPOFROUTE_SPEC=[Level({'RouteUID':'RouteUID','RouteID':'RouteID','RouteName':('RouteName','Zh_tw'),'SubRouteUID':'SubRouteUID','SubRouteName':('SubRouteName','Zh_tw'),'SubRouteID':'SubRouteID','Direction':'Direction'}, 'Stops'),
+                      Level({'StopUID':'StopUID','StopID':'StopID','StopName':('StopName','Zh_tw'),'StationID':'StationID','StopBoarding':'StopBoarding','StopSequence':'StopSequence','PositionLon':('StopPosition','PositionLon'),'PositionLat':('StopPosition','PositionLat'),'LocationCityCode':'LocationCityCode'})]
+
+BUS_TRAVELTIME_SPEC=[Level({'RouteUID':'RouteUID','RouteID':'RouteID','SubRouteUID':'SubRouteUID','SubRouteID':'SubRouteID','Direction':'Direction'}, 'TravelTimes'),
+                     Level({'Weekday':'Weekday','StartHour':'StartHour','EndHour':'EndHour'}, 'S2STimes'),
+                     Level({'FromStopID':'FromStopID','ToStopID':'ToStopID','FromStationID':'FromStationID','ToStationID':'ToStationID','RunTime':'RunTime'})]
+
+BUS_SCHEDULE_ROUTE={'RouteUID':'RouteUID','RouteID':'RouteID','RouteName':('RouteName','Zh_tw'),'SubRouteUID':'SubRouteUID','SubRouteID':'SubRouteID','SubRouteName':('SubRouteName','Zh_tw'),'Direction':'Direction'}
+
+BUS_SCHEDULE_FREQUENCY_SPEC=[Level(BUS_SCHEDULE_ROUTE, 'Frequencys'),
+                             Level({'StartTime':'StartTime','EndTime':'EndTime','MinHeadwayMins':'MinHeadwayMins','MaxHeadwayMins':'MaxHeadwayMins'}, expand=['ServiceDay'])]
+
+BUS_SCHEDULE_TIMETABLE_SPEC=[Level(BUS_SCHEDULE_ROUTE, 'Timetables'),
+                             Level({'TripID':'TripID','StopSequence':('StopTimes',0,'StopSequence'),'StopUID':('StopTimes',0,'StopUID'),'StopID':('StopTimes',0,'StopID'),'StopName':('StopTimes',0,'StopName','Zh_tw'),'ArrivalTime':('StopTimes',0,'ArrivalTime'),'DepartureTime':('StopTimes',0,'DepartureTime')}, expand=['ServiceDay'])]
+
+BUS_SCHEDULE_STOPTIMES_SPEC=[Level(BUS_SCHEDULE_ROUTE, 'Timetables'),
+                             Level({'TripID':'TripID'}, 'StopTimes', expand=['ServiceDay']),
+                             Level({'StopSequence':'StopSequence','StopUID':'StopUID','StopID':'StopID','StopName':('StopName','Zh_tw'),'ArrivalTime':'ArrivalTime','DepartureTime':'DepartureTime'})]
+
+BUS_FARE_ROUTE={'RouteID':'RouteID','RouteName':'RouteName','OperatorID':'OperatorID','OperatorNo':'OperatorNo','SubRouteID':'SubRouteID','SubRouteName':'SubRouteName','FarePricingType':'FarePricingType','IsFreeBus':'IsFreeBus','IsForAllSubRoutes':'IsForAllSubRoutes'}
+
+BUS_FARE={'TicketType':'TicketType','FareClass':'FareClass','Price':'Price'}
+
+BUS_BUFFERZONE_SPEC=[Level(BUS_FARE_ROUTE, 'SectionFares', keep_empty=True),
+                     Level({}, 'BufferZones', keep_empty=True),
+                     Level({'SectionSequence':'SectionSequence','Direction':'Direction','OriginStopID':('FareBufferZoneOrigin','StopID'),'OriginStopName':('FareBufferZoneOrigin','StopName'),'DestinationStopID':('FareBufferZoneDestination','StopID'),'DestinationStopName':('FareBufferZoneDestination','StopName')})]
+
+BUS_SECTIONFARE_SPEC=[Level(BUS_FARE_ROUTE, 'SectionFares'),
+                      Level({}, 'Fares'),
+                      Level(BUS_FARE)]
+
+BUS_ODFARE_SPEC=[Level(BUS_FARE_ROUTE, 'ODFares', keep_empty=True),
+                 Level({'Direction':'Direction','OriginStopID':('OriginStop','StopID'),'OriginStopName':('OriginStop','StopName'),'DestinationStopID':('DestinationStop','StopID'),'DestinationStopName':('DestinationStop','StopName')}, 'Fares', keep_empty=True),
+                 Level(BUS_FARE)]
+
+BUS_STAGEFARE_SPEC=[Level(BUS_FARE_ROUTE, 'StageFares'),
+                    Level({'Direction':'Direction','OriginStopID':('OriginStage','StopID'),'OriginStopName':('OriginStage','StopName'),'OriginSequence':('OriginStage','Sequence'),'DestinationStopID':('DestinationStage','StopID'),'DestinationStopName':('DestinationStage','StopName'),'DestinationSequence':('DestinationStage','Sequence')}, 'Fares'),
+                    Level(BUS_FARE)]
+
+TRA_STATIONTIMETABLE_SPEC=[Level({'StationName':('StationName','Zh_tw')}, 'Timetables', expand=[(),'ServiceDay'], exclude=['Timetables','ServiceDay']),
+                           Level({'Sequence':'Sequence','TrainNo':'TrainNo','DestinationStationID':'DestinationStationID','DestinationStationName':('DestinationStationName','Zh_tw'),'TrainTypeID':'TrainTypeID','TrainTypeCode':'TrainTypeCode','TrainTypeName':('TrainTypeName','Zh_tw'),'ArrivalTime':'ArrivalTime','DepartureTime':'DepartureTime'})]
+
+METRO_STATIONTIMETABLE_SPEC=[Level({'StationName':('StationName','Zh_tw'),'DestinationStationName':('DestinationStationName','Zh_tw')}, 'Timetables', expand=[(),'ServiceDay'], exclude=['Timetables','ServiceDay','SrcUpdateTime','UpdateTime','VersionID']),
+                             Level({'Sequence':'Sequence','ArrivalTime':'ArrivalTime','DepartureTime':'DepartureTime'})]
+
+TRA_GENERALTIMETABLE_SPEC=[Level({'TrainTypeName':('TrainInfo','TrainTypeName','Zh_tw'),'StartingStationName':('TrainInfo','StartingStationName','Zh_tw'),'EndingStationName':('TrainInfo','EndingStationName','Zh_tw')}, 'StopTimes', expand=['TrainInfo','ServiceDay']),
+                           Level({'StopSequence':'StopSequence','StationID':'StationID','StationName':('StationName','Zh_tw'),'ArrivalTime':'ArrivalTime','DepartureTime':'DepartureTime'})]
+
+THSR_GENERALTIMETABLE_SPEC=[Level({'StartingStationName':('GeneralTimetable','GeneralTrainInfo','StartingStationName','Zh_tw'),'EndingStationName':('GeneralTimetable','GeneralTrainInfo','EndingStationName','Zh_tw')}, ('GeneralTimetable','StopTimes'), expand=[('GeneralTimetable','GeneralTrainInfo'),('GeneralTimetable','ServiceDay')]),
+                            Level({'StopSequence':'StopSequence','StationID':'StationID','StationName':('StationName','Zh_tw'),'ArrivalTime':'ArrivalTime','DepartureTime':'DepartureTime'})]
+
+BUS_REALTIME_ROUTE={'PlateNumb':'PlateNumb','OperatorID':'OperatorID','RouteUID':'RouteUID','RouteID':'RouteID','RouteName':('RouteName','Zh_tw'),'SubRouteUID':'SubRouteUID','SubRouteID':'SubRouteID','SubRouteName':('SubRouteName','Zh_tw'),'Direction':'Direction'}
+
+# real-time datasets of Bus_RealTime by record: the path of the API and the layout of its records
+BUS_REALTIME_API={'position':'RealTimeByFrequency', 'nearstop':'RealTimeNearStop', 'eta':'EstimatedTimeOfArrival'}
+
+BUS_REALTIME_SPEC={'position':[Level(dict(BUS_REALTIME_ROUTE, **{'PositionLon':('BusPosition','PositionLon'),'PositionLat':('BusPosition','PositionLat'),'Speed':'Speed','Azimuth':'Azimuth','DutyStatus':'DutyStatus','BusStatus':'BusStatus','GPSTime':'GPSTime','UpdateTime':'UpdateTime'}))],
+                   'nearstop':[Level(dict(BUS_REALTIME_ROUTE, **{'StopUID':'StopUID','StopID':'StopID','StopName':('StopName','Zh_tw'),'StopSequence':'StopSequence','DutyStatus':'DutyStatus','BusStatus':'BusStatus','A2EventType':'A2EventType','GPSTime':'GPSTime','UpdateTime':'UpdateTime'}))],
+                   'eta':[Level(dict(BUS_REALTIME_ROUTE, **{'StopUID':'StopUID','StopID':'StopID','StopName':('StopName','Zh_tw'),'StopSequence':'StopSequence','EstimateTime':'EstimateTime','StopStatus':'StopStatus','NextBusTime':'NextBusTime','IsLastBus':'IsLastBus','DataTime':'DataTime','UpdateTime':'UpdateTime'}))]}
+
+# road traffic of each road class of tdx_roadclass(), published by the Freeway Bureau (freeways) and the Highway Bureau (the others)
+ROAD_AUTHORITY={'0':'Freeway', '1':'Highway', '3':'Highway'}
+
+# road traffic datasets by record: the path of the API, the key of the records in the response and their layout;
+# 'section', 'shape' and 'vd' describe the road, 'live', 'vd_live' and 'etag_live' are traffic, live or historical
+ROAD_API={'section':('Section','Sections'), 'shape':('SectionShape','SectionShapes'), 'vd':('VD','VDs'),
+          'live':('Live','LiveTraffics'), 'vd_live':('Live/VD','VDLives'), 'etag_live':('Live/ETag','ETagPairLives')}
+
+ROAD_SPEC={'section':[Level({'SectionID':'SectionID','SectionName':'SectionName','RoadID':'RoadID','RoadName':'RoadName','RoadClass':'RoadClass','RoadDirection':'RoadDirection','RoadSectionStart':('RoadSection','Start'),'RoadSectionEnd':('RoadSection','End'),'SectionLength':'SectionLength','SpeedLimit':'SpeedLimit','StartKM':('SectionMile','StartKM'),'EndKM':('SectionMile','EndKM')})],
+           'shape':[Level({'SectionID':'SectionID','Geometry':'Geometry'})],
+           'vd':[Level({'VDID':'VDID','SubAuthorityCode':'SubAuthorityCode','BiDirectional':'BiDirectional','LocationType':'LocationType','PositionLon':'PositionLon','PositionLat':'PositionLat','RoadID':'RoadID','RoadName':'RoadName','RoadClass':'RoadClass','RoadSectionStart':('RoadSection','Start'),'RoadSectionEnd':('RoadSection','End'),'LocationMile':'LocationMile'}, 'DetectionLinks', keep_empty=True),
+                 Level({'LinkID':'LinkID','Bearing':'Bearing','RoadDirection':'RoadDirection','LaneNum':'LaneNum','ActualLaneNum':'ActualLaneNum'})],
+           'live':[Level({'SectionID':'SectionID','TravelTime':'TravelTime','TravelSpeed':'TravelSpeed','CongestionLevelID':'CongestionLevelID','CongestionLevel':'CongestionLevel','DataCollectTime':'DataCollectTime'})],
+           'vd_live':[Level({'VDID':'VDID','Status':'Status','DataCollectTime':'DataCollectTime'}, 'LinkFlows'),
+                      Level({'LinkID':'LinkID'}, 'Lanes'),
+                      Level({'LaneID':'LaneID','LaneType':'LaneType','Speed':'Speed','Occupancy':'Occupancy'}, 'Vehicles'),
+                      Level({'VehicleType':'VehicleType','Volume':'Volume','VehicleSpeed':'Speed'})],
+           'etag_live':[Level({'ETagPairID':'ETagPairID','StartETagStatus':'StartETagStatus','EndETagStatus':'EndETagStatus','StartTime':'StartTime','EndTime':'EndTime','DataCollectTime':'DataCollectTime'}, 'Flows'),
+                        Level({'VehicleType':'VehicleType','TravelTime':'TravelTime','StandardDeviation':'StandardDeviation','SpaceMeanSpeed':'SpaceMeanSpeed','VehicleCount':'VehicleCount'})]}
+
+# the traffic records do not carry their road class, it is looked up by their id in the road description
+ROAD_CLASS_OF={'live':('section','SectionID'), 'vd_live':('vd','VDID')}
+
+
+
+@profiled
 def Bus_Route(access_token, county, out=False):
-    if out!=False and ~pd.Series(out).str.contains('\.csv|\.txt')[0]:
-        return(warnings.warn("Export file must contain '.csv' or '.txt'!", UserWarning))
+    if out!=False and not valid_out(out, "text"):
+        return(warnings.warn("Export file must contain '.csv', '.txt', '.parquet' or '.feather'!", UserWarning))
     
     if county=="Intercity":
         url="https://tdx.transportdata.tw/api/basic/v2/Bus/Route/InterCity?%24format=JSON"
@@ -71,44 +252,25 @@ def Bus_Route(access_token, county, out=False):
         return(warnings.warn("'"+county+"' is not valid county. Please check out the table of county code above.", UserWarning))
     
     try:
-        data_response=requests.get(url, headers={'authorization': 'Bearer '+access_token})
-    except:
-        return(warnings.warn("Your access token is invalid!", UserWarning))
-    js_data=json.loads(data_response.text)
-    bus_route=pd.DataFrame.from_dict(js_data, orient="columns")
-    
-    bus_info=bus_route.loc[:,['RouteUID','RouteID','RouteName','BusRouteType','DepartureStopNameZh','DestinationStopNameZh']]
-    subroutenum=[len(bus_route.SubRoutes[i]) for i in range(len(bus_route))]
-    
-    bus_subroute=dict()
-    label_all=['SubRouteUID','SubRouteID','SubRouteName','Direction','OperatorIDs','FirstBusTime','LastBusTime','OperatorIDs']
-    for label_id in label_all:
-        if label_id in ['SubRouteName']:
-            bus_subroute[label_id]=[bus_route.SubRoutes[i][j][label_id]['Zh_tw'] if label_id in bus_route.SubRoutes[i][j] else None for i in range(len(bus_route)) for j in range(subroutenum[i])]
-        else:
-            bus_subroute[label_id]=[bus_route.SubRoutes[i][j][label_id] if label_id in bus_route.SubRoutes[i][j] else None for i in range(len(bus_route)) for j in range(subroutenum[i])]
-
-    bus_info=bus_info.iloc[np.repeat(np.arange(len(bus_info)), subroutenum)].reset_index(drop=True)
-    bus_route=pd.concat([bus_info, pd.DataFrame(bus_subroute)], axis=1)
-    bus_route.RouteName=[bus_route.RouteName[i]['Zh_tw'] for i in range(len(bus_route))]
-    
-    for i in range(len(bus_route)):
-        tt=str(bus_route.OperatorIDs[i]).replace("[", ""); tt=tt.replace("]", ""); tt=tt.replace("'", "")
-        bus_route.loc[i,"OperatorIDs"]=tt
+        bus_route=flatten(_fetch_records(url, access_token), BUS_ROUTE_SPEC)
+    except TDXError as e:
+        return(warnings.warn(str(e), UserWarning))
+    bus_route.OperatorIDs=[", ".join(map(str, i)) if isinstance(i, list) else str(i) for i in bus_route.OperatorIDs]
     
     if out!=False:
-        bus_route.to_csv(out, index=False)
+        write_out(bus_route, out)
     return(bus_route)
 
 
 
+@profiled
 def Bus_Shape(access_token, county, dtype="text", out=False):
     if dtype=="text":
-        if out!=False and ~pd.Series(out).str.contains('\.csv|\.txt')[0]:
-            return(warnings.warn("Export file of 'text' must contain '.csv' or '.txt'!", UserWarning))
+        if out!=False and not valid_out(out, "text"):
+            return(warnings.warn("Export file of 'text' must contain '.csv', '.txt', '.parquet' or '.feather'!", UserWarning))
     elif dtype=="sf":
-        if out!=False and ~pd.Series(out).str.contains('shp')[0]:
-            return(warnings.warn("Export file of 'sf' must contain '.shp'!", UserWarning))
+        if out!=False and not valid_out(out, "sf"):
+            return(warnings.warn("Export file of 'sf' must contain '.shp', '.parquet' or '.feather'!", UserWarning))
     else:
         return(warnings.warn("'dtype' must be 'text' or 'sf'!", UserWarning))
     
@@ -121,36 +283,37 @@ def Bus_Shape(access_token, county, dtype="text", out=False):
         return(warnings.warn("'"+county+"' is not valid county. Please check out the table of county code above.", UserWarning))
     
     try:
-        data_response=requests.get(url, headers={'authorization': 'Bearer '+access_token})
-    except:
-        return(warnings.warn("Your access token is invalid!"), UserWarning)
-    js_data=json.loads(data_response.text)
+        js_data=_fetch_json(url, access_token)
+    except TDXError as e:
+        return(warnings.warn(str(e), UserWarning))
     bus_shape=pd.DataFrame.from_dict(js_data, orient="columns")
     
     bus_shape.RouteName=[bus_shape.RouteName[i]['Zh_tw'] if len(bus_shape.RouteName[i])!=0  else None for i in range(len(bus_shape))]
     bus_shape.SubRouteName=[bus_shape.SubRouteName[i]['Zh_tw'] if len(bus_shape.SubRouteName[i])!=0  else None for i in range(len(bus_shape))]
-    bus_shape=bus_shape.loc[:,['RouteUID','RouteID','RouteName','SubRouteUID','SubRouteID','SubRouteName','Geometry']].rename(columns={'Geometry':'geometry'})
+    bus_shape=bus_shape.loc[:,[i for i in ['RouteUID','RouteID','RouteName','SubRouteUID','SubRouteID','SubRouteName','Direction','Geometry'] if i in bus_shape.columns]].rename(columns={'Geometry':'geometry'})
     
     if dtype=="text":
         if out!=False:
-            bus_shape.to_csv(out, index=False)
+            write_out(bus_shape, out)
         return(bus_shape)
     elif dtype=="sf":
-        bus_shape['geometry']=bus_shape['geometry'].apply(wkt.loads)
-        bus_shape=gpd.GeoDataFrame(bus_shape, crs='epsg:4326')
+        with stage("geometry", records=len(bus_shape)):
+            bus_shape['geometry']=shapely.from_wkt(bus_shape['geometry'].to_numpy(dtype=object))
+            bus_shape=gpd.GeoDataFrame(bus_shape, crs='epsg:4326')
         if out!=False:
-            bus_shape.to_file(out, index=False)
+            write_out(bus_shape, out)
         return(bus_shape)
 
 
 
-def Bus_StopOfRoute(access_token, county, dtype="text", out=False):
+@profiled
+def Bus_StopOfRoute(access_token, county, dtype="text", out=False, compact=False):
     if dtype=="text":
-        if out!=False and ~pd.Series(out).str.contains('\.csv|\.txt')[0]:
-            return(warnings.warn("Export file of 'text' must contain '.csv' or '.txt'!", UserWarning))
+        if out!=False and not valid_out(out, "text"):
+            return(warnings.warn("Export file of 'text' must contain '.csv', '.txt', '.parquet' or '.feather'!", UserWarning))
     elif dtype=="sf":
-        if out!=False and ~pd.Series(out).str.contains('shp')[0]:
-            return(warnings.warn("Export file of 'sf' must contain '.shp'!", UserWarning))
+        if out!=False and not valid_out(out, "sf"):
+            return(warnings.warn("Export file of 'sf' must contain '.shp', '.parquet' or '.feather'!", UserWarning))
     else:
         return(warnings.warn("'dtype' must be 'text' or 'sf'!", UserWarning))
     
@@ -163,52 +326,34 @@ def Bus_StopOfRoute(access_token, county, dtype="text", out=False):
         return(warnings.warn("'"+county+"' is not valid county. Please check out the table of county code above.", UserWarning))
     
     try:
-        data_response=requests.get(url, headers={'authorization': 'Bearer '+access_token})
-    except:
-        return(warnings.warn("Your access token is invalid!", UserWarning))
-    js_data=json.loads(data_response.text)
-    bus_stopofroute=pd.DataFrame.from_dict(js_data, orient="columns")
-    
-    bus_stopofroute.RouteName=[bus_stopofroute.RouteName[i]['Zh_tw'] if len(bus_stopofroute.RouteName[i])!=0  else None for i in range(len(bus_stopofroute))]
-    bus_stopofroute.SubRouteName=[bus_stopofroute.SubRouteName[i]['Zh_tw'] if len(bus_stopofroute.SubRouteName[i])!=0  else None for i in range(len(bus_stopofroute))]
-
-    bus_info=bus_stopofroute.loc[:,['RouteUID','RouteID','RouteName','SubRouteUID','SubRouteName','SubRouteID','Direction']]
-    stopnum=[len(bus_stopofroute.Stops[i]) for i in range(len(bus_stopofroute))]
-    
-    bus_stop=dict()
-    label_all=['StopUID','StopID','StopName','StopBoarding','StopSequence','StationID','StopPosition','LocationCityCode']
-    for label_id in label_all:
-        if label_id in ['StopName']:
-            bus_stop[label_id]=[bus_stopofroute.Stops[i][j][label_id]['Zh_tw'] if label_id in bus_stopofroute.Stops[i][j] else None for i in range(len(bus_stopofroute)) for j in range(len(bus_stopofroute.Stops[i]))]
-        else:
-            bus_stop[label_id]=[bus_stopofroute.Stops[i][j][label_id] if label_id in bus_stopofroute.Stops[i][j] else None for i in range(len(bus_stopofroute)) for j in range(len(bus_stopofroute.Stops[i]))]
-    bus_stop=pd.DataFrame(bus_stop)
-    bus_stop=pd.concat([bus_stop, pd.DataFrame(list(bus_stop.StopPosition)).loc[:,['PositionLon','PositionLat']]], axis=1)
-    
-    bus_info=bus_info.iloc[np.repeat(np.arange(len(bus_info)), stopnum)].reset_index(drop=True)
-    bus_stop=bus_stop.loc[:,['StopUID','StopID','StopName','StationID','StopBoarding','StopSequence','PositionLon','PositionLat','LocationCityCode']]
-    bus_stopofroute=pd.concat([bus_info, bus_stop], axis=1)
+        bus_stopofroute=flatten(_fetch_records(url, access_token), BUS_STOPOFROUTE_SPEC, compact)
+    except TDXError as e:
+        return(warnings.warn(str(e), UserWarning))
+    if compact:
+        bus_stopofroute=compact_dtypes(bus_stopofroute)
     
     if dtype=="text":
         if out!=False:
-            bus_stopofroute.to_csv(out, index=False)
+            write_out(bus_stopofroute, out)
         return(bus_stopofroute)
     elif dtype=="sf":
-        bus_stopofroute['geometry']=gpd.points_from_xy(bus_stopofroute.PositionLon, bus_stopofroute.PositionLat, crs="EPSG:4326")
-        bus_stopofroute=gpd.GeoDataFrame(bus_stopofroute, crs='epsg:4326')
+        with stage("geometry", records=len(bus_stopofroute)):
+            bus_stopofroute['geometry']=gpd.points_from_xy(bus_stopofroute.PositionLon, bus_stopofroute.PositionLat, crs="EPSG:4326")
+            bus_stopofroute=gpd.GeoDataFrame(bus_stopofroute, crs='epsg:4326')
         if out!=False:
-            bus_stopofroute.to_file(out, index=False)
+            write_out(bus_stopofroute, out)
         return(bus_stopofroute)
 
 
 
+@profiled
 def Rail_Shape(access_token, operator, dtype="text", out=False):
     if dtype=="text":
-        if out!=False and ~pd.Series(out).str.contains('\.csv|\.txt')[0]:
-            return(warnings.warn("Export file of 'text' must contain '.csv' or '.txt'!", UserWarning))
+        if out!=False and not valid_out(out, "text"):
+            return(warnings.warn("Export file of 'text' must contain '.csv', '.txt', '.parquet' or '.feather'!", UserWarning))
     elif dtype=="sf":
-        if out!=False and ~pd.Series(out).str.contains('shp')[0]:
-            return(warnings.warn("Export file of 'sf' must contain '.shp'!", UserWarning))
+        if out!=False and not valid_out(out, "sf"):
+            return(warnings.warn("Export file of 'sf' must contain '.shp', '.parquet' or '.feather'!", UserWarning))
     else:
         return(warnings.warn("'dtype' must be 'text' or 'sf'!", UserWarning))
         
@@ -225,10 +370,9 @@ def Rail_Shape(access_token, operator, dtype="text", out=False):
         return(warnings.warn("'"+operator+"' is not valid operator. Please check out the table of railway code above.", UserWarning))
     
     try:
-        data_response=requests.get(url, headers={'authorization': 'Bearer '+access_token})
-    except:
-        return(warnings.warn("Your access token is invalid!"), UserWarning)
-    js_data=json.loads(data_response.text)
+        js_data=_fetch_json(url, access_token)
+    except TDXError as e:
+        return(warnings.warn(str(e), UserWarning))
     rail_shape=pd.DataFrame.from_dict(js_data, orient="columns")
     
     rail_shape.LineName=[rail_shape.LineName[i]['Zh_tw'] if len(rail_shape.LineName[i])!=0  else None for i in range(len(rail_shape))]
@@ -236,78 +380,73 @@ def Rail_Shape(access_token, operator, dtype="text", out=False):
 
     if dtype=="text":
         if out!=False:
-            rail_shape.to_csv(out, index=False)
+            write_out(rail_shape, out)
         return(rail_shape)
     elif dtype=="sf":
-        rail_shape['geometry']=rail_shape['geometry'].apply(wkt.loads)
-        rail_shape=gpd.GeoDataFrame(rail_shape, crs='epsg:4326')
+        with stage("geometry", records=len(rail_shape)):
+            rail_shape['geometry']=shapely.from_wkt(rail_shape['geometry'].to_numpy(dtype=object))
+            rail_shape=gpd.GeoDataFrame(rail_shape, crs='epsg:4326')
         if out!=False:
-            rail_shape.to_file(out, index=False)
+            write_out(rail_shape, out)
         return(rail_shape)
 
 
     
-def Bus_TravelTime(access_token, county, routeid, out=False):
-    if out!=False and ~pd.Series(out).str.contains('\.csv|\.txt')[0]:
-        return(warnings.warn("Export file must contain '.csv' or '.txt'!", UserWarning))
+def _Bus_TravelTime_route(url, access_token):
+    js_data=_fetch_records(url, access_token)
+    return(flatten(js_data, BUS_TRAVELTIME_SPEC))
+
+
+
+@profiled
+def Bus_TravelTime(access_token, county, routeid, out=False, max_workers=4, compact=False):
+    if out!=False and not valid_out(out, "text"):
+        return(warnings.warn("Export file must contain '.csv', '.txt', '.parquet' or '.feather'!", UserWarning))
     
-    bus_traveltime=pd.DataFrame()
-    for busrouteid in tqdm(routeid):
-        if county=="Intercity":
-             url="https://tdx.transportdata.tw/api/basic/v2/Bus/S2STravelTime/InterCity/"+busrouteid+"?&%24format=JSON"
-        elif county in list(tdx_county().Code):
-             url="https://tdx.transportdata.tw/api/basic/v2/Bus/S2STravelTime/City/"+county+"/"+busrouteid+"?&%24format=JSON"
-        else:
-            print(tdx_county())
-            return(warnings.warn("'"+county+"' is not valid county. Please check out the table of county code above.", UserWarning))
-        
-        try:
-            data_response=requests.get(url, headers={'authorization': 'Bearer '+access_token})
-        except:
-            return(warnings.warn("Your access token is invalid!", UserWarning))
-        js_data=json.loads(data_response.text)
-
-        subroute_info=dict()
-        label_all=['RouteUID','RouteID','SubRouteUID','SubRouteID','Direction']
-        for label_id in label_all:
-            subroute_info[label_id]=[js_data[i][label_id] if label_id in js_data[i] else None for i in range(len(js_data))]
-        subroute_info=pd.DataFrame(subroute_info)
-
-        num_of_week=[len(js_data[i]["TravelTimes"]) for i in range(len(js_data))]
-        subroute_info=subroute_info.iloc[np.repeat(np.arange(len(subroute_info)), num_of_week)].reset_index(drop=True)
-
-        week_info=dict()
-        label_all=['Weekday','StartHour','EndHour']
-        for label_id in label_all:
-            week_info[label_id]=[js_data[i]["TravelTimes"][j][label_id] if label_id in js_data[i]["TravelTimes"][j] else None for i in range(len(js_data)) for j in range(len(js_data[i]["TravelTimes"]))]
-        week_info=pd.DataFrame(week_info)
-        subroute_info=pd.concat([subroute_info, week_info], axis=1).reset_index(drop=True)
-
-        num_of_od=[len(js_data[i]["TravelTimes"][j]['S2STimes']) for i in range(len(js_data)) for j in range(len(js_data[i]["TravelTimes"]))]    
-        subroute_info=subroute_info.iloc[np.repeat(np.arange(len(subroute_info)), num_of_od)].reset_index(drop=True)
-
-        traveltime_info=dict()
-        label_all=['FromStopID','ToStopID','FromStationID','ToStationID','RunTime']
-        for label_id in label_all:
-            traveltime_info[label_id]=[js_data[i]["TravelTimes"][j]['S2STimes'][k][label_id] if label_id in js_data[i]["TravelTimes"][j]['S2STimes'][k] else None for i in range(len(js_data)) for j in range(len(js_data[i]["TravelTimes"])) for k in range(len(js_data[i]["TravelTimes"][j]['S2STimes']))]
-        traveltime_info=pd.DataFrame(traveltime_info)
-        subroute_info=pd.concat([subroute_info, traveltime_info], axis=1).reset_index(drop=True)
-
-        bus_traveltime=pd.concat([bus_traveltime, subroute_info]).reset_index(drop=True)
+    if county=="Intercity":
+        url="https://tdx.transportdata.tw/api/basic/v2/Bus/S2STravelTime/InterCity/"
+    elif county in list(tdx_county().Code):
+        url="https://tdx.transportdata.tw/api/basic/v2/Bus/S2STravelTime/City/"+county+"/"
+    else:
+        print(tdx_county())
+        return(warnings.warn("'"+county+"' is not valid county. Please check out the table of county code above.", UserWarning))
+    
+    # routes are requested concurrently, the shared client keeps the request rate within the quota
+    routeid=list(routeid)
+    traveltime_all=[None]*len(routeid)
+    failed=dict()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures={executor.submit(copy_context().run, _Bus_TravelTime_route, url+busrouteid+"?&%24format=JSON", access_token): i for i, busrouteid in enumerate(routeid)}
+        for future in tqdm.tqdm(as_completed(futures), total=len(futures)):
+            i=futures[future]
+            try:
+                traveltime_all[i]=future.result()
+            except Exception as e:
+                failed[routeid[i]]=str(e)
+    
+    if len(failed)!=0:
+        warnings.warn("Failed to retrieve the travel time of "+str(len(failed))+" route(s): "+", ".join([str(key)+" ("+value+")" for key, value in failed.items()]), UserWarning)
+    traveltime_all=[i for i in traveltime_all if i is not None]
+    if len(traveltime_all)==0:
+        return(pd.DataFrame())
+    bus_traveltime=pd.concat(traveltime_all).reset_index(drop=True)
+    if compact:
+        bus_traveltime=compact_dtypes(bus_traveltime)
     
     if out!=False:
-        bus_traveltime.to_csv(out, index=False)
+        write_out(bus_traveltime, out)
     return(bus_traveltime)
 
 
 
+@profiled
 def Rail_Station(access_token, operator, dtype="text", out=False):
     if dtype=="text":
-        if out!=False and ~pd.Series(out).str.contains('\.csv|\.txt')[0]:
-            return(warnings.warn("Export file of 'text' must contain '.csv' or '.txt'!", UserWarning))
+        if out!=False and not valid_out(out, "text"):
+            return(warnings.warn("Export file of 'text' must contain '.csv', '.txt', '.parquet' or '.feather'!", UserWarning))
     elif dtype=="sf":
-        if out!=False and ~pd.Series(out).str.contains('shp')[0]:
-            return(warnings.warn("Export file of 'sf' must contain '.shp'!", UserWarning))
+        if out!=False and not valid_out(out, "sf"):
+            return(warnings.warn("Export file of 'sf' must contain '.shp', '.parquet' or '.feather'!", UserWarning))
     else:
         return(warnings.warn("'dtype' must be 'text' or 'sf'!", UserWarning))
         
@@ -324,10 +463,9 @@ def Rail_Station(access_token, operator, dtype="text", out=False):
         return(warnings.warn("'"+operator+"' is not valid operator. Please check out the table of railway code above.", UserWarning))
     
     try:
-        data_response=requests.get(url, headers={'authorization': 'Bearer '+access_token})
-    except:
-        return(warnings.warn("Your access token is invalid!", UserWarning))
-    js_data=json.loads(data_response.text)
+        js_data=_fetch_json(url, access_token)
+    except TDXError as e:
+        return(warnings.warn(str(e), UserWarning))
     
     if operator=='TRA':
         rail_station=pd.DataFrame.from_dict(js_data, orient="columns")
@@ -348,20 +486,22 @@ def Rail_Station(access_token, operator, dtype="text", out=False):
 
     if dtype=="text":
         if out!=False:
-            rail_station.to_csv(out, index=False)
+            write_out(rail_station, out)
         return(rail_station)
     elif dtype=="sf":
-        rail_station['geometry']=gpd.points_from_xy(rail_station.PositionLon, rail_station.PositionLat, crs="EPSG:4326")
-        rail_station=gpd.GeoDataFrame(rail_station, crs='epsg:4326')
+        with stage("geometry", records=len(rail_station)):
+            rail_station['geometry']=gpd.points_from_xy(rail_station.PositionLon, rail_station.PositionLat, crs="EPSG:4326")
+            rail_station=gpd.GeoDataFrame(rail_station, crs='epsg:4326')
         if out!=False:
-            rail_station.to_file(out, index=False)
+            write_out(rail_station, out)
         return(rail_station)
 
 
 
+@profiled
 def Rail_StationOfLine(access_token, operator, out=False):
-    if out!=False and ~pd.Series(out).str.contains('\.csv|\.txt')[0]:
-        return(warnings.warn("Export file must contain '.csv' or '.txt'!", UserWarning))
+    if out!=False and not valid_out(out, "text"):
+        return(warnings.warn("Export file must contain '.csv', '.txt', '.parquet' or '.feather'!", UserWarning))
 
     if operator=='TRA':
         url="https://tdx.transportdata.tw/api/basic/v2/Rail/TRA/StationOfLine?&%24format=JSON"
@@ -375,29 +515,14 @@ def Rail_StationOfLine(access_token, operator, out=False):
         print(tdx_railway())
         return(warnings.warn("'"+operator+"' is not valid operator. Please check out the table of railway code above.", UserWarning))
     
+    # TRA provides the station name as plain text, others provide it in both languages
+    station_name='StationName' if operator=='TRA' else ('StationName','Zh_tw')
     try:
-        data_response=requests.get(url, headers={'authorization': 'Bearer '+access_token})
-    except:
-        return(warnings.warn("Your access token is invalid!", UserWarning)) 
-    js_data=json.loads(data_response.text)
-    
-    if operator in ['AFR']:
-        js_data=js_data["StationOfLines"]
-    
-    rail_line=[js_data[i]["LineID"] for i in range(len(js_data))]
-    rail_line=pd.DataFrame({'LineID':rail_line})
-    num_of_station=[len(js_data[i]["Stations"]) for i in range(len(js_data))]
-    rail_line=rail_line.iloc[np.repeat(np.arange(len(rail_line)), num_of_station)].reset_index(drop=True)
-
-    rail_station_temp=dict()
-    label_all=['Sequence','StationID','StationName','TraveledDistance','CumulativeDistance']
-    for label_id in label_all:
-        if label_id in ['StationName'] and operator not in ['TRA']:
-            rail_station_temp[label_id]=[js_data[i]["Stations"][j][label_id]['Zh_tw'] if label_id in js_data[i]["Stations"][j] else None for i in range(len(js_data)) for j in range(len(js_data[i]["Stations"]))]
-        else:
-            rail_station_temp[label_id]=[js_data[i]["Stations"][j][label_id] if label_id in js_data[i]["Stations"][j] else None for i in range(len(js_data)) for j in range(len(js_data[i]["Stations"]))]
-    rail_station_temp=pd.DataFrame(rail_station_temp)
-    rail_station_line=pd.concat([rail_line, rail_station_temp], axis=1)
+        js_data=_fetch_records(url, access_token, key="StationOfLines" if operator=='AFR' else None)
+        rail_station_line=flatten(js_data, [Level({'LineID':'LineID'}, 'Stations'),
+                                            Level({'Sequence':'Sequence','StationID':'StationID','StationName':station_name,'TraveledDistance':'TraveledDistance','CumulativeDistance':'CumulativeDistance'})])
+    except TDXError as e:
+        return(warnings.warn(str(e), UserWarning))
 
     for label_id in ['TraveledDistance','CumulativeDistance']:
         if sum(rail_station_line[label_id].isna())==len(rail_station_line):
@@ -409,8 +534,10 @@ def Rail_StationOfLine(access_token, operator, out=False):
         url="https://tdx.transportdata.tw/api/basic/v3/Rail/AFR/Line?&%24format=JSON"
     else: 
         url="https://tdx.transportdata.tw/api/basic/v2/Rail/Metro/Line/"+operator+"?&%24format=JSON"
-    data_response=requests.get(url, headers={'authorization': 'Bearer '+access_token})
-    js_data=json.loads(data_response.text)
+    try:
+        js_data=_fetch_json(url, access_token)
+    except TDXError as e:
+        return(warnings.warn(str(e), UserWarning))
     
     if operator=="AFR":
         js_data=js_data["Lines"]
@@ -441,13 +568,44 @@ def Rail_StationOfLine(access_token, operator, out=False):
     
     
     
+# a part of a MULTILINESTRING with less than 2 coordinates, e.g. ',(121.5 25.0)', is not a valid line and GEOS refuses to
+# read the whole feature; the coordinates of every part are parsed, and the features holding such a part are built again
+# from their other parts, or left empty. shapely builds no M coordinates, so the measures of a rebuilt feature are dropped
+_PART=r"\(([^()]*)\)"
+_MEASURED=r"^\s*MULTILINESTRING\s*Z?M"
+
+
+def _drop_single_points(geometry):
+    parts=geometry.str.findall(_PART).explode().dropna().str.strip()
+    count=(parts.str.count(",")+1).where(parts!="", 0)
+    broken=count.index[count<2].unique()
+    if len(broken)==0:
+        return(geometry)
+
+    parts=parts.loc[broken][count.loc[broken]>=2]
+    # x, y and z when there is one, a measure comes after them
+    measured=geometry.loc[broken].str.contains(_MEASURED, case=False).reindex(parts.index).to_numpy(dtype=int)
+    lines=[]
+    for part, m in zip(parts, measured):
+        coords=[c.split() for c in part.split(",")]
+        lines.append(shapely.linestrings(np.array(coords, dtype=float)[:, :min(3, len(coords[0])-m)]))
+    rebuilt=np.array([shapely.from_wkt("MULTILINESTRING EMPTY")]*len(broken), dtype=object)
+    if len(lines)>0:
+        shapely.multilinestrings(lines, indices=pd.Index(broken).get_indexer(parts.index), out=rebuilt)
+    geometry=geometry.astype(object)
+    geometry.loc[broken]=shapely.to_wkt(rebuilt, rounding_precision=-1)
+    return(geometry)
+
+
+
+@profiled
 def Bike_Shape(access_token, county, dtype="text", out=False):
     if dtype=="text":
-        if out!=False and ~pd.Series(out).str.contains('\.csv|\.txt')[0]:
-            return(warnings.warn("Export file of 'text' must contain '.csv' or '.txt'!", UserWarning))
+        if out!=False and not valid_out(out, "text"):
+            return(warnings.warn("Export file of 'text' must contain '.csv', '.txt', '.parquet' or '.feather'!", UserWarning))
     elif dtype=="sf":
-        if out!=False and ~pd.Series(out).str.contains('shp')[0]:
-            return(warnings.warn("Export file of 'sf' must contain '.shp'!", UserWarning))
+        if out!=False and not valid_out(out, "sf"):
+            return(warnings.warn("Export file of 'sf' must contain '.shp', '.parquet' or '.feather'!", UserWarning))
     else:
         return(warnings.warn("'dtype' must be 'text' or 'sf'!", UserWarning))
     
@@ -458,10 +616,9 @@ def Bike_Shape(access_token, county, dtype="text", out=False):
         return(warnings.warn("'"+county+"' is not valid county. Please check out the table of county code above.", UserWarning))
 
     try:
-        data_response=requests.get(url, headers={'authorization': 'Bearer '+access_token})
-    except:
-        return(warnings.warn("Your access token is invalid!", UserWarning)) 
-    js_data=json.loads(data_response.text)
+        js_data=_fetch_json(url, access_token)
+    except TDXError as e:
+        return(warnings.warn(str(e), UserWarning))
     
     if "Message" in js_data:
         return(warnings.warn("'"+county+"' does not provide cycling network in TDX platform up to now.", UserWarning))
@@ -470,38 +627,31 @@ def Bike_Shape(access_token, county, dtype="text", out=False):
     bike_shape=bike_shape.loc[:,['RouteName','City','RoadSectionStart','RoadSectionEnd','CyclingLength','Direction','Geometry']].rename(columns={'Geometry':'geometry'})
     
     # revise the invalid geometry record
-    for i in range(len(bike_shape)):
-        temp=bike_shape.loc[i, 'geometry']
-        temp=temp.replace("MULTILINESTRING ((", "")
-        temp=temp.replace("))", "")
-        temp=temp.split("),(")
-        temp_count=[temp[i].count(" ") for i in range(len(temp))]
-        fil=[temp_count[i]!=1 for i in range(len(temp_count))]
-        if sum([not elem for elem in fil])!=0:        
-            temp=list(compress(temp, fil))
-            temp="MULTILINESTRING (("+("),(".join(temp))+"))"
-            bike_shape.loc[i, 'geometry']=temp
+    with stage("geometry", records=len(bike_shape)):
+        bike_shape['geometry']=_drop_single_points(bike_shape['geometry'])
     
     if dtype=="text":
         if out!=False:
-            bike_shape.to_csv(out, index=False)
+            write_out(bike_shape, out)
         return(bike_shape)
     elif dtype=="sf":
-        bike_shape['geometry']=bike_shape['geometry'].apply(wkt.loads)
-        bike_shape=gpd.GeoDataFrame(bike_shape, crs='epsg:4326')
+        with stage("geometry", records=len(bike_shape)):
+            bike_shape['geometry']=shapely.from_wkt(bike_shape['geometry'].to_numpy(dtype=object))
+            bike_shape=gpd.GeoDataFrame(bike_shape, crs='epsg:4326')
         if out!=False:
-            bike_shape.to_file(out, index=False)
+            write_out(bike_shape, out)
         return(bike_shape)
     
     
     
+@profiled
 def Bike_Station(access_token, county, dtype="text", out=False):
     if dtype=="text":
-        if out!=False and ~pd.Series(out).str.contains('\.csv|\.txt')[0]:
-            return(warnings.warn("Export file of 'text' must contain '.csv' or '.txt'!", UserWarning))
+        if out!=False and not valid_out(out, "text"):
+            return(warnings.warn("Export file of 'text' must contain '.csv', '.txt', '.parquet' or '.feather'!", UserWarning))
     elif dtype=="sf":
-        if out!=False and ~pd.Series(out).str.contains('shp')[0]:
-            return(warnings.warn("Export file of 'sf' must contain '.shp'!", UserWarning))
+        if out!=False and not valid_out(out, "sf"):
+            return(warnings.warn("Export file of 'sf' must contain '.shp', '.parquet' or '.feather'!", UserWarning))
     else:
         return(warnings.warn("'dtype' must be 'text' or 'sf'!", UserWarning))
         
@@ -512,10 +662,9 @@ def Bike_Station(access_token, county, dtype="text", out=False):
         return(warnings.warn("'"+county+"' is not valid county. Please check out the table of county code above.", UserWarning))
     
     try:
-        data_response=requests.get(url, headers={'authorization': 'Bearer '+access_token})
-    except:
-        return(warnings.warn("Your access token is invalid!", UserWarning))
-    js_data=json.loads(data_response.text)
+        js_data=_fetch_json(url, access_token)
+    except TDXError as e:
+        return(warnings.warn(str(e), UserWarning))
     
     if "Message" in js_data:
         return(warnings.warn("'"+county+"' does not provide bike sharing system.", UserWarning))
@@ -528,20 +677,22 @@ def Bike_Station(access_token, county, dtype="text", out=False):
 
     if dtype=="text":
         if out!=False:
-            bike_station.to_csv(out, index=False)
+            write_out(bike_station, out)
         return(bike_station)
     elif dtype=="sf":
-        bike_station['geometry']=gpd.points_from_xy(bike_station.PositionLon, bike_station.PositionLat, crs="EPSG:4326")
-        bike_station=gpd.GeoDataFrame(bike_station, crs='epsg:4326')
+        with stage("geometry", records=len(bike_station)):
+            bike_station['geometry']=gpd.points_from_xy(bike_station.PositionLon, bike_station.PositionLat, crs="EPSG:4326")
+            bike_station=gpd.GeoDataFrame(bike_station, crs='epsg:4326')
         if out!=False:
-            bike_station.to_file(out, index=False)
+            write_out(bike_station, out)
         return(bike_station)
 
 
     
-def Bus_Schedule(access_token, county, out=False):
-    if out!=False and ~pd.Series(out).str.contains('\.csv|\.txt')[0]:
-        return(warnings.warn("Export file must contain '.csv' or '.txt'!", UserWarning))
+@profiled
+def Bus_Schedule(access_token, county, out=False, stoptimes=False, compact=False):
+    if out!=False and not valid_out(out, "text"):
+        return(warnings.warn("Export file must contain '.csv', '.txt', '.parquet' or '.feather'!", UserWarning))
     
     if county=="Intercity":
         url="https://tdx.transportdata.tw/api/basic/v2/Bus/Schedule/InterCity?&$format=JSON"
@@ -552,69 +703,35 @@ def Bus_Schedule(access_token, county, out=False):
         return(warnings.warn("'"+county+"' is not valid county. Please check out the table of county code above.", UserWarning))
     
     try:
-        data_response=requests.get(url, headers={'authorization': 'Bearer '+access_token})
-    except:
-        return(warnings.warn("Your access token is invalid!", UserWarning))
-    js_data=json.loads(data_response.text)
+        # the long table of stop times is flattened while it is downloaded, the other one reads the records twice
+        if stoptimes:
+            # one row for every stop of every trip, the routes operated by frequency are not included
+            route_schedule=flatten(_fetch_records(url, access_token), BUS_SCHEDULE_STOPTIMES_SPEC, compact)
+        else:
+            js_data=_fetch_json(url, access_token)
+    except TDXError as e:
+        return(warnings.warn(str(e), UserWarning))
     
-    freq_tag=[len(js_data[i]['Frequencys']) if 'Frequencys' in js_data[i] else 0 for i in range(len(js_data))]
-    time_tag=[len(js_data[i]['Timetables']) if 'Timetables' in js_data[i] else 0 for i in range(len(js_data))]
-
-    route_info=dict()
-    label_all=['RouteUID','RouteID','RouteName','SubRouteUID','SubRouteID','SubRouteName','Direction']
-    for label_id in label_all:
-        route_info[label_id]=[js_data[i][label_id] if label_id in js_data[i] else None for i in range(len(js_data))]
-    route_info=pd.DataFrame(route_info)
-
-    route_info.RouteName=[route_info.RouteName[i]["Zh_tw"] for i in range(len(route_info))]
-    route_info.SubRouteName=[route_info.SubRouteName[i]["Zh_tw"] for i in range(len(route_info))]
-    route_info_freq=route_info.iloc[np.repeat(np.arange(len(route_info)), np.array(freq_tag))].reset_index(drop=True)
-    route_info_time=route_info.iloc[np.repeat(np.arange(len(route_info)), np.array(time_tag))].reset_index(drop=True)
-
-
-    freq_data=pd.DataFrame()
-    label_all=['StartTime','EndTime','MinHeadwayMins','MaxHeadwayMins','ServiceDay']
-    for temp_id in range(len(freq_tag)):
-        if freq_tag[temp_id]!=0:
-            freq_temp=dict()
-            for label_id in label_all:
-                freq_temp[label_id]=[js_data[temp_id]['Frequencys'][i][label_id] if label_id in js_data[temp_id]['Frequencys'][i] else None for i in range(len(js_data[temp_id]['Frequencys']))]
-                freq_temp=pd.DataFrame(freq_temp)
-            freq_data=pd.concat([freq_data, freq_temp]).reset_index(drop=True)
-    if len(freq_data)!=0:
-        freq_data=pd.concat([freq_data, pd.DataFrame(list(freq_data.ServiceDay))], axis=1).drop(['ServiceDay'], axis=1)
-    route_info_freq=pd.concat([route_info_freq, freq_data], axis=1)
-
-    time_data=pd.DataFrame()
-    label_all=['TripID','ServiceDay','StopTimes']
-    for temp_id in range(len(time_tag)):
-        if time_tag[temp_id]!=0:
-            time_temp=dict()
-            for label_id in label_all:
-                time_temp[label_id]=[js_data[temp_id]['Timetables'][i][label_id] if label_id in js_data[temp_id]['Timetables'][i] else None for i in range(len(js_data[temp_id]['Timetables']))]
-                time_temp=pd.DataFrame(time_temp)
-            time_data=pd.concat([time_data, time_temp]).reset_index(drop=True)
-    time_data=pd.concat([time_data, pd.DataFrame(list(time_data.ServiceDay))], axis=1).drop(['ServiceDay'], axis=1)
-
-    temp=list(time_data.StopTimes)
-    label_all=['StopSequence','StopUID','StopID','StopName','ArrivalTime','DepartureTime']
-    for label_id in label_all:
-        time_data[label_id]=[temp[i][0][label_id] for i in range(len(time_data))]
-    time_data.StopName=[time_data.StopName[i]['Zh_tw'] if len(time_data.StopName[i])!=0  else None for i in range(len(time_data))]
-    time_data=time_data.drop(['StopTimes'], axis=1)
-    route_info_time=pd.concat([route_info_time, time_data], axis=1)
-
-    route_schedule=pd.concat([route_info_freq, route_info_time]).reset_index(drop=True)
+    if stoptimes:
+        route_schedule['ArrivalSec']=time_to_seconds(route_schedule.ArrivalTime)
+        route_schedule['DepartureSec']=time_to_seconds(route_schedule.DepartureTime)
+    else:
+        freq_data=flatten(js_data, BUS_SCHEDULE_FREQUENCY_SPEC)
+        time_data=flatten(js_data, BUS_SCHEDULE_TIMETABLE_SPEC)
+        route_schedule=pd.concat([freq_data, time_data]).reset_index(drop=True)
+    if compact:
+        route_schedule=compact_dtypes(route_schedule)
     
     if out!=False:
-        route_schedule.to_csv(out, index=False)
+        write_out(route_schedule, out)
     return(route_schedule)
     
 
 
+@profiled
 def Bus_RouteFare(access_token, county, out=False):
-    if out!=False and ~pd.Series(out).str.contains('\.csv|\.txt')[0]:
-        return(warnings.warn("Export file must contain '.csv' or '.txt'!", UserWarning))
+    if out!=False and not valid_out(out, "text"):
+        return(warnings.warn("Export file must contain '.csv', '.txt', '.parquet' or '.feather'!", UserWarning))
     
     if county=="Intercity":
         url="https://tdx.transportdata.tw/api/basic/v2/Bus/RouteFare/InterCity?&$format=JSON"
@@ -625,107 +742,68 @@ def Bus_RouteFare(access_token, county, out=False):
         return(warnings.warn("'"+county+"' is not valid county. Please check out the table of county code above.", UserWarning))
     
     try:
-        data_response=requests.get(url, headers={'authorization': 'Bearer '+access_token})
-    except:
-        return(warnings.warn("Your access token is invalid!", UserWarning))
-    
-    js_data=json.loads(data_response.text)
+        js_data=_fetch_json(url, access_token)
+    except TDXError as e:
+        return(warnings.warn(str(e), UserWarning))
     
     if "Message" in js_data:
         return(warnings.warn("'"+county+"' does not provide fare data up to now.", UserWarning))
     
-    route_info=dict()
-    label_all=['RouteID','RouteName','OperatorID','OperatorNo','SubRouteID','SubRouteName','FarePricingType','IsFreeBus','IsForAllSubRoutes']
-    for label_id in label_all:
-        route_info[label_id]=[js_data[i][label_id] if label_id in js_data[i] else None for i in range(len(js_data))]
-    route_info=pd.DataFrame(route_info)
-    
-    if route_info.FarePricingType[0]==0:
-        bufferzone=list()
-        nodata=[dict({'SectionSequence':None, 'Direction':None, 'FareBufferZoneOrigin':{'StopID':None, 'StopName':None}, 'FareBufferZoneDestination':{'StopID':None, 'StopName':None}})]
-        for i in range(len(js_data)):
-            if len(js_data[i]['SectionFares'][0]['BufferZones'])!=0:
-                bufferzone=bufferzone+js_data[i]['SectionFares'][0]['BufferZones']
-            else:
-                bufferzone=bufferzone+nodata
+    # every route is parsed by its own pricing type: 0 section fare, 1 origin-destination fare, 2 stage fare
+    route_type={0:[], 1:[], 2:[]}
+    skipped=[]
+    for record in js_data:
+        route_type.get(record.get('FarePricingType'), skipped).append(record)
+    if len(skipped)!=0:
+        warnings.warn(str(len(skipped))+" route(s) without a FarePricingType of 0, 1 or 2 are not included: "+", ".join([str(i.get('RouteID'))+" ("+str(i.get('FarePricingType'))+")" for i in skipped[:20]])+(", ..." if len(skipped)>20 else ""), UserWarning)
+    
+    route_fare=dict(BufferZones=flatten(route_type[0], BUS_BUFFERZONE_SPEC),
+                    SectionFares=flatten(route_type[0], BUS_SECTIONFARE_SPEC),
+                    ODFares=flatten(route_type[1], BUS_ODFARE_SPEC),
+                    StageFares=flatten(route_type[2], BUS_STAGEFARE_SPEC))
+    
+    if out!=False:
+        for fare_type in route_fare:
+            if len(route_fare[fare_type])!=0:
+                write_out(route_fare[fare_type], os.path.splitext(out)[0]+"_"+fare_type+os.path.splitext(out)[1])
+    return(route_fare)
 
-        bufferzone=pd.DataFrame(bufferzone)
-        bufferzone=pd.concat([bufferzone, pd.DataFrame(list(bufferzone.FareBufferZoneOrigin))], axis=1).drop(['FareBufferZoneOrigin'], axis=1)
-        bufferzone=pd.concat([bufferzone, pd.DataFrame(list(bufferzone.FareBufferZoneDestination))], axis=1).drop(['FareBufferZoneDestination'], axis=1)
 
-        num_of_buffer=[len(js_data[i]['SectionFares'][0]['BufferZones']) for i in range(len(js_data))]
-        num_of_buffer=[1 if num_of_buffer[i]==0 else num_of_buffer[i] for i in range(len(num_of_buffer))]
-        route_info_buffer=route_info.iloc[np.repeat(np.arange(len(route_info)), num_of_buffer)].reset_index(drop=True)
-        route_buffer=pd.concat([route_info_buffer, bufferzone], axis=1)
 
-        sectionfare=list()
-        for i in range(len(js_data)):
-            sectionfare=sectionfare+js_data[i]['SectionFares'][0]['Fares']
-        sectionfare=pd.DataFrame(sectionfare)
+def _bus_realtime_url(county, record):
+    if county=="Intercity":
+        return("https://tdx.transportdata.tw/api/basic/v2/Bus/"+BUS_REALTIME_API[record]+"/InterCity?%24format=JSON")
+    return("https://tdx.transportdata.tw/api/basic/v2/Bus/"+BUS_REALTIME_API[record]+"/City/"+county+"?%24format=JSON")
 
-        num_of_fare=[len(js_data[i]['SectionFares'][0]['Fares']) for i in range(len(js_data))]
-        route_info_fare=route_info.iloc[np.repeat(np.arange(len(route_info)), num_of_fare)].reset_index(drop=True)
-        route_fare=pd.concat([route_info_fare, sectionfare], axis=1)
-        
-        if out!=False:
-            route_buffer.to_csv(out[0:out.find('.csv')]+"_BufferZones.csv", index=False)
-            route_fare.to_csv(out[0:out.find('.csv')]+"_SectionFares.csv", index=False)
-        return(dict(BufferZones=route_buffer, SectionFares=route_fare))
-        
-    elif route_info.FarePricingType[0]==1:
-        num_of_odfare=[len(js_data[i]['ODFares']) if 'ODFares' in js_data[i] else 1 for i in range(len(js_data))]
-        odfare=list()
-        nodata=[dict({'Direction':None, 'OriginStop':None, 'DestinationStop':{'StopID':None, 'StopName':None}, 'Fares':None})]
-        for i in range(len(js_data)):
-            if 'ODFares' in js_data[i]:
-                odfare=odfare+js_data[i]['ODFares']
-            else:
-                odfare=odfare+nodata
-        odfare=pd.DataFrame(odfare)
-
-        odfare['OriginStopID']=[odfare.OriginStop[i]['StopID'] if odfare.OriginStop[i]!=None else None for i in range(len(odfare))]
-        odfare['OriginStopName']=[odfare.OriginStop[i]['StopName'] if odfare.OriginStop[i]!=None else None for i in range(len(odfare))]
-        odfare['DestinationStopID']=[odfare.DestinationStop[i]['StopID'] if odfare.DestinationStop[i]!=None else None for i in range(len(odfare))]
-        odfare['DestinationStopName']=[odfare.DestinationStop[i]['StopName'] if odfare.DestinationStop[i]!=None else None for i in range(len(odfare))]
-        odfare['TicketType']=[odfare.Fares[i][0]['TicketType'] if odfare.Fares[i]!=None else None for i in range(len(odfare))]
-        odfare['FareClass']=[odfare.Fares[i][0]['FareClass'] if odfare.Fares[i]!=None else None for i in range(len(odfare))]
-        odfare['Price']=[odfare.Fares[i][0]['Price'] if odfare.Fares[i]!=None else None for i in range(len(odfare))]
-        odfare=odfare.drop(['OriginStop','DestinationStop','Fares'], axis=1)
-        
-        if out!=False:
-            odfare.to_csv(out, index=False)
-        return(odfare)
-    
-    elif route_info.FarePricingType[0]==2:
-        sequence_pair_no=[len(js_data[i]['StageFares']) for i in range(len(js_data))]
-        route_info=route_info.iloc[np.repeat(np.arange(len(route_info)), sequence_pair_no)].reset_index(drop=True)
-
-        label_all=['Direction','OriginStage','DestinationStage','Fares']
-        stagefare=dict()
-        for label_id in label_all:
-            stagefare[label_id]=[js_data[i]['StageFares'][j][label_id] for i in range(len(js_data)) for j in range(len(js_data[i]['StageFares']))]
-
-        stagefare=pd.DataFrame(stagefare)
-        stagefare=pd.concat([stagefare, pd.DataFrame(list(stagefare.OriginStage)).rename(columns={'StopID':'OriginStopID','StopName':'OriginStopName','Sequence':'OriginSequence'})], axis=1).drop(['OriginStage'], axis=1)
-        stagefare=pd.concat([stagefare, pd.DataFrame(list(stagefare.DestinationStage)).rename(columns={'StopID':'DestinationStopID','StopName':'DestinationStopName','Sequence':'DestinationSequence'})], axis=1).drop(['DestinationStage'], axis=1)
-        num_of_fare=[len(stagefare.Fares[i]) for i in range(len(stagefare))]
-        route_info=route_info.iloc[np.repeat(np.arange(len(route_info)), num_of_fare)].reset_index(drop=True)
-
-        fare_all=list()
-        for i in range(len(stagefare)):
-            fare_all=fare_all+list(stagefare.Fares[i])
-        fare_all=pd.DataFrame(fare_all)
-        route_fare=pd.concat([route_info, fare_all], axis=1)
-        
-        if out!=False:
-            route_fare.to_csv(out, index=False)
-        return(route_fare)
+
+
+@profiled
+def Bus_RealTime(access_token, county, record="position", out=False):
+    # one snapshot of the buses on the road: 'position' (RealTimeByFrequency), 'nearstop' (RealTimeNearStop)
+    # or 'eta' (EstimatedTimeOfArrival); realtime.Poller keeps taking them
+    if out!=False and not valid_out(out, "text"):
+        return(warnings.warn("Export file must contain '.csv', '.txt', '.parquet' or '.feather'!", UserWarning))
+    if record not in BUS_REALTIME_API:
+        return(warnings.warn("'"+str(record)+"' is not valid real-time record. Please use 'position', 'nearstop' or 'eta'.", UserWarning))
+    if county!="Intercity" and county not in list(tdx_county().Code):
+        print(tdx_county())
+        return(warnings.warn("'"+county+"' is not valid county. Please check out the table of county code above.", UserWarning))
+    
+    try:
+        bus_realtime=flatten(_fetch_records(_bus_realtime_url(county, record), access_token), BUS_REALTIME_SPEC[record])
+    except TDXError as e:
+        return(warnings.warn(str(e), UserWarning))
+    
+    if out!=False:
+        write_out(bus_realtime, out)
+    return(bus_realtime)
 
     
 
-def Rail_TimeTable(access_token, operator, record, out=False):
-    if out!=False and ~pd.Series(out).str.contains('\.csv|\.txt')[0]:
-        return(warnings.warn("Export file must contain '.csv' or '.txt'!", UserWarning))
+@profiled
+def Rail_TimeTable(access_token, operator, record, out=False, compact=False):
+    if out!=False and not valid_out(out, "text"):
+        return(warnings.warn("Export file must contain '.csv', '.txt', '.parquet' or '.feather'!", UserWarning))
     
     if record=="station":
         if operator=="TRA":
@@ -741,41 +819,13 @@ def Rail_TimeTable(access_token, operator, record, out=False):
             return(warnings.warn("'"+operator+"' is not allowed operator. Please check out the table of railway code above.", UserWarning))
         
         try:
-            data_response=requests.get(url, headers={'authorization': 'Bearer '+access_token})
+            data_all=_fetch_records(url, access_token, key="StationTimetables" if operator=="TRA" else None)
             if operator=="TRA":
-                data_all=json.loads(data_response.text)['StationTimetables']
-            else:
-                data_all=json.loads(data_response.text)
-        except:
-            return(warnings.warn("Your access token is invalid!", UserWarning))
-
-        if operator=="TRA":
-            temp=pd.DataFrame(data_all)
-            temp.StationName=[temp.StationName[i]['Zh_tw'] for i in range(len(temp))]
-            temp=pd.concat([temp, pd.DataFrame.from_records(temp.ServiceDay)], axis=1)
-            station_info=temp.drop(['Timetables','ServiceDay'], axis=1)
-            rail_timetable_temp=pd.DataFrame({'Sequence':list(chain(*[list(map(lambda x : x['Sequence'], temp.Timetables[i])) for i in range(len(temp))])),
-                                              'TrainNo':list(chain(*[list(map(lambda x : x['TrainNo'], temp.Timetables[i])) for i in range(len(temp))])),
-                                              'DestinationStationID':list(chain(*[list(map(lambda x : x['DestinationStationID'], temp.Timetables[i])) for i in range(len(temp))])),
-                                              'DestinationStationName':list(chain(*[list(map(lambda x : x['DestinationStationName']['Zh_tw'], temp.Timetables[i])) for i in range(len(temp))])),
-                                              'TrainTypeID':list(chain(*[list(map(lambda x : x['TrainTypeID'], temp.Timetables[i])) for i in range(len(temp))])),
-                                              'TrainTypeCode':list(chain(*[list(map(lambda x : x['TrainTypeCode'], temp.Timetables[i])) for i in range(len(temp))])),
-                                              'TrainTypeName':list(chain(*[list(map(lambda x : x['TrainTypeName']['Zh_tw'], temp.Timetables[i])) for i in range(len(temp))])),
-                                              'ArrivalTime':list(chain(*[list(map(lambda x : x['ArrivalTime'], temp.Timetables[i])) for i in range(len(temp))])),
-                                              'DepartureTime':list(chain(*[list(map(lambda x : x['DepartureTime'], temp.Timetables[i])) for i in range(len(temp))]))})
-        elif operator in ["TRTC","KRTC","TYMC","NTDLRT","KLRT"]:
-            temp=pd.DataFrame(data_all)
-            temp.StationName=[temp.StationName[i]['Zh_tw'] for i in range(len(temp))]
-            temp.DestinationStationName=[temp.DestinationStationName[i]['Zh_tw'] for i in range(len(temp))]
-            temp=pd.concat([temp, pd.DataFrame.from_records(temp.ServiceDay)], axis=1)
-            station_info=temp.drop(['Timetables','ServiceDay','SrcUpdateTime','UpdateTime','VersionID'], axis=1)
-            rail_timetable_temp=pd.DataFrame({'Sequence':list(chain(*[list(map(lambda x : x['Sequence'], temp.Timetables[i])) for i in range(len(temp))])),
-                                              'ArrivalTime':list(chain(*[list(map(lambda x : x['ArrivalTime'], temp.Timetables[i])) for i in range(len(temp))])),
-                                              'DepartureTime':list(chain(*[list(map(lambda x : x['DepartureTime'], temp.Timetables[i])) for i in range(len(temp))]))})
-
-        num_of_table=[len(temp.Timetables[i]) for i in range(len(temp))]
-        station_info=station_info.iloc[np.repeat(np.arange(len(station_info)), num_of_table)].reset_index(drop=True)
-        rail_timetable=pd.concat([station_info, rail_timetable_temp], axis=1)  
+                rail_timetable=flatten(data_all, TRA_STATIONTIMETABLE_SPEC, compact)
+            elif operator in ["TRTC","KRTC","TYMC","NTDLRT","KLRT"]:
+                rail_timetable=flatten(data_all, METRO_STATIONTIMETABLE_SPEC, compact)
+        except TDXError as e:
+            return(warnings.warn(str(e), UserWarning))
     
     elif record=="general":
         if operator=="TRA":
@@ -791,46 +841,259 @@ def Rail_TimeTable(access_token, operator, record, out=False):
             return(warnings.warn("'"+operator+"' is not allowed operator. Please check out the table of railway code above.", UserWarning))
 
         try:
-            data_response=requests.get(url, headers={'authorization': 'Bearer '+access_token})
+            data_all=_fetch_records(url, access_token, key="TrainTimetables" if operator in ["TRA","AFR"] else None)
             if operator in ["TRA","AFR"]:
-                data_all=json.loads(data_response.text)['TrainTimetables']
-            else:
-                data_all=json.loads(data_response.text)
-        except:
-            return(warnings.warn("Your access token is invalid!", UserWarning))
-
-        if operator in ["TRA","AFR"]:
-            temp=pd.DataFrame(data_all)
-            train_info=pd.DataFrame.from_records(temp.TrainInfo)
-            train_info.TrainTypeName=[train_info.TrainTypeName[i]['Zh_tw'] for i in range(len(train_info))]
-            train_info.StartingStationName=[train_info.StartingStationName[i]['Zh_tw'] for i in range(len(train_info))]
-            train_info.EndingStationName=[train_info.EndingStationName[i]['Zh_tw'] for i in range(len(train_info))]
-            train_info=pd.concat([train_info, pd.DataFrame.from_records(temp.ServiceDay)], axis=1)
-            rail_timetable_temp=pd.DataFrame({'StopSequence':list(chain(*[list(map(lambda x : x['StopSequence'], temp.StopTimes[i])) for i in range(len(temp))])),
-                                              'StationID':list(chain(*[list(map(lambda x : x['StationID'], temp.StopTimes[i])) for i in range(len(temp))])),
-                                              'StationName':list(chain(*[list(map(lambda x : x['StationName']['Zh_tw'], temp.StopTimes[i])) for i in range(len(temp))])),
-                                              'ArrivalTime':list(chain(*[list(map(lambda x : x['ArrivalTime'], temp.StopTimes[i])) for i in range(len(temp))])),
-                                              'DepartureTime':list(chain(*[list(map(lambda x : x['DepartureTime'], temp.StopTimes[i])) for i in range(len(temp))]))})
-        elif operator=="THSR":            
-            temp=pd.DataFrame.from_records(pd.DataFrame(data_all)['GeneralTimetable'])
-            train_info=pd.DataFrame.from_records(temp.GeneralTrainInfo)
-            train_info.StartingStationName=[train_info.StartingStationName[i]['Zh_tw'] for i in range(len(train_info))]
-            train_info.EndingStationName=[train_info.EndingStationName[i]['Zh_tw'] for i in range(len(train_info))]
-            train_info=pd.concat([train_info, pd.DataFrame.from_records(temp.ServiceDay)], axis=1)
-
-            rail_timetable_temp=pd.DataFrame({'StopSequence':list(chain(*[list(map(lambda x : x['StopSequence'], temp.StopTimes[i])) for i in range(len(temp))])),
-                                              'StationID':list(chain(*[list(map(lambda x : x['StationID'], temp.StopTimes[i])) for i in range(len(temp))])),
-                                              'StationName':list(chain(*[list(map(lambda x : x['StationName']['Zh_tw'], temp.StopTimes[i])) for i in range(len(temp))])),
-                                              'ArrivalTime':list(chain(*[[temp.StopTimes[i][j]['ArrivalTime'] if 'ArrivalTime' in temp.StopTimes[i][j].keys() else None for j in range(len(temp.StopTimes[i]))] for i in range(len(temp))])),
-                                              'DepartureTime':list(chain(*[[temp.StopTimes[i][j]['DepartureTime'] if 'DepartureTime' in temp.StopTimes[i][j].keys() else None for j in range(len(temp.StopTimes[i]))] for i in range(len(temp))]))})
-
-            
-        num_of_station=[len(temp.StopTimes[i]) for i in range(len(temp))]
-        train_info=train_info.iloc[np.repeat(np.arange(len(train_info)), num_of_station)].reset_index(drop=True)
-        rail_timetable=pd.concat([train_info, rail_timetable_temp], axis=1)  
+                rail_timetable=flatten(data_all, TRA_GENERALTIMETABLE_SPEC, compact)
+            elif operator=="THSR":
+                rail_timetable=flatten(data_all, THSR_GENERALTIMETABLE_SPEC, compact)
+        except TDXError as e:
+            return(warnings.warn(str(e), UserWarning))
     else:
         return(warnings.warn("'"+record+"' is not valid format of timetable. Please use 'station' or 'general'.", UserWarning))        
+    
+    # the names and train types repeat on every row, keep each of them once as a category
+    for label_id in ['StationName','DestinationStationName','StartingStationName','EndingStationName','TrainTypeID','TrainTypeCode','TrainTypeName']:
+        if label_id in rail_timetable.columns:
+            rail_timetable[label_id]=rail_timetable[label_id].astype("category")
+    rail_timetable['ArrivalSec']=time_to_seconds(rail_timetable.ArrivalTime)
+    rail_timetable['DepartureSec']=time_to_seconds(rail_timetable.DepartureTime)
+    if compact:
+        rail_timetable=compact_dtypes(rail_timetable)
         
     if out!=False:
-        rail_timetable.to_csv(out, index=False)
+        write_out(rail_timetable, out)
     return(rail_timetable)
+
+
+
+def _road_classes(roadclass):
+    # the road classes of tdx_roadclass() grouped by the authority publishing them, or None for an invalid one
+    roadclass=str(roadclass)
+    if roadclass not in list(tdx_roadclass().RoadClass):
+        return(None)
+    classes=list(ROAD_AUTHORITY) if roadclass=="ALL" else [roadclass]
+    authorities=dict()
+    for i in classes:
+        authorities.setdefault(ROAD_AUTHORITY[i], []).append(i)
+    return(authorities)
+
+
+
+def _road_url(record, authority, date=False):
+    if date!=False:
+        return("https://tdx.transportdata.tw/api/historical/v2/Historical/Road/Traffic/"+ROAD_API[record][0]+"/"+authority+"?Dates="+str(date)+"&%24format=JSON")
+    return("https://tdx.transportdata.tw/api/basic/v2/Road/Traffic/"+ROAD_API[record][0]+"/"+authority+"?%24format=JSON")
+
+
+
+def _road_ids(access_token, record, authority, classes):
+    # ids of the traffic records of 'record' on the road classes 'classes' of one authority, by road class
+    road, id_col=ROAD_CLASS_OF[record]
+    data=flatten(_fetch_records(_road_url(road, authority), access_token, ROAD_API[road][1]), ROAD_SPEC[road])
+    data=data.drop_duplicates(subset=id_col)
+    return({i:set(data[id_col][data.RoadClass.astype(str)==i]) for i in classes})
+
+
+
+def _road_records(access_token, record, roadclass, date=False):
+    # the road classes of one authority are filtered from its records
+    authorities=_road_classes(roadclass)
+    frames=[]
+    for authority, classes in authorities.items():
+        data=flatten(_fetch_records(_road_url(record, authority, date), access_token, ROAD_API[record][1]), ROAD_SPEC[record])
+        if 'RoadClass' in data.columns:
+            data=data[data.RoadClass.astype(str).isin(classes)]
+        elif record in ROAD_CLASS_OF and len(classes)<len([i for i in ROAD_AUTHORITY if ROAD_AUTHORITY[i]==authority]):
+            ids=set().union(*_road_ids(access_token, record, authority, classes).values())
+            data=data[data[ROAD_CLASS_OF[record][1]].isin(ids)]
+        frames.append(data)
+    return(pd.concat(frames, ignore_index=True))
+
+
+
+@profiled
+def Road_Section(access_token, roadclass, dtype="text", out=False):
+    # road sections with their shape, 'geometry' as WKT for 'text'
+    if dtype=="text":
+        if out!=False and not valid_out(out, "text"):
+            return(warnings.warn("Export file of 'text' must contain '.csv', '.txt', '.parquet' or '.feather'!", UserWarning))
+    elif dtype=="sf":
+        if out!=False and not valid_out(out, "sf"):
+            return(warnings.warn("Export file of 'sf' must contain '.shp', '.parquet' or '.feather'!", UserWarning))
+    else:
+        return(warnings.warn("'dtype' must be 'text' or 'sf'!", UserWarning))
+    if _road_classes(roadclass) is None:
+        print(tdx_roadclass())
+        return(warnings.warn("'"+str(roadclass)+"' is not valid road class. Please check out the table of road class code above.", UserWarning))
+    
+    try:
+        road_section=_road_records(access_token, "section", roadclass)
+        road_shape=pd.concat([flatten(_fetch_records(_road_url("shape", authority), access_token, ROAD_API["shape"][1]), ROAD_SPEC["shape"]) for authority in _road_classes(roadclass)])
+    except TDXError as e:
+        return(warnings.warn(str(e), UserWarning))
+    road_section=road_section.merge(road_shape.drop_duplicates(subset="SectionID").rename(columns={'Geometry':'geometry'}), on="SectionID", how="left")
+    
+    if dtype=="sf":
+        with stage("geometry", records=len(road_section)):
+            road_section['geometry']=shapely.from_wkt(road_section['geometry'].to_numpy(dtype=object))
+            road_section=gpd.GeoDataFrame(road_section, crs='epsg:4326')
+    if out!=False:
+        write_out(road_section, out)
+    return(road_section)
+
+
+
+@profiled
+def Road_VD(access_token, roadclass, dtype="text", out=False):
+    # vehicle detectors, one row for each link they detect
+    if dtype=="text":
+        if out!=False and not valid_out(out, "text"):
+            return(warnings.warn("Export file of 'text' must contain '.csv', '.txt', '.parquet' or '.feather'!", UserWarning))
+    elif dtype=="sf":
+        if out!=False and not valid_out(out, "sf"):
+            return(warnings.warn("Export file of 'sf' must contain '.shp', '.parquet' or '.feather'!", UserWarning))
+    else:
+        return(warnings.warn("'dtype' must be 'text' or 'sf'!", UserWarning))
+    if _road_classes(roadclass) is None:
+        print(tdx_roadclass())
+        return(warnings.warn("'"+str(roadclass)+"' is not valid road class. Please check out the table of road class code above.", UserWarning))
+    
+    try:
+        road_vd=_road_records(access_token, "vd", roadclass)
+    except TDXError as e:
+        return(warnings.warn(str(e), UserWarning))
+    
+    if dtype=="sf":
+        with stage("geometry", records=len(road_vd)):
+            road_vd['geometry']=gpd.points_from_xy(road_vd.PositionLon, road_vd.PositionLat, crs="EPSG:4326")
+            road_vd=gpd.GeoDataFrame(road_vd, crs='epsg:4326')
+    if out!=False:
+        write_out(road_vd, out)
+    return(road_vd)
+
+
+
+@profiled
+def Road_Traffic(access_token, roadclass, record="live", date=False, out=False):
+    # traffic of the road sections ('live'), the vehicle detectors ('vd_live') or the ETag pairs of the freeways ('etag_live'),
+    # live or of a past 'date' (e.g. "2024-01-01"); history.download() fetches many days at once
+    if out!=False and not valid_out(out, "text"):
+        return(warnings.warn("Export file must contain '.csv', '.txt', '.parquet' or '.feather'!", UserWarning))
+    if record not in ['live','vd_live','etag_live']:
+        return(warnings.warn("'"+str(record)+"' is not valid traffic record. Please use 'live', 'vd_live' or 'etag_live'.", UserWarning))
+    if _road_classes(roadclass) is None:
+        print(tdx_roadclass())
+        return(warnings.warn("'"+str(roadclass)+"' is not valid road class. Please check out the table of road class code above.", UserWarning))
+    if record=="etag_live" and str(roadclass) not in ["0","ALL"]:
+        return(warnings.warn("ETag gantries are only on the freeways, please use road class '0'.", UserWarning))
+    
+    try:
+        road_traffic=_road_records(access_token, record, "0" if record=="etag_live" else roadclass, date)
+    except TDXError as e:
+        return(warnings.warn(str(e), UserWarning))
+    
+    if out!=False:
+        write_out(road_traffic, out)
+    return(road_traffic)
+
+
+
+# fetchers reading a single list of records, which TDX can serve page by page through $top/$skip
+_PAGED=['Bus_Route','Bus_Shape','Bus_StopOfRoute','Rail_Shape','Rail_Station','Bike_Shape','Bike_Station','Bus_Schedule','Rail_TimeTable']
+
+
+def _iter_chunks(fetcher, args, kwargs, chunksize, out):
+    skip=0
+    while True:
+        with _odata_params(top=chunksize, skip=skip) as state:
+            try:
+                chunk=fetcher(*args, **kwargs)
+            except _EmptyPage:
+                return
+        # the fetcher has already warned about an invalid argument or a failed request
+        if chunk is None:
+            return
+        if out!=False:
+            with stage("export", records=len(chunk)):
+                if os.path.splitext(out)[1].lower()=='.shp':
+                    chunk.to_file(out, index=False, mode="w" if skip==0 else "a")
+                else:
+                    chunk.to_csv(out, index=False, mode="w" if skip==0 else "a", header=skip==0)
+        yield chunk
+        if state['records']<chunksize:
+            return
+        skip+=chunksize
+
+
+
+def iter_chunks(fetcher, *args, chunksize=1000, out=False, **kwargs):
+    if getattr(fetcher, "__name__", None) not in _PAGED:
+        return(warnings.warn("'iter_chunks' supports only "+", ".join(_PAGED)+"!", UserWarning))
+    # the pages are appended to the file, which Parquet and Feather do not support
+    if out!=False and os.path.splitext(out)[1].lower() not in ['.csv','.txt','.shp']:
+        return(warnings.warn("Export file of 'iter_chunks' must contain '.csv', '.txt' or '.shp'!", UserWarning))
+    # a shapefile holds only the geo data frames of dtype="sf"
+    if out!=False and os.path.splitext(out)[1].lower()=='.shp' and not valid_out(out, kwargs.get('dtype', "text")):
+        return(warnings.warn("Export file of 'iter_chunks' with '.shp' requires dtype='sf', please use '.csv' or '.txt' for 'text'!", UserWarning))
+    if chunksize<1:
+        return(warnings.warn("'chunksize' must be a positive number of records!", UserWarning))
+    return(_iter_chunks(fetcher, args, kwargs, int(chunksize), out))
+
+
+
+# fetchers that sync() can update record by record, with the columns identifying one record of TDX in their output
+_SYNC_KEYS={'Bus_Route':['RouteUID'],
+            'Bus_Shape':['RouteUID','SubRouteUID','Direction'],
+            'Bus_StopOfRoute':['SubRouteUID','Direction'],
+            'Bus_Schedule':['SubRouteUID','Direction'],
+            'Rail_Shape':['LineID'],
+            'Rail_Station':['StationUID'],
+            'Bike_Station':['StationUID']}
+
+
+def _sync_path(fetcher, args, kwargs):
+    name="_".join([fetcher.__name__]+[str(i) for i in args[1:]]+[str(kwargs[i]) for i in sorted(kwargs)])
+    return(os.path.join(os.path.expanduser("~"), ".cache", "nycu_tdx_py", "sync", name+".pkl"))
+
+
+
+@profiled
+def sync(fetcher, *args, snapshot=None, full=False, out=False, **kwargs):
+    # keep a local snapshot of a dataset and request only the records updated since the latest UpdateTime in it;
+    # records deleted by TDX are only dropped by a full download (full=True)
+    if getattr(fetcher, "__name__", None) not in _SYNC_KEYS:
+        return(warnings.warn("'sync' supports only "+", ".join(_SYNC_KEYS)+"!", UserWarning))
+    if out!=False and not valid_out(out, kwargs.get('dtype', "text")):
+        return(warnings.warn("Export file must contain '.csv', '.txt', '.shp', '.parquet' or '.feather'!", UserWarning))
+    snapshot=snapshot if snapshot is not None else _sync_path(fetcher, args, kwargs)
+    previous=pd.read_pickle(snapshot) if os.path.exists(snapshot) and not full else None
+
+    if previous is None or previous['updated'] is None:
+        with _odata_params() as state:
+            data=fetcher(*args, **kwargs)
+        if data is None:
+            return(None)
+        updated=state['updated']
+    else:
+        with _odata_params(filter="UpdateTime gt "+previous['updated']) as state:
+            try:
+                changes=fetcher(*args, **kwargs)
+            except _EmptyPage:
+                changes=previous['data'].iloc[0:0]
+        if changes is None:
+            return(None)
+        data=previous['data']
+        if len(changes)!=0:
+            # upsert: the rows of every changed record are replaced by the new ones
+            keys=[i for i in _SYNC_KEYS[fetcher.__name__] if i in data.columns and i in changes.columns]
+            changed=pd.MultiIndex.from_frame(data[keys]).isin(pd.MultiIndex.from_frame(changes[keys]))
+            data=pd.concat([data[~changed], changes]).reset_index(drop=True)
+        updated=max(previous['updated'], state['updated'] or previous['updated'])
+
+    os.makedirs(os.path.dirname(os.path.abspath(snapshot)), exist_ok=True)
+    temp=snapshot+".tmp"
+    pd.to_pickle({'data':data, 'updated':updated}, temp)
+    os.replace(temp, snapshot)
+    if out!=False:
+        write_out(data, out)
+    return(data)
@@ -0,0 +1,242 @@
+import datetime
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+from .flatten import time_to_seconds
+
+
+# next departures from a stop or station, e.g.
+#   tra_station=tdx.Rail_TimeTable(access_token, "TRA", "station")
+#   tra_general=tdx.Rail_TimeTable(access_token, "TRA", "general")
+#   index=timetable.TimetableIndex.from_frames([tra_station, tra_general])
+#   index.next_departures("1000", "08:00", "Monday", n=5)
+# the departures of every station are grouped by the days they run, and sorted by time within each group in one flat array,
+# so that a query is a binary search in each group running on that day; a stop and a station share the same ids in one index,
+# so the timetables of operators numbering their stations alike (e.g. TRA and THSR) go to separate indexes
+
+# service days of the timetables, bit i of a service-day mask
+WEEKDAYS=['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
+
+# columns naming the stop or station in the outputs of Bus_Schedule and Rail_TimeTable
+ID_COLUMNS=['StopUID','StationID']
+
+# columns identifying a trip, a train found in both the station and the general timetable is indexed once
+TRIP_COLUMNS=['TrainNo','TripID','Direction']
+
+# columns kept for each departure by default, when they are in the timetables
+KEEP_COLUMNS=['TrainNo','TripID','RouteUID','SubRouteUID','RouteID','LineID','Direction','TrainTypeName',
+              'DestinationStationID','DestinationStationName','EndingStationID','EndingStationName']
+
+# bits of the departure time in the sorted keys, the group of station and service days is above them
+TIME_BITS=20
+TIME_MASK=(1<<TIME_BITS)-1
+
+# 'H:MM', 'HH:MM' or 'HH:MM:SS' of a query, the hours may go past 24 like the times of a trip running after midnight
+_CLOCK=re.compile(r"^\s*(\d{1,3}):([0-5]\d)(?::([0-5]\d))?\s*$")
+
+
+
+def _seconds(value):
+    # seconds since midnight of 'H:MM', 'HH:MM:SS', a datetime or the seconds themselves
+    if isinstance(value, str):
+        match=_CLOCK.match(value)
+        if match is None:
+            raise ValueError("'"+value+"' is not a valid time, please use 'HH:MM' or 'HH:MM:SS'.")
+        return(int(match.group(1))*3600+int(match.group(2))*60+int(match.group(3) or 0))
+    if isinstance(value, (datetime.datetime, datetime.time)):
+        return(value.hour*3600+value.minute*60+value.second)
+    if int(value)<0:
+        raise ValueError("The time must not be negative, got "+str(value)+".")
+    return(int(value))
+
+
+
+def _weekday(value, time=None):
+    # 0 for Monday to 6 for Sunday, by name or the day of a datetime when not given
+    if value is None:
+        if not isinstance(time, datetime.datetime):
+            raise ValueError("'weekday' is required unless 'time' is a datetime.")
+        return(time.weekday())
+    return(WEEKDAYS.index(value) if isinstance(value, str) else int(value))
+
+
+
+def _clock(seconds):
+    return(["%02d:%02d" % (i//3600, i//60%60) for i in seconds.tolist()])
+
+
+
+def _departures(data, id_col, columns):
+    # one row for each departure: its station, times in seconds and service-day mask
+    id_col=id_col if id_col is not None else next((i for i in ID_COLUMNS if i in data.columns), None)
+    if id_col is None:
+        raise ValueError("The timetable does not contain any of the columns "+", ".join(ID_COLUMNS)+".")
+    times=dict()
+    for label_id in ['Arrival','Departure']:
+        if label_id+'Sec' in data.columns:
+            times[label_id]=data[label_id+'Sec'].to_numpy(dtype=np.int64)
+        elif label_id+'Time' in data.columns:
+            times[label_id]=time_to_seconds(data[label_id+'Time']).astype(np.int64)
+        else:
+            times[label_id]=np.full(len(data), -1, dtype=np.int64)
+    # the first stop of a train has no arrival time and the last one may have no departure time
+    departure=np.where(times['Departure']>=0, times['Departure'], times['Arrival'])
+    mask=np.zeros(len(data), dtype=np.int64)
+    for i, day in enumerate(WEEKDAYS):
+        if day in data.columns:
+            mask|=(pd.to_numeric(data[day], errors="coerce").fillna(0).to_numpy()!=0).astype(np.int64)<<i
+    if not any([i in data.columns for i in WEEKDAYS]):
+        mask[:]=(1<<len(WEEKDAYS))-1
+    departures=pd.DataFrame({'station':data[id_col].to_numpy(), 'departure':departure, 'arrival':times['Arrival'], 'mask':mask})
+    for label_id in columns:
+        if label_id in data.columns:
+            departures[label_id]=data[label_id].to_numpy()
+    return(departures[departures.station.notna() & (departures.departure>=0) & (departures['mask']!=0)])
+
+
+
+class TimetableIndex:
+    # the departures sorted by group (a station and a service-day mask) and time in 'keys', the groups of each station
+    # from 'station_offsets' and the departures of each group from 'group_offsets'; 'columns' are kept as codes into their labels
+    def __init__(self, stations, station_offsets, group_mask, group_offsets, keys, arrival, columns, id_col="StationID"):
+        self.stations=stations
+        self.station_offsets=station_offsets
+        self.group_mask=group_mask
+        self.group_offsets=group_offsets
+        self.keys=keys
+        self.arrival=arrival
+        self.columns=columns
+        self.id_col=id_col
+        self._index=None
+
+    @classmethod
+    def from_frames(cls, frames, id_col=None, columns=None):
+        # 'frames' of Rail_TimeTable ('station' or 'general') and Bus_Schedule (stop times or not), one or a list of them;
+        # the routes of Bus_Schedule operated by frequency have no departure times and are left out
+        frames=[frames] if isinstance(frames, pd.DataFrame) else list(frames)
+        columns=columns if columns is not None else [i for i in KEEP_COLUMNS if any([i in j.columns for j in frames])]
+        data=pd.concat([_departures(i, id_col, columns) for i in frames], ignore_index=True)
+        data=data.drop_duplicates(subset=['station','mask','departure']+[i for i in TRIP_COLUMNS if i in data.columns], ignore_index=True)
+        id_col=id_col if id_col is not None else next((i for i in ID_COLUMNS if i in frames[0].columns), ID_COLUMNS[-1])
+
+        stations, station=np.unique(data.station.to_numpy().astype(str), return_inverse=True)
+        groups, group=np.unique(station.astype(np.int64)*256+data['mask'].to_numpy(), return_inverse=True)
+        departure=data.departure.to_numpy()
+        order=np.lexsort((departure, group))
+        keys=(group[order].astype(np.int64)<<TIME_BITS)|departure[order]
+        station_offsets=np.searchsorted(groups//256, np.arange(len(stations)+1)).astype(np.int64)
+        group_offsets=np.searchsorted(group[order], np.arange(len(groups)+1)).astype(np.int64)
+
+        kept=dict()
+        for label_id in columns:
+            codes, labels=pd.factorize(data[label_id].to_numpy()[order])
+            labels=np.asarray(labels)
+            labels=labels.astype(str) if labels.dtype==object else labels
+            if (codes<0).any():
+                labels=np.append(labels, "" if labels.dtype.kind=="U" else np.nan)
+                codes=np.where(codes<0, len(labels)-1, codes)
+            kept[label_id]=(codes.astype(np.int32), labels)
+        return(cls(stations, station_offsets, (groups%256).astype(np.uint8), group_offsets, keys, data.arrival.to_numpy()[order].astype(np.int32), kept, id_col))
+
+    def __len__(self):
+        return(len(self.keys))
+
+    def _lookup(self):
+        # hash table of the stations, built on first use; an object index looks the queries up without converting them to arrow strings
+        if self._index is None:
+            self._index=pd.Index(self.stations, dtype=object)
+        return(self._index)
+
+    def search(self, stations, times, weekdays, n=5):
+        # positions of the next 'n' departures at or after 'times' (seconds) on 'weekdays' (0 for Monday) from each of 'stations',
+        # in order of time, shape (queries, n) with -1 where fewer depart
+        stations, times, weekdays=np.broadcast_arrays(np.atleast_1d(np.asarray(stations, dtype=object)), np.atleast_1d(times), np.atleast_1d(weekdays))
+        times=times.astype(np.int64)
+        if (times<0).any():
+            raise ValueError("The times must not be negative.")
+        times=np.minimum(times, TIME_MASK)
+        weekdays=weekdays.astype(np.int64)
+        num=len(stations)
+        station=self._lookup().get_indexer(pd.Index(stations, dtype=object))
+
+        # every group of the station, kept when it runs on the weekday
+        first=np.where(station>=0, self.station_offsets[station], 0)
+        count=np.where(station>=0, self.station_offsets[station+1]-first, 0)
+        query=np.repeat(np.arange(num), count)
+        group=np.arange(count.sum())-np.repeat(np.cumsum(count)-count, count)+np.repeat(first, count)
+        keep=((self.group_mask[group].astype(np.int64)>>weekdays[query])&1)==1
+        query, group=query[keep], group[keep]
+
+        # the first n departures of each group, then the n earliest of the groups of a query
+        start=np.searchsorted(self.keys, (group<<TIME_BITS)|times[query])
+        position=start[:,None]+np.arange(n)[None,:]
+        valid=position<self.group_offsets[group+1][:,None]
+        per_query=np.bincount(query, minlength=num)
+        width=max(int(per_query.max()) if num!=0 else 0, 1)*n
+        rank=np.arange(len(query))-np.repeat(np.cumsum(per_query)-per_query, per_query)
+        candidate=np.full((num, width), -1, dtype=np.int64)
+        seconds=np.full((num, width), TIME_MASK+1, dtype=np.int64)
+        column=rank[:,None]*n+np.arange(n)[None,:]
+        candidate[query[:,None], column]=np.where(valid, position, -1)
+        seconds[query[:,None], column]=np.where(valid, self.keys[np.minimum(position, len(self.keys)-1)]&TIME_MASK, TIME_MASK+1)
+        order=np.argsort(seconds, axis=1, kind="stable")[:,:n]
+        return(np.take_along_axis(candidate, order, axis=1))
+
+    def _search_one(self, station, seconds, weekday, n):
+        # search() of a single query, through the few groups of the station rather than arrays of queries
+        try:
+            station=self._lookup().get_loc(station)
+        except KeyError:
+            return(np.array([], dtype=np.int64))
+        if seconds<0:
+            raise ValueError("The time must not be negative, got "+str(seconds)+".")
+        seconds=min(seconds, TIME_MASK)
+        positions=[]
+        for group in range(int(self.station_offsets[station]), int(self.station_offsets[station+1])):
+            if (int(self.group_mask[group])>>weekday)&1:
+                start=int(np.searchsorted(self.keys, (group<<TIME_BITS)|seconds))
+                positions.extend(range(start, min(start+n, int(self.group_offsets[group+1]))))
+        positions=np.array(positions, dtype=np.int64)
+        return(positions[np.argsort(self.keys[positions]&TIME_MASK, kind="stable")[:n]])
+
+    def frame(self, positions):
+        # the departures at 'positions' of search() as a data frame
+        positions=np.asarray(positions).ravel()
+        positions=positions[positions>=0]
+        group=self.keys[positions]>>TIME_BITS
+        station=np.searchsorted(self.station_offsets, group, side="right")-1
+        departure=self.keys[positions]&TIME_MASK
+        # built at once, every column added to a data frame costs more than the search of a few departures
+        data={self.id_col:self.stations[station], 'DepartureTime':_clock(departure), 'DepartureSec':departure.astype(np.int32), 'ArrivalSec':self.arrival[positions]}
+        for label_id, (codes, labels) in self.columns.items():
+            data[label_id]=labels[codes[positions]]
+        return(pd.DataFrame(data))
+
+    def next_departures(self, station, time, weekday=None, n=5):
+        # the next 'n' departures from 'station' at or after 'time' ('HH:MM', seconds or a datetime) on 'weekday'
+        # ('Monday' or 0 to 'Sunday' or 6, the day of 'time' by default) as a data frame
+        return(self.frame(self._search_one(station, _seconds(time), _weekday(weekday, time), n)))
+
+    def save(self, path):
+        # plain .npy files, so that load() can memory-map them and worker processes share the pages
+        os.makedirs(path, exist_ok=True)
+        for name in ['stations','station_offsets','group_mask','group_offsets','keys','arrival']:
+            np.save(os.path.join(path, name+".npy"), np.ascontiguousarray(getattr(self, name)))
+        for i, (label_id, (codes, labels)) in enumerate(self.columns.items()):
+            np.save(os.path.join(path, "codes"+str(i)+".npy"), codes)
+            np.save(os.path.join(path, "labels"+str(i)+".npy"), labels)
+        with open(os.path.join(path, "index.json"), "w") as f:
+            json.dump({'id_col':self.id_col, 'columns':list(self.columns), 'size':len(self)}, f)
+        return(path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, "index.json")) as f:
+            meta=json.load(f)
+        mmap_mode="r" if mmap else None
+        arrays={name:np.load(os.path.join(path, name+".npy"), mmap_mode=mmap_mode) for name in ['stations','station_offsets','group_mask','group_offsets','keys','arrival']}
+        columns={label_id:(np.load(os.path.join(path, "codes"+str(i)+".npy"), mmap_mode=mmap_mode), np.load(os.path.join(path, "labels"+str(i)+".npy")))
+                 for i, label_id in enumerate(meta['columns'])}
+        return(cls(columns=columns, id_col=meta['id_col'], **arrays))
@@ -0,0 +1,223 @@
+import json
+import os
+import warnings
+import numpy as np
+import pandas as pd
+
+
+# travel time between any two stops of a subroute, e.g.
+#   bus_traveltime=tdx.Bus_TravelTime(access_token, "Taipei", routeid)
+#   bus_stops=tdx.Bus_StopOfRoute(access_token, "Taipei")
+#   index=traveltime.TravelTimeIndex.from_frames(bus_traveltime, bus_stops)
+#   index.travel_time("TPE157462", 0, "TPE38353", "TPE38360", weekday=1, hour=8)
+# the run times between adjacent stops of every subroute, direction and time band (Weekday, StartHour to EndHour) are
+# summed once along the stop sequence into flat arrays, so that any lookup is the difference of two prefix sums
+
+WEEKDAYS=7
+HOURS=24
+
+
+
+def _keys(subroute, direction):
+    # one key for each subroute and direction
+    direction=pd.to_numeric(pd.Series(np.asarray(direction, dtype=object)), errors="coerce").fillna(-1).astype(np.int64).astype(str)
+    return((pd.Series(np.asarray(subroute, dtype=object)).astype(str)+"|"+direction).to_numpy())
+
+
+
+def _band_key(weekday, hour):
+    # the Weekday (0 Sunday to 6 Saturday, as in Bus_TravelTime) and hour of one query as integers
+    code, number=pd.to_numeric(pd.Series([weekday, hour], dtype=object), errors="coerce").tolist()
+    if code not in range(WEEKDAYS):
+        raise ValueError("'weekday' must be 0 (Sunday), 1, 2, 3, 4, 5 or 6 (Saturday) as in Bus_TravelTime, not "+repr(weekday)+".")
+    if number not in range(HOURS):
+        raise ValueError("'hour' must be an integer from 0 to "+str(HOURS-1)+", not "+repr(hour)+".")
+    return(int(code), int(number))
+
+
+
+class TravelTimeIndex:
+    # stops of every subroute and direction in sequence ('offsets' into 'stops'), and for every time band the cumulative run time
+    # from the first stop ('band_start' into 'cumulative') with the number of missing run times passed ('missing')
+    def __init__(self, patterns, offsets, stop_ids, stops, band_of, band_start, cumulative, missing, id_col="StopUID"):
+        self.patterns=patterns
+        self.offsets=offsets
+        self.stop_ids=stop_ids
+        self.stops=stops
+        self.band_of=band_of
+        self.band_start=band_start
+        self.cumulative=cumulative
+        self.missing=missing
+        self.id_col=id_col
+        self._index=None
+        self._scalar=None
+
+    @classmethod
+    def from_frames(cls, traveltime, stopofroute, id_col="StopUID"):
+        # 'traveltime' of Bus_TravelTime and 'stopofroute' of Bus_StopOfRoute, the stops are named by its column 'id_col' in the queries
+        stops=pd.DataFrame({'key':_keys(stopofroute.SubRouteUID, stopofroute.Direction), 'StopID':stopofroute.StopID.astype(str).to_numpy(),
+                            'stop':stopofroute[id_col].astype(str).to_numpy(), 'sequence':pd.to_numeric(stopofroute.StopSequence, errors="coerce").to_numpy()})
+        stops=stops.drop_duplicates(subset=['key','sequence']).sort_values(['key','sequence'], kind="stable", ignore_index=True)
+        patterns, pattern=np.unique(stops.key.to_numpy().astype(str), return_inverse=True)
+        offsets=np.concatenate([[0], np.cumsum(np.bincount(pattern, minlength=len(patterns)))]).astype(np.int64)
+        stop_ids, stop=np.unique(stops.stop.to_numpy().astype(str), return_inverse=True)
+
+        # the run time of a segment is that of its two stops in sequence
+        row=np.nonzero(pattern[1:]==pattern[:-1])[0]
+        segments=pd.DataFrame({'key':stops.key.to_numpy()[row], 'FromStopID':stops.StopID.to_numpy()[row], 'ToStopID':stops.StopID.to_numpy()[row+1], 'row':row})
+        travel=pd.DataFrame({'key':_keys(traveltime.SubRouteUID, traveltime.Direction),
+                             'FromStopID':traveltime.FromStopID.astype(str).to_numpy(), 'ToStopID':traveltime.ToStopID.astype(str).to_numpy()})
+        for label_id in ['Weekday','StartHour','EndHour','RunTime']:
+            travel[label_id]=pd.to_numeric(traveltime[label_id], errors="coerce").to_numpy()
+        travel=travel.dropna(subset=['Weekday','StartHour','EndHour','RunTime'])
+        travel=travel[(travel.Weekday>=0) & (travel.Weekday<WEEKDAYS)]
+        travel=travel.merge(segments, on=['key','FromStopID','ToStopID'], how="inner")
+        travel['band']=travel.groupby(['key','Weekday','StartHour','EndHour'], sort=True).ngroup()
+        travel=travel.drop_duplicates(subset=['band','row'])
+        bands=travel.drop_duplicates(subset='band').sort_values('band')
+        band_pattern=np.searchsorted(patterns, bands.key.to_numpy().astype(str))
+
+        length=offsets[band_pattern+1]-offsets[band_pattern]
+        band_start=(np.cumsum(length)-length).astype(np.int64)
+        runtime=np.zeros(int(length.sum()), dtype=np.int64)
+        missing=np.ones(len(runtime), dtype=np.int64)
+        missing[band_start]=0
+        band=travel.band.to_numpy()
+        position=band_start[band]+travel.row.to_numpy()-offsets[band_pattern[band]]+1
+        runtime[position]=travel.RunTime.to_numpy()
+        missing[position]=0
+        # prefix sums restarting at the first stop of every band, whose own value is always 0
+        cumulative=np.cumsum(runtime)
+        cumulative-=np.repeat(cumulative[band_start], length)
+        missing=np.cumsum(missing)
+        missing-=np.repeat(missing[band_start], length)
+
+        # the band of every weekday and hour, a band ending at or before its start runs past midnight
+        band_of=np.full((len(patterns), WEEKDAYS, HOURS), -1, dtype=np.int32)
+        start, end=bands.StartHour.to_numpy()[:,None], bands.EndHour.to_numpy()[:,None]
+        hour=np.arange(HOURS)[None,:]
+        inside=np.where(start<end, (hour>=start)&(hour<end), (hour>=start)|(hour<end))
+        b, h=np.nonzero(inside)
+        band_of[band_pattern[b], bands.Weekday.to_numpy().astype(np.int64)[b], h]=b
+        return(cls(patterns, offsets, stop_ids, stop.astype(np.int32), band_of, band_start, cumulative.astype(np.int32), missing.astype(np.int32), id_col))
+
+    def __len__(self):
+        return(len(self.patterns))
+
+    def _lookup(self):
+        # hash tables of the subroutes, the stops and the position of a stop on a subroute, built on first use;
+        # a stop visited twice by a loop is boarded at its first visit and alighted at its last
+        if self._index is None:
+            row_pattern=np.repeat(np.arange(len(self.patterns), dtype=np.int64), np.diff(self.offsets))
+            key=row_pattern*len(self.stop_ids)+self.stops
+            unique, first=np.unique(key, return_index=True)
+            last=len(key)-1-np.unique(key[::-1], return_index=True)[1]
+            # object indexes: the queries are looked up without being converted to arrow strings first
+            self._index=(pd.Index(self.patterns, dtype=object), pd.Index(self.stop_ids, dtype=object), pd.Index(unique), first, last)
+        return(self._index)
+
+    def _scalar_lookup(self):
+        # the same as dictionaries, a single lookup costs less than building the arrays of one query
+        if self._scalar is None:
+            patterns=dict(zip(self.patterns.tolist(), range(len(self.patterns))))
+            row_pattern=np.repeat(np.arange(len(self.patterns)), np.diff(self.offsets)).tolist()
+            first, last=dict(), dict()
+            for row, key in enumerate(zip(row_pattern, self.stop_ids[self.stops].tolist())):
+                first.setdefault(key, row)
+                last[key]=row
+            self._scalar=(patterns, first, last)
+        return(self._scalar)
+
+    def _travel_time(self, subroute, direction, from_stop, to_stop, weekday, hour):
+        patterns, first, last=self._scalar_lookup()
+        pattern=patterns.get(str(subroute)+"|"+str(int(direction)))
+        origin, destination=first.get((pattern, str(from_stop))), last.get((pattern, str(to_stop)))
+        if origin is None or destination is None or origin>destination or not (0<=weekday<WEEKDAYS and 0<=hour<HOURS):
+            return(np.nan)
+        band=int(self.band_of[pattern, weekday, hour])
+        if band<0:
+            return(np.nan)
+        base=int(self.band_start[band])-int(self.offsets[pattern])
+        if self.missing[base+destination]!=self.missing[base+origin]:
+            return(np.nan)
+        return(float(self.cumulative[base+destination]-self.cumulative[base+origin]))
+
+    def _positions(self, pattern, stop, rows):
+        found=(pattern>=0)&(stop>=0)
+        position=np.full(len(pattern), -1, dtype=np.int64)
+        position[found]=self._lookup()[2].get_indexer(pattern[found]*len(self.stop_ids)+stop[found])
+        return(np.where(position>=0, rows[position], -1))
+
+    def travel_time(self, subroute, direction, from_stop, to_stop, weekday, hour):
+        # seconds from 'from_stop' to 'to_stop' on a subroute in the band of 'weekday' and 'hour'; arrays give one value for each element,
+        # NaN where the subroute, a stop or the band is unknown, the destination comes before the origin or a run time between them is missing
+        if all([np.ndim(i)==0 for i in [subroute, direction, from_stop, to_stop, weekday, hour]]):
+            return(self._travel_time(subroute, direction, from_stop, to_stop, int(weekday), int(hour)))
+        values=np.broadcast_arrays(*[np.asarray(i, dtype=object) for i in [subroute, direction, from_stop, to_stop, weekday, hour]])
+        shape=values[0].shape
+        subroute, direction, from_stop, to_stop, weekday, hour=[i.ravel() for i in values]
+        patterns, stop_ids, keys, first, last=self._lookup()
+        # the keys of a few thousand subroutes are built once rather than for every query
+        subroute, subroutes=pd.factorize(subroute)
+        direction, directions=pd.factorize(direction)
+        code, pairs=pd.factorize(subroute*len(directions)+direction)
+        pattern=patterns.get_indexer(pd.Index(_keys(subroutes[pairs//len(directions)], directions[pairs%len(directions)]), dtype=object))[code]
+        origin=self._positions(pattern, stop_ids.get_indexer(pd.Index(from_stop, dtype=object)), first)
+        destination=self._positions(pattern, stop_ids.get_indexer(pd.Index(to_stop, dtype=object)), last)
+        weekday=pd.to_numeric(pd.Series(weekday), errors="coerce").fillna(-1).to_numpy().astype(np.int64)
+        hour=pd.to_numeric(pd.Series(hour), errors="coerce").fillna(-1).to_numpy().astype(np.int64)
+
+        valid=(origin>=0)&(destination>=0)&(origin<=destination)&(weekday>=0)&(weekday<WEEKDAYS)&(hour>=0)&(hour<HOURS)
+        band=np.full(len(pattern), -1, dtype=np.int64)
+        band[valid]=self.band_of[pattern[valid], weekday[valid], hour[valid]]
+        valid&=band>=0
+        base=self.band_start[band[valid]]-self.offsets[pattern[valid]]
+        origin, destination=base+origin[valid], base+destination[valid]
+        seconds=(self.cumulative[destination]-self.cumulative[origin]).astype(float)
+        seconds[self.missing[destination]!=self.missing[origin]]=np.nan
+        result=np.full(len(pattern), np.nan)
+        result[valid]=seconds
+        return(result.reshape(shape))
+
+    def lookup(self, data, from_col=None, to_col=None):
+        # travel_time() of every row of a data frame of SubRouteUID, Direction, Weekday, Hour, and the origin and destination
+        # in 'from_col' and 'to_col' ('FromStopUID' and 'ToStopUID' by default)
+        from_col=from_col if from_col is not None else "From"+self.id_col
+        to_col=to_col if to_col is not None else "To"+self.id_col
+        seconds=self.travel_time(data.SubRouteUID.to_numpy(), data.Direction.to_numpy(), data[from_col].to_numpy(), data[to_col].to_numpy(), data.Weekday.to_numpy(), data.Hour.to_numpy())
+        return(pd.Series(seconds, index=data.index, name="TravelTime"))
+
+    def matrix(self, subroute, direction, weekday, hour):
+        # travel times between all the stops of one subroute, origins by row and destinations by column
+        weekday, hour=_band_key(weekday, hour)
+        pattern=self._lookup()[0].get_indexer(_keys([subroute], [direction]))[0]
+        if pattern<0:
+            return(warnings.warn("'"+str(subroute)+"' of direction "+str(direction)+" is not in the index.", UserWarning))
+        start, end=self.offsets[pattern], self.offsets[pattern+1]
+        ids=self.stop_ids[self.stops[start:end]]
+        band=self.band_of[pattern, weekday, hour]
+        if band<0:
+            return(pd.DataFrame(np.nan, index=ids, columns=ids))
+        base=self.band_start[band]
+        cumulative=self.cumulative[base:base+end-start].astype(float)
+        missing=self.missing[base:base+end-start]
+        seconds=cumulative[None,:]-cumulative[:,None]
+        seconds[(missing[None,:]!=missing[:,None]) | np.tri(end-start, k=-1, dtype=bool)]=np.nan
+        return(pd.DataFrame(seconds, index=ids, columns=ids))
+
+    def save(self, path):
+        # plain .npy files, so that load() can memory-map them and worker processes share the pages
+        os.makedirs(path, exist_ok=True)
+        for name in ['patterns','offsets','stop_ids','stops','band_of','band_start','cumulative','missing']:
+            np.save(os.path.join(path, name+".npy"), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(path, "index.json"), "w") as f:
+            json.dump({'id_col':self.id_col, 'size':len(self)}, f)
+        return(path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, "index.json")) as f:
+            meta=json.load(f)
+        arrays={name:np.load(os.path.join(path, name+".npy"), mmap_mode="r" if mmap else None)
+                for name in ['patterns','offsets','stop_ids','stops','band_of','band_start','cumulative','missing']}
+        return(cls(id_col=meta['id_col'], **arrays))
@@ -0,0 +1,107 @@
+import asyncio
+import time
+import warnings
+import pandas as pd
+import pytest
+from mock_server import MockTDX
+from nycu_tdx_py import aio, client, tdx
+
+
+aiohttp=pytest.importorskip("aiohttp")
+
+
+
+@pytest.fixture
+def mock():
+    with MockTDX(routes=5, stops=5, trips=2) as mock:
+        client.configure(base_url=mock.base_url, rate=None, backoff=0.01)
+        aio.configure()
+        yield mock
+    client.set_client(None)
+
+
+
+def run(awaitable):
+    # every asyncio.run() has its own loop, the session is closed before it ends
+    async def main():
+        try:
+            return(await awaitable)
+        finally:
+            await aio.close()
+    return(asyncio.run(main()))
+
+
+
+def test_fetcher_matches_the_blocking_one(mock):
+    result=run(aio.Bus_StopOfRoute("mock-token", "Taipei"))
+    expected=tdx.Bus_StopOfRoute("mock-token", "Taipei")
+    pd.testing.assert_frame_equal(result, expected)
+
+
+
+def test_requests_are_not_bounded_by_threads(mock):
+    # each response takes 0.5 s, the 100 fetchers are answered together rather than 32 at a time
+    mock.delay=0.5
+    async def fetch():
+        return(await asyncio.gather(*[aio.Bus_Route("mock-token", "Taipei") for i in range(100)]))
+    start=time.monotonic()
+    results=run(fetch())
+    assert all([len(i)==10 for i in results])
+    assert mock.peak>32
+    assert time.monotonic()-start<3
+
+
+
+def test_gather_counties(mock):
+    counties=list(tdx.tdx_county().Code)
+    results=run(aio.gather_counties(aio.Bus_Route, "mock-token", counties))
+    expected=tdx.Bus_Route("mock-token", "Taipei")
+    assert all([isinstance(results[i], pd.DataFrame) and len(results[i])==len(expected) for i in counties]), results
+
+
+
+def test_requests_of_one_fetcher_are_sent_together(mock):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        result=run(aio.Bus_TravelTime("mock-token", "Taipei", ["TPE%d" % i for i in range(40)]))
+    assert len(result)==40*len(tdx.Bus_TravelTime("mock-token", "Taipei", ["TPE0"]))
+
+
+
+def test_retry_after_of_429_is_honored(mock):
+    client.configure(base_url=mock.base_url, rate=5, backoff=0.01)
+    aio.configure()
+    mock.fail(2, status=429, retry_after=0.5)
+    start=time.monotonic()
+    result=run(aio.Bus_Route("mock-token", "Taipei"))
+    assert time.monotonic()-start>=1.0
+    assert len(result)==10
+    assert mock.requests==3
+
+
+
+def test_server_errors_are_retried_then_reported(mock):
+    aio.configure(max_retries=2)
+    mock.fail(3, status=503)
+    with pytest.warns(UserWarning, match="503"):
+        result=run(aio.Bus_Route("mock-token", "Taipei"))
+    assert result is None
+    assert mock.requests==3
+    assert len(run(aio.Bus_Route("mock-token", "Taipei")))==10
+
+
+
+def test_settings_follow_the_blocking_client(mock):
+    async_client=aio.get_async_client()
+    shared=client.configure(base_url=mock.base_url+"/", rate=7, max_retries=1, timeout=30)
+    assert async_client.limiter is shared.limiter
+    assert (async_client.base_url, async_client.max_retries, async_client.timeout)==(mock.base_url+"/", 1, 30)
+    # a request is throttled by the same bucket as the blocking client
+    tokens=shared.limiter.tokens
+    assert len(run(aio.Bus_Route("mock-token", "Taipei")))==10
+    assert shared.limiter.tokens<tokens
+    limiter=client.RateLimiter(rate=2)
+    aio.configure(limiter=limiter, max_retries=4)
+    assert aio.get_async_client().limiter is limiter
+    assert aio.get_async_client().max_retries==4
+    assert aio.get_async_client().base_url==mock.base_url+"/"
@@ -0,0 +1,92 @@
+import os
+import threading
+from nycu_tdx_py import client
+from nycu_tdx_py.cache import ResponseCache
+from mock_server import MockTDX
+
+
+URL="https://tdx.transportdata.tw/api/basic/v2/Bus/Route/City/Taipei?%24format=JSON"
+
+
+
+class Response:
+    headers={'ETag':'"1"'}
+
+
+
+def test_missing_or_corrupt_file_is_a_miss(tmp_path):
+    cache=ResponseCache(str(tmp_path))
+    cache.store(URL, [{'RouteUID':'TPE1'}], Response())
+    os.remove(cache._file(cache.key(URL)))
+    assert cache.load(URL) is None
+    cache.store(URL, [{'RouteUID':'TPE1'}], Response())
+    with open(cache._file(cache.key(URL)), "wb") as f:
+        f.write(b"not a pickle")
+    assert cache.load(URL) is None
+    assert cache.lookup(URL)==(None, False)
+
+
+
+def test_evicted_entry_is_requested_again(tmp_path):
+    with MockTDX(routes=5) as mock:
+        tdx_client=client.TDXClient(base_url=mock.base_url, rate=None)
+        tdx_client.enable_cache(str(tmp_path))
+        first=tdx_client.get_json(URL, "mock-token")
+        # evicted by another thread or process between lookup() and load()
+        lookup=tdx_client.cache.lookup
+        def evicting(url):
+            result=lookup(url)
+            os.remove(tdx_client.cache._file(tdx_client.cache.key(url)))
+            return(result)
+        tdx_client.cache.lookup=evicting
+        assert tdx_client.get_json(URL, "mock-token")==first
+        assert mock.requests==2
+
+
+
+def test_processes_sharing_a_directory_keep_each_other_entries(tmp_path):
+    # two instances stand for two processes, each with its own copy of the index
+    first=ResponseCache(str(tmp_path))
+    second=ResponseCache(str(tmp_path))
+    first.store(URL, [1], Response())
+    second.store(URL.replace("Taipei", "Taichung"), [2], Response())
+    third=ResponseCache(str(tmp_path))
+    assert len(third.index)==2
+    assert first.load(URL.replace("Taipei", "Taichung"))==[2]
+    assert second.load(URL)==[1]
+
+
+
+def test_eviction_counts_the_entries_of_every_process(tmp_path):
+    first=ResponseCache(str(tmp_path))
+    first.store(URL, list(range(100)), Response())
+    size=first.index[first.key(URL)]['size']
+    second=ResponseCache(str(tmp_path), max_size=int(size*1.5))
+    other=URL.replace("Taipei", "Taichung")
+    first.store(other, list(range(100)), Response())
+    # the entry of 'first' is the least recently used one, the second instance drops it although it did not store it
+    second.store(URL.replace("Taipei", "Tainan"), list(range(100)), Response())
+    assert list(ResponseCache(str(tmp_path)).index)==[second.key(URL.replace("Taipei", "Tainan"))]
+    assert not os.path.exists(first._file(first.key(URL)))
+    assert first.load(other) is None
+
+
+
+def test_concurrent_store_and_load(tmp_path):
+    cache=ResponseCache(str(tmp_path), max_size=2000)
+    errors=[]
+    def work(i):
+        try:
+            for j in range(50):
+                url=URL.replace("Taipei", "County%d" % (j%5))
+                cache.store(url, list(range(50)), Response())
+                data=cache.load(url)
+                assert data is None or data==list(range(50))
+        except Exception as e:
+            errors.append(e)
+    threads=[threading.Thread(target=work, args=(i,)) for i in range(8)]
+    for i in threads:
+        i.start()
+    for i in threads:
+        i.join()
+    assert errors==[]
@@ -0,0 +1,33 @@
+from nycu_tdx_py import client
+
+
+
+class Clock:
+    def __init__(self):
+        self.now=1000.0
+
+    def __call__(self):
+        return(self.now)
+
+
+
+def test_reserve_waits_for_the_whole_pause(monkeypatch):
+    clock=Clock()
+    monkeypatch.setattr(client.time, "monotonic", clock)
+    limiter=client.RateLimiter(rate=5)
+    limiter.reserve()
+    # a request taking one second, answered with 429 and Retry-After: 1
+    clock.now+=1.0
+    limiter.pause(1.0)
+    assert limiter.reserve()>=1.0
+
+
+
+def test_pause_is_counted_from_the_time_it_is_called(monkeypatch):
+    clock=Clock()
+    monkeypatch.setattr(client.time, "monotonic", clock)
+    limiter=client.RateLimiter(rate=5)
+    limiter.pause(2.0)
+    clock.now+=1.5
+    wait=limiter.reserve()
+    assert 0.5<=wait<=0.5+1/5+1e-9
@@ -0,0 +1,293 @@
+import json
+import pandas as pd
+import pytest
+from nycu_tdx_py import client, tdx
+from nycu_tdx_py.flatten import flatten, Level
+
+
+# small payloads of each layout flattened by the fetchers, with the missing keys, empty lists and names in two languages
+# found in TDX; the expected frames are those of the parsers the fetchers used before flatten()
+
+ROUTES=[{'RouteUID':'TPE1', 'RouteID':'1', 'RouteName':{'Zh_tw':'紅1', 'En':'R1'}, 'BusRouteType':11, 'DepartureStopNameZh':'捷運站', 'DestinationStopNameZh':'動物園',
+         'SubRoutes':[{'SubRouteUID':'TPE11', 'SubRouteID':'11', 'SubRouteName':{'Zh_tw':'紅1去', 'En':'R1'}, 'Direction':0, 'OperatorIDs':['100','200'], 'FirstBusTime':'0530', 'LastBusTime':'2300'},
+                      {'SubRouteUID':'TPE12', 'SubRouteID':'12', 'SubRouteName':{'Zh_tw':'紅1返'}, 'Direction':1, 'OperatorIDs':['100']}]},
+        {'RouteUID':'TPE2', 'RouteID':'2', 'RouteName':{'Zh_tw':'藍2'}, 'BusRouteType':11, 'DepartureStopNameZh':'市府', 'DestinationStopNameZh':'松山',
+         'SubRoutes':[]},
+        {'RouteUID':'TPE3', 'RouteID':'3', 'RouteName':{'Zh_tw':'棕3'}, 'BusRouteType':12, 'DepartureStopNameZh':'A', 'DestinationStopNameZh':'B',
+         'SubRoutes':[{'SubRouteUID':'TPE31', 'SubRouteID':'31', 'SubRouteName':{'Zh_tw':'棕3'}, 'Direction':0, 'OperatorIDs':['300'], 'FirstBusTime':'0600', 'LastBusTime':'2200'}]}]
+
+
+
+STOPOFROUTE=[{'RouteUID':'TPE1', 'RouteID':'1', 'RouteName':{'Zh_tw':'紅1', 'En':'R1'}, 'SubRouteUID':'TPE11', 'SubRouteID':'11', 'SubRouteName':{'Zh_tw':'紅1去'}, 'Direction':0,
+              'Stops':[{'StopUID':'TPE100', 'StopID':'100', 'StopName':{'Zh_tw':'捷運站', 'En':'MRT'}, 'StopBoarding':0, 'StopSequence':1, 'StopPosition':{'PositionLon':121.5, 'PositionLat':25.0, 'GeoHash':'wsq'}, 'StationID':'1000', 'LocationCityCode':'TPE'},
+                       {'StopUID':'TPE101', 'StopID':'101', 'StopName':{'Zh_tw':'動物園'}, 'StopBoarding':1, 'StopSequence':2, 'StopPosition':{'PositionLon':121.6, 'PositionLat':25.1}, 'LocationCityCode':'TPE'}]},
+             {'RouteUID':'TPE1', 'RouteID':'1', 'RouteName':{'Zh_tw':'紅1'}, 'SubRouteUID':'TPE12', 'SubRouteID':'12', 'SubRouteName':{'Zh_tw':'紅1返'}, 'Direction':1,
+              'Stops':[{'StopUID':'TPE101', 'StopID':'101', 'StopName':{'Zh_tw':'動物園'}, 'StopBoarding':0, 'StopSequence':1, 'StopPosition':{'PositionLon':121.6, 'PositionLat':25.1}, 'StationID':'1001', 'LocationCityCode':'TPE'}]}]
+
+
+
+TRAVELTIME=[{'RouteUID':'TPE1', 'RouteID':'1', 'SubRouteUID':'TPE11', 'SubRouteID':'11', 'Direction':0,
+             'TravelTimes':[{'Weekday':1, 'StartHour':7, 'EndHour':8, 'S2STimes':[{'FromStopID':'100', 'ToStopID':'101', 'FromStationID':'1000', 'ToStationID':'1001', 'RunTime':120},
+                                                                                  {'FromStopID':'101', 'ToStopID':'102', 'RunTime':95}]},
+                            {'Weekday':1, 'StartHour':8, 'EndHour':9, 'S2STimes':[]},
+                            {'Weekday':6, 'StartHour':7, 'EndHour':8, 'S2STimes':[{'FromStopID':'100', 'ToStopID':'101', 'FromStationID':'1000', 'ToStationID':'1001', 'RunTime':100}]}]},
+            {'RouteUID':'TPE1', 'RouteID':'1', 'SubRouteUID':'TPE12', 'SubRouteID':'12', 'Direction':1, 'TravelTimes':[]}]
+
+
+
+STATIONOFLINE=[{'LineID':'BL', 'LineNo':'BL', 'Stations':[{'Sequence':1, 'StationID':'BL01', 'StationName':{'Zh_tw':'頂埔', 'En':'Dingpu'}, 'CumulativeDistance':0.0},
+                                                          {'Sequence':2, 'StationID':'BL02', 'StationName':{'Zh_tw':'永寧'}, 'CumulativeDistance':1.5}]},
+               {'LineID':'R', 'LineNo':'R', 'Stations':[{'Sequence':1, 'StationID':'R02', 'StationName':{'Zh_tw':'象山'}}]}]
+
+
+
+LINES=[{'LineID':'BL', 'LineName':{'Zh_tw':'板南線', 'En':'Bannan'}, 'LineSectionName':{'Zh_tw':'頂埔-南港展覽館'}},
+       {'LineID':'R', 'LineName':{'Zh_tw':'淡水信義線'}, 'LineSectionName':{}}]
+
+
+
+TRA_STATION={'UpdateTime':'2024-01-01T00:00:00+08:00', 'StationTimetables':[
+    {'StationID':'1000', 'StationName':{'Zh_tw':'臺北', 'En':'Taipei'}, 'Direction':0, 'ServiceDay':{'Monday':1, 'Tuesday':1, 'Wednesday':1, 'Thursday':1, 'Friday':1, 'Saturday':0, 'Sunday':0},
+     'Timetables':[{'Sequence':1, 'TrainNo':'101', 'DestinationStationID':'4400', 'DestinationStationName':{'Zh_tw':'高雄'}, 'TrainTypeID':'1', 'TrainTypeCode':'1', 'TrainTypeName':{'Zh_tw':'自強'}, 'ArrivalTime':'06:00', 'DepartureTime':'06:02'},
+                   {'Sequence':2, 'TrainNo':'103', 'DestinationStationID':'4400', 'DestinationStationName':{'Zh_tw':'高雄'}, 'TrainTypeID':'2', 'TrainTypeCode':'2', 'TrainTypeName':{'Zh_tw':'莒光'}, 'ArrivalTime':'07:00', 'DepartureTime':'07:02'}]},
+    {'StationID':'1020', 'StationName':{'Zh_tw':'板橋'}, 'Direction':1, 'ServiceDay':{'Monday':0, 'Tuesday':0, 'Wednesday':0, 'Thursday':0, 'Friday':0, 'Saturday':1, 'Sunday':1},
+     'Timetables':[{'Sequence':1, 'TrainNo':'102', 'DestinationStationID':'0900', 'DestinationStationName':{'Zh_tw':'基隆'}, 'TrainTypeID':'1', 'TrainTypeCode':'1', 'TrainTypeName':{'Zh_tw':'自強'}, 'ArrivalTime':'08:10', 'DepartureTime':'08:11'}]}]}
+
+
+
+TRA_GENERAL={'UpdateTime':'2024-01-01T00:00:00+08:00', 'TrainTimetables':[
+    {'TrainInfo':{'TrainNo':'101', 'Direction':0, 'TrainTypeID':'1', 'TrainTypeCode':'1', 'TrainTypeName':{'Zh_tw':'自強', 'En':'Tze-Chiang'}, 'StartingStationID':'1000', 'StartingStationName':{'Zh_tw':'臺北'}, 'EndingStationID':'4400', 'EndingStationName':{'Zh_tw':'高雄'}},
+     'ServiceDay':{'Monday':1, 'Tuesday':1, 'Wednesday':1, 'Thursday':1, 'Friday':1, 'Saturday':1, 'Sunday':1},
+     'StopTimes':[{'StopSequence':1, 'StationID':'1000', 'StationName':{'Zh_tw':'臺北'}, 'ArrivalTime':'06:00', 'DepartureTime':'06:02'},
+                  {'StopSequence':2, 'StationID':'1020', 'StationName':{'Zh_tw':'板橋'}, 'ArrivalTime':'06:10', 'DepartureTime':'06:11'},
+                  {'StopSequence':3, 'StationID':'4400', 'StationName':{'Zh_tw':'高雄'}, 'ArrivalTime':'10:00', 'DepartureTime':'10:00'}]},
+    {'TrainInfo':{'TrainNo':'102', 'Direction':1, 'TrainTypeID':'2', 'TrainTypeCode':'2', 'TrainTypeName':{'Zh_tw':'莒光'}, 'StartingStationID':'1020', 'StartingStationName':{'Zh_tw':'板橋'}, 'EndingStationID':'0900', 'EndingStationName':{'Zh_tw':'基隆'}},
+     'ServiceDay':{'Monday':0, 'Tuesday':0, 'Wednesday':0, 'Thursday':0, 'Friday':0, 'Saturday':1, 'Sunday':1},
+     'StopTimes':[{'StopSequence':1, 'StationID':'1020', 'StationName':{'Zh_tw':'板橋'}, 'ArrivalTime':'08:10', 'DepartureTime':'08:11'},
+                  {'StopSequence':2, 'StationID':'0900', 'StationName':{'Zh_tw':'基隆'}, 'ArrivalTime':'08:50', 'DepartureTime':'08:50'}]}]}
+
+
+
+THSR_GENERAL=[{'UpdateTime':'2024-01-01T00:00:00+08:00', 'GeneralTimetable':{
+    'GeneralTrainInfo':{'TrainNo':'0803', 'Direction':0, 'StartingStationID':'0990', 'StartingStationName':{'Zh_tw':'南港', 'En':'Nangang'}, 'EndingStationID':'1070', 'EndingStationName':{'Zh_tw':'左營'}, 'Note':{}},
+    'ServiceDay':{'Monday':1, 'Tuesday':1, 'Wednesday':1, 'Thursday':1, 'Friday':1, 'Saturday':0, 'Sunday':0},
+    'StopTimes':[{'StopSequence':1, 'StationID':'0990', 'StationName':{'Zh_tw':'南港'}, 'DepartureTime':'06:15'},
+                 {'StopSequence':2, 'StationID':'1000', 'StationName':{'Zh_tw':'台北'}, 'ArrivalTime':'06:23', 'DepartureTime':'06:25'},
+                 {'StopSequence':3, 'StationID':'1070', 'StationName':{'Zh_tw':'左營'}, 'ArrivalTime':'07:50'}]}}]
+
+
+
+EXPECTED_BUS_ROUTE=pd.DataFrame({'RouteUID':['TPE1', 'TPE1', 'TPE3'],
+                                 'RouteID':['1', '1', '3'],
+                                 'RouteName':['紅1', '紅1', '棕3'],
+                                 'BusRouteType':[11, 11, 12],
+                                 'DepartureStopNameZh':['捷運站', '捷運站', 'A'],
+                                 'DestinationStopNameZh':['動物園', '動物園', 'B'],
+                                 'SubRouteUID':['TPE11', 'TPE12', 'TPE31'],
+                                 'SubRouteID':['11', '12', '31'],
+                                 'SubRouteName':['紅1去', '紅1返', '棕3'],
+                                 'Direction':[0, 1, 0],
+                                 'OperatorIDs':[['100','200'], ['100'], ['300']],
+                                 'FirstBusTime':['0530', None, '0600'],
+                                 'LastBusTime':['2300', None, '2200']})
+
+
+
+EXPECTED_BUS_STOPOFROUTE=pd.DataFrame({'RouteUID':['TPE1', 'TPE1', 'TPE1'],
+                                       'RouteID':['1', '1', '1'],
+                                       'RouteName':['紅1', '紅1', '紅1'],
+                                       'SubRouteUID':['TPE11', 'TPE11', 'TPE12'],
+                                       'SubRouteName':['紅1去', '紅1去', '紅1返'],
+                                       'SubRouteID':['11', '11', '12'],
+                                       'Direction':[0, 0, 1],
+                                       'StopUID':['TPE100', 'TPE101', 'TPE101'],
+                                       'StopID':['100', '101', '101'],
+                                       'StopName':['捷運站', '動物園', '動物園'],
+                                       'StationID':['1000', None, '1001'],
+                                       'StopBoarding':[0, 1, 0],
+                                       'StopSequence':[1, 2, 1],
+                                       'PositionLon':[121.5, 121.6, 121.6],
+                                       'PositionLat':[25.0, 25.1, 25.1],
+                                       'LocationCityCode':['TPE', 'TPE', 'TPE']})
+
+
+
+EXPECTED_BUS_TRAVELTIME=pd.DataFrame({'RouteUID':['TPE1', 'TPE1', 'TPE1'],
+                                      'RouteID':['1', '1', '1'],
+                                      'SubRouteUID':['TPE11', 'TPE11', 'TPE11'],
+                                      'SubRouteID':['11', '11', '11'],
+                                      'Direction':[0, 0, 0],
+                                      'Weekday':[1, 1, 6],
+                                      'StartHour':[7, 7, 7],
+                                      'EndHour':[8, 8, 8],
+                                      'FromStopID':['100', '101', '100'],
+                                      'ToStopID':['101', '102', '101'],
+                                      'FromStationID':['1000', None, '1000'],
+                                      'ToStationID':['1001', None, '1001'],
+                                      'RunTime':[120, 95, 100]})
+
+
+
+EXPECTED_RAIL_STATIONOFLINE=pd.DataFrame({'LineID':['BL', 'BL', 'R'],
+                                          'LineName':['板南線', '板南線', '淡水信義線'],
+                                          'LineSectionName':['頂埔-南港展覽館', '頂埔-南港展覽館', None],
+                                          'Sequence':[1, 2, 1],
+                                          'StationID':['BL01', 'BL02', 'R02'],
+                                          'StationName':['頂埔', '永寧', '象山'],
+                                          'CumulativeDistance':[0.0, 1.5, None]})
+
+
+
+EXPECTED_TRA_STATIONTIMETABLE=pd.DataFrame({'StationID':['1000', '1000', '1020'],
+                                            'StationName':['臺北', '臺北', '板橋'],
+                                            'Direction':[0, 0, 1],
+                                            'Monday':[1, 1, 0],
+                                            'Tuesday':[1, 1, 0],
+                                            'Wednesday':[1, 1, 0],
+                                            'Thursday':[1, 1, 0],
+                                            'Friday':[1, 1, 0],
+                                            'Saturday':[0, 0, 1],
+                                            'Sunday':[0, 0, 1],
+                                            'Sequence':[1, 2, 1],
+                                            'TrainNo':['101', '103', '102'],
+                                            'DestinationStationID':['4400', '4400', '0900'],
+                                            'DestinationStationName':['高雄', '高雄', '基隆'],
+                                            'TrainTypeID':['1', '2', '1'],
+                                            'TrainTypeCode':['1', '2', '1'],
+                                            'TrainTypeName':['自強', '莒光', '自強'],
+                                            'ArrivalTime':['06:00', '07:00', '08:10'],
+                                            'DepartureTime':['06:02', '07:02', '08:11']})
+
+
+
+EXPECTED_TRA_GENERALTIMETABLE=pd.DataFrame({'TrainNo':['101', '101', '101', '102', '102'],
+                                            'Direction':[0, 0, 0, 1, 1],
+                                            'TrainTypeID':['1', '1', '1', '2', '2'],
+                                            'TrainTypeCode':['1', '1', '1', '2', '2'],
+                                            'TrainTypeName':['自強', '自強', '自強', '莒光', '莒光'],
+                                            'StartingStationID':['1000', '1000', '1000', '1020', '1020'],
+                                            'StartingStationName':['臺北', '臺北', '臺北', '板橋', '板橋'],
+                                            'EndingStationID':['4400', '4400', '4400', '0900', '0900'],
+                                            'EndingStationName':['高雄', '高雄', '高雄', '基隆', '基隆'],
+                                            'Monday':[1, 1, 1, 0, 0],
+                                            'Tuesday':[1, 1, 1, 0, 0],
+                                            'Wednesday':[1, 1, 1, 0, 0],
+                                            'Thursday':[1, 1, 1, 0, 0],
+                                            'Friday':[1, 1, 1, 0, 0],
+                                            'Saturday':[1, 1, 1, 1, 1],
+                                            'Sunday':[1, 1, 1, 1, 1],
+                                            'StopSequence':[1, 2, 3, 1, 2],
+                                            'StationID':['1000', '1020', '4400', '1020', '0900'],
+                                            'StationName':['臺北', '板橋', '高雄', '板橋', '基隆'],
+                                            'ArrivalTime':['06:00', '06:10', '10:00', '08:10', '08:50'],
+                                            'DepartureTime':['06:02', '06:11', '10:00', '08:11', '08:50']})
+
+
+
+EXPECTED_THSR_GENERALTIMETABLE=pd.DataFrame({'TrainNo':['0803', '0803', '0803'],
+                                             'Direction':[0, 0, 0],
+                                             'StartingStationID':['0990', '0990', '0990'],
+                                             'StartingStationName':['南港', '南港', '南港'],
+                                             'EndingStationID':['1070', '1070', '1070'],
+                                             'EndingStationName':['左營', '左營', '左營'],
+                                             'Note':[{}, {}, {}],
+                                             'Monday':[1, 1, 1],
+                                             'Tuesday':[1, 1, 1],
+                                             'Wednesday':[1, 1, 1],
+                                             'Thursday':[1, 1, 1],
+                                             'Friday':[1, 1, 1],
+                                             'Saturday':[0, 0, 0],
+                                             'Sunday':[0, 0, 0],
+                                             'StopSequence':[1, 2, 3],
+                                             'StationID':['0990', '1000', '1070'],
+                                             'StationName':['南港', '台北', '左營'],
+                                             'ArrivalTime':[None, '06:23', '07:50'],
+                                             'DepartureTime':['06:15', '06:25', None]})
+
+
+
+def assert_equal(result, expected):
+    # the values and columns, whether a missing value is None or NaN and the width of the integers aside
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected, check_dtype=False)
+
+
+
+class StubClient:
+    # answers every url with the payload of the first of 'payloads' whose key is in it
+    cache=None
+
+    def __init__(self, payloads):
+        self.payloads=payloads
+
+    def get_json(self, url, access_token):
+        return(next(payload for key, payload in self.payloads.items() if key in url))
+
+    def iter_json(self, url, access_token, key=None):
+        data=self.get_json(url, access_token)
+        yield from (data[key] if key is not None else data)
+
+
+
+@pytest.fixture
+def stub():
+    client.set_client(StubClient({'StationOfLine':STATIONOFLINE, '/Line/':LINES, 'StopOfRoute':STOPOFROUTE, 'Route/':ROUTES}))
+    yield
+    client.set_client(None)
+
+
+
+@pytest.mark.parametrize("records, spec, expected", [(ROUTES, tdx.BUS_ROUTE_SPEC, EXPECTED_BUS_ROUTE),
+                                                     (STOPOFROUTE, tdx.BUS_STOPOFROUTE_SPEC, EXPECTED_BUS_STOPOFROUTE),
+                                                     (TRAVELTIME, tdx.BUS_TRAVELTIME_SPEC, EXPECTED_BUS_TRAVELTIME),
+                                                     (TRA_STATION['StationTimetables'], tdx.TRA_STATIONTIMETABLE_SPEC, EXPECTED_TRA_STATIONTIMETABLE),
+                                                     (TRA_GENERAL['TrainTimetables'], tdx.TRA_GENERALTIMETABLE_SPEC, EXPECTED_TRA_GENERALTIMETABLE),
+                                                     (THSR_GENERAL, tdx.THSR_GENERALTIMETABLE_SPEC, EXPECTED_THSR_GENERALTIMETABLE)])
+def test_flatten_matches_the_former_parsers(records, spec, expected):
+    assert_equal(flatten(records, spec), expected)
+    # records handed over one by one while they are decoded
+    assert_equal(flatten(iter(json.loads(json.dumps(records))), spec), expected)
+
+
+
+def test_fetchers_match_the_former_parsers(stub):
+    assert_equal(tdx.Bus_Route("mock-token", "Taipei"), EXPECTED_BUS_ROUTE.assign(OperatorIDs=['100, 200', '100', '300']))
+    assert_equal(tdx.Bus_StopOfRoute("mock-token", "Taipei"), EXPECTED_BUS_STOPOFROUTE)
+    assert_equal(tdx.Rail_StationOfLine("mock-token", "TRTC"), EXPECTED_RAIL_STATIONOFLINE)
+
+
+
+def test_names_are_unwrapped_from_zh_tw():
+    data=flatten([{'RouteName':{'Zh_tw':'紅1', 'En':'R1'}}, {'RouteName':{'En':'R2'}}, {'RouteName':{}}, {'RouteName':None}, {}],
+                 [Level({'RouteName':('RouteName','Zh_tw'), 'RouteNameEn':('RouteName','En')})])
+    assert data.RouteName[0]=='紅1'
+    assert data.RouteName[1:].isna().all()
+    assert data.RouteNameEn[:2].tolist()==['R1', 'R2']
+
+
+
+def test_keep_empty_keeps_the_records_without_children():
+    spec=[Level(dict(tdx.BUS_ROUTE_SPEC[0].fields), 'SubRoutes', keep_empty=True), tdx.BUS_ROUTE_SPEC[1]]
+    data=flatten(ROUTES, spec)
+    assert data.RouteUID.tolist()==['TPE1', 'TPE1', 'TPE2', 'TPE3']
+    assert data.loc[2, 'RouteName']=='藍2'
+    assert data.loc[2, ['SubRouteUID','SubRouteID','SubRouteName','Direction','FirstBusTime']].isna().all()
+    assert_equal(data.drop(2), EXPECTED_BUS_ROUTE)
+
+    # on every level of three, an empty level in the middle gives one row too
+    spec=[Level(dict(tdx.BUS_TRAVELTIME_SPEC[0].fields), 'TravelTimes', keep_empty=True),
+          Level(dict(tdx.BUS_TRAVELTIME_SPEC[1].fields), 'S2STimes', keep_empty=True),
+          tdx.BUS_TRAVELTIME_SPEC[2]]
+    data=flatten(TRAVELTIME, spec)
+    assert list(zip(data.SubRouteUID, data.StartHour.fillna(-1), data.RunTime.fillna(-1)))==[('TPE11', 7, 120), ('TPE11', 7, 95), ('TPE11', 8, -1), ('TPE11', 7, 100), ('TPE12', -1, -1)]
+    assert_equal(data[data.RunTime.notna()], EXPECTED_BUS_TRAVELTIME)
+
+
+
+def test_compact_stores_the_outer_columns_as_categories():
+    data=flatten(STOPOFROUTE, tdx.BUS_STOPOFROUTE_SPEC, compact=True)
+    for label_id in ['RouteUID','RouteName','SubRouteUID','SubRouteName']:
+        assert isinstance(data[label_id].dtype, pd.CategoricalDtype)
+    for label_id in ['StopUID','StopName']:
+        assert not isinstance(data[label_id].dtype, pd.CategoricalDtype)
+    assert_equal(data.astype({i:str for i in ['RouteUID','RouteID','RouteName','SubRouteUID','SubRouteName','SubRouteID']}), EXPECTED_BUS_STOPOFROUTE)
+    assert_equal(flatten(TRA_GENERAL['TrainTimetables'], tdx.TRA_GENERALTIMETABLE_SPEC, compact=True).astype(object), EXPECTED_TRA_GENERALTIMETABLE)
@@ -0,0 +1,23 @@
+import pytest
+from nycu_tdx_py import client, realtime
+from mock_server import MockTDX
+
+
+
+def test_a_county_failing_to_parse_does_not_lose_the_others(tmp_path, monkeypatch):
+    flatten=realtime.flatten
+    def failing(records, spec, *args, **kwargs):
+        records=list(records)
+        if any([i.get('RouteUID', '').startswith('NewTaipei') for i in records]):
+            raise KeyError('PlateNumb')
+        return(flatten(records, spec, *args, **kwargs))
+    monkeypatch.setattr(realtime, "flatten", failing)
+    with MockTDX(routes=5, buses=20) as mock:
+        client.configure(base_url=mock.base_url, rate=None)
+        poller=realtime.Poller("mock-token", records=["position"], counties=["Taipei","NewTaipei","Taichung"], path=str(tmp_path), flush_interval=3600)
+        with pytest.warns(UserWarning, match="NewTaipei position: KeyError"):
+            changes=poller.poll()
+        assert set(changes['position'].County)=={"Taipei","Taichung"}
+        assert poller.stats['errors']==1
+        assert ("position", "NewTaipei") not in poller.validators
+    client.set_client(None)
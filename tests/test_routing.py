@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+from nycu_tdx_py.routing import Router
+from nycu_tdx_py.timetable import WEEKDAYS
+
+
+
+def schedule(trips):
+    # the rows of Bus_Schedule(stoptimes=True) of one subroute, trips given as [(TripID, [(StopUID, 'HH:MM:SS'), ...]), ...]
+    rows=[]
+    for trip, stops in trips:
+        for sequence, (stop, time) in enumerate(stops):
+            rows.append(dict({'RouteUID':'TPE1', 'SubRouteUID':'TPE11', 'Direction':0, 'TripID':trip, 'StopSequence':sequence+1,
+                              'StopUID':stop, 'ArrivalTime':time, 'DepartureTime':time}, **{day:1 for day in WEEKDAYS}))
+    return(pd.DataFrame(rows))
+
+
+
+def router(trips, **kwargs):
+    # stops 5 km apart, so that no walk joins them
+    stops=pd.DataFrame({'StopUID':['S1','S2','S3','S4'], 'PositionLon':[121.0, 121.05, 121.1, 121.15], 'PositionLat':24.0})
+    return(Router.from_frames(schedule(trips), stops, **kwargs))
+
+
+
+def test_trips_without_tripid_are_not_joined():
+    data=router([(None, [('S1','08:00:00'), ('S2','08:10:00')]), (None, [('S3','08:20:00'), ('S4','08:30:00')])])
+    assert len(data)==2
+    arrival=data.earliest_arrival("S1", "07:55", "Monday")
+    assert list(arrival.index)==['S1','S2']
+    assert arrival['S2']==900
+
+
+
+def test_transfer_needs_min_transfer_seconds():
+    trips=[('1', [('S1','08:00:00'), ('S2','08:10:00')]), ('2', [('S2','08:10:30'), ('S3','08:20:00')])]
+    assert 'S3' not in router(trips, min_transfer=60).earliest_arrival("S1", "08:00", "Monday").index
+    assert router(trips, min_transfer=0).earliest_arrival("S1", "08:00", "Monday")['S3']==1200
+
+
+
+def test_staying_on_a_trip_is_not_a_transfer(tmp_path):
+    data=router([('1', [('S1','08:00:00'), ('S2','08:10:00'), ('S3','08:10:10')])], min_transfer=600)
+    assert data.earliest_arrival("S1", "08:00", "Monday")['S3']==610
+    data.save(str(tmp_path))
+    loaded=Router.load(str(tmp_path))
+    assert loaded.min_transfer==600
+    assert np.array_equal(loaded.travel_times(["S1"], "08:00", "Monday").to_numpy(), data.travel_times(["S1"], "08:00", "Monday").to_numpy(), equal_nan=True)
@@ -0,0 +1,74 @@
+import json
+import pytest
+from nycu_tdx_py import stream
+
+
+
+RECORDS=[{'RouteUID':'TPE10132', 'RouteName':{'Zh_tw':'紅32', 'En':'R32'}, 'Stops':[{'StopName':'捷運\u201c圓山\u201d站', 'Sequence':1}]},
+         {'RouteUID':'TPE\\"[10133]', 'Note':'a quote \\" and } ] { [ inside', 'Path':'C:\\\\tdx\\\\', 'Stops':[]},
+         {'RouteUID':'TPE10134', 'Fare':-12.5e1, 'Empty':{}, 'List':[[1, 2], [3, [4]]], 'Flag':True, 'None':None},
+         {'RouteUID':'臺北市\\\\', 'Emoji':'🚌🚏', 'Stops':[{'StopName':'\\u81fa\\u5317'}]}]
+
+
+
+def splits(body):
+    # the body cut at every byte boundary into two chunks, and into chunks of one byte
+    for i in range(len(body)+1):
+        yield([body[:i], body[i:]])
+    yield([body[i:i+1] for i in range(len(body))])
+
+
+
+def raw(records):
+    # the records as TDX sends them, with the escapes and characters of the text untouched
+    return(json.dumps(records, ensure_ascii=False).encode("utf-8"))
+
+
+
+def test_iter_records_of_an_array():
+    for body in [raw(RECORDS), json.dumps(RECORDS).encode("ascii")]:
+        for chunks in splits(body):
+            assert list(stream.iter_records(chunks))==json.loads(body)
+
+
+
+def test_iter_records_with_whitespace_and_a_bom():
+    body=b"\xef\xbb\xbf \n[ \n"+b" ,\n ".join([raw(i) for i in RECORDS])+b"\n ]\n"
+    for chunks in splits(body):
+        assert list(stream.iter_records(chunks))==json.loads(body.decode("utf-8-sig"))
+
+
+
+def test_iter_records_unwraps_the_key_of_v3():
+    body=raw({'UpdateTime':'2024-01-01T00:00:00+08:00', 'Note':{'Text':'["]'}, 'StationTimetables':RECORDS, 'Count':4})
+    for chunks in splits(body):
+        assert list(stream.iter_records(chunks, 'StationTimetables'))==RECORDS
+
+
+
+def test_iter_records_of_an_empty_array():
+    for body in [b"[]", b" [ ] ", raw({'UpdateTime':'2024', 'TrainTimetables':[]})]:
+        for chunks in splits(body):
+            assert list(stream.iter_records(chunks, 'TrainTimetables'))==[]
+
+
+
+def test_iter_records_raises_the_message_of_tdx():
+    body=raw({'Message':'The county 「Nowhere」 is not valid.'})
+    for chunks in splits(body):
+        with pytest.raises(ValueError, match="Nowhere"):
+            list(stream.iter_records(chunks))
+        with pytest.raises(ValueError, match="Nowhere"):
+            list(stream.iter_records(chunks, 'StationTimetables'))
+
+
+
+def test_iter_records_raises_on_a_body_cut_short():
+    body=raw(RECORDS)
+    for end in range(1, len(body)):
+        # the records completed before the cut are still handed out first
+        records=[]
+        with pytest.raises(ValueError):
+            for record in stream.iter_records([body[:end]]):
+                records.append(record)
+        assert records==RECORDS[:len(records)]
@@ -0,0 +1,144 @@
+import json
+import pandas as pd
+import pytest
+import requests
+import shapely
+import synthetic
+from mock_server import MockTDX
+from nycu_tdx_py import client, tdx
+
+
+
+@pytest.fixture
+def mock():
+    with MockTDX(routes=5) as mock:
+        client.configure(base_url=mock.base_url, rate=None)
+        yield mock
+    client.set_client(None)
+
+
+
+def test_iter_chunks_rejects_a_shapefile_of_text(mock, tmp_path):
+    out=str(tmp_path/"route.shp")
+    with pytest.warns(UserWarning, match="dtype='sf'"):
+        assert tdx.iter_chunks(tdx.Bus_Route, "mock-token", "Taipei", chunksize=4, out=out) is None
+    with pytest.warns(UserWarning, match="dtype='sf'"):
+        assert tdx.iter_chunks(tdx.Bus_Shape, "mock-token", "Taipei", chunksize=4, out=out) is None
+    assert mock.requests==0
+
+
+
+def test_iter_chunks_writes_a_shapefile_of_sf(mock, tmp_path):
+    out=str(tmp_path/"shape.shp")
+    chunks=list(tdx.iter_chunks(tdx.Bus_Shape, "mock-token", "Taipei", dtype="sf", chunksize=4, out=out))
+    assert len(tdx.read_out(out))==sum([len(i) for i in chunks])
+
+
+
+def test_drop_single_points_works_on_the_parsed_parts():
+    geometry=pd.Series(["MULTILINESTRING ((121.5 25, 121.6 25.1), (121.7 25.2))",
+                        "MULTILINESTRING((121.5 25))",
+                        "MULTILINESTRING Z ((121.5 25 10, 121.6 25.1 12), ( 121.7 25.2 14 ))",
+                        "MULTILINESTRING M ((121.5 25 0, 121.6 25.1 1), (121.7 25.2 2))",
+                        "MULTILINESTRING (EMPTY, (121.7 25.2), (121.5 25, 121.6 25.1))",
+                        "MULTILINESTRING ((121.5 25, 121.6 25.1))"])
+    geometry=shapely.from_wkt(tdx._drop_single_points(geometry).to_numpy(dtype=object))
+    expected=shapely.from_wkt(["MULTILINESTRING ((121.5 25, 121.6 25.1))",
+                               "MULTILINESTRING EMPTY",
+                               "MULTILINESTRING Z ((121.5 25 10, 121.6 25.1 12))",
+                               "MULTILINESTRING ((121.5 25, 121.6 25.1))",
+                               "MULTILINESTRING ((121.5 25, 121.6 25.1))",
+                               "MULTILINESTRING ((121.5 25, 121.6 25.1))"])
+    assert shapely.equals_exact(geometry, expected, 0).all()
+    assert list(shapely.has_z(geometry))==[False, False, True, False, False, False]
+
+
+
+class BrokenResponse:
+    # a streamed response whose body stops after 'cut' bytes, by a dropped connection or just by ending there
+    def __init__(self, body, cut, error=None):
+        self.body, self.cut, self.error=body, cut, error
+        self.status_code=200
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, self.cut, 64):
+            yield(self.body[i:min(i+64, self.cut)])
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        pass
+
+
+
+@pytest.mark.parametrize("error", [requests.exceptions.ChunkedEncodingError("Connection broken"), None])
+def test_fetchers_warn_when_the_body_fails_partway(monkeypatch, error):
+    body=json.dumps([{'RouteUID':'TPE'+str(i), 'RouteID':str(i), 'RouteName':{'Zh_tw':str(i)}} for i in range(100)]).encode()
+    tdx_client=client.configure(rate=None)
+    monkeypatch.setattr(tdx_client, "get", lambda url, access_token=None, **kwargs: BrokenResponse(body, len(body)//2, error))
+    try:
+        with pytest.warns(UserWarning):
+            assert tdx.Bus_Route("mock-token", "Taipei") is None
+        with pytest.warns(UserWarning):
+            assert tdx.Bus_RealTime("mock-token", "Taipei") is None
+    finally:
+        client.set_client(None)
+
+
+
+def set_routes(mock, routes):
+    mock.bodies[r"/api/basic/v2/Bus/Route/"]=json.dumps(routes, ensure_ascii=False).encode("utf-8")
+
+
+
+def test_sync_updates_the_changed_records(mock, tmp_path):
+    snapshot=str(tmp_path/"route.pkl")
+    routes=synthetic.bus_route(5, 2)
+    set_routes(mock, routes)
+    first=tdx.sync(tdx.Bus_Route, "mock-token", "Taipei", snapshot=snapshot)
+    pd.testing.assert_frame_equal(first, tdx.Bus_Route("mock-token", "Taipei"))
+    assert pd.read_pickle(snapshot)['updated']=='2024-01-01T00:00:00+08:00'
+
+    # one route renamed and one added since the snapshot: only they are sent back and replace or join its rows
+    routes[1]=dict(routes[1], RouteName={'Zh_tw':'新路線1', 'En':'New 1'}, SubRoutes=routes[1]['SubRoutes'][:1], UpdateTime='2024-02-01T00:00:00+08:00')
+    routes.append(dict(synthetic.bus_route(6, 2)[5], UpdateTime='2024-02-02T00:00:00+08:00'))
+    set_routes(mock, routes)
+    second=tdx.sync(tdx.Bus_Route, "mock-token", "Taipei", snapshot=snapshot)
+    expected=tdx.Bus_Route("mock-token", "Taipei")
+    assert len(second)==len(first)-1+2
+    key=['RouteUID','SubRouteUID']
+    pd.testing.assert_frame_equal(second.sort_values(key).reset_index(drop=True), expected.sort_values(key).reset_index(drop=True))
+    assert pd.read_pickle(snapshot)['updated']=='2024-02-02T00:00:00+08:00'
+
+    # nothing changed since: TDX answers an empty page and the snapshot is kept as it is
+    requests=mock.requests
+    third=tdx.sync(tdx.Bus_Route, "mock-token", "Taipei", snapshot=snapshot)
+    assert mock.requests==requests+1
+    pd.testing.assert_frame_equal(third, second)
+    assert pd.read_pickle(snapshot)['updated']=='2024-02-02T00:00:00+08:00'
+
+    # a deleted route is only dropped by a full download
+    set_routes(mock, routes[1:])
+    assert 'TPE0' in set(tdx.sync(tdx.Bus_Route, "mock-token", "Taipei", snapshot=snapshot).RouteUID)
+    full=tdx.sync(tdx.Bus_Route, "mock-token", "Taipei", snapshot=snapshot, full=True)
+    assert 'TPE0' not in set(full.RouteUID)
+    pd.testing.assert_frame_equal(full, tdx.Bus_Route("mock-token", "Taipei"))
+    pd.testing.assert_frame_equal(pd.read_pickle(snapshot)['data'], full)
+
+
+
+def test_route_fare_parses_each_pricing_type_and_warns_about_the_others(mock):
+    routes=synthetic.bus_routefare(routes=6, stops=10)
+    unknown=[dict(routes[0], RouteID='90', FarePricingType=3), {k:v for k, v in routes[1].items() if k!='FarePricingType'} | {'RouteID':'91'}]
+    mock.bodies[r"/api/basic/v2/Bus/RouteFare/"]=json.dumps(routes+unknown, ensure_ascii=False).encode("utf-8")
+    with pytest.warns(UserWarning, match=r"2 route\(s\).*90 \(3\), 91 \(None\)"):
+        fare=tdx.Bus_RouteFare("mock-token", "Taipei")
+    assert list(fare)==['BufferZones','SectionFares','ODFares','StageFares']
+    # routes 0 and 3 by section, 1 and 4 by origin and destination, 2 and 5 by stage, each with 2 fares
+    assert fare['BufferZones'].RouteID.tolist()==['0','3']
+    # the buffer zone of route 0, route 3 has none
+    assert fare['BufferZones'].OriginStopID.isna().tolist()==[False, True]
+    assert fare['SectionFares'].RouteID.tolist()==['0','0','3','3']
+    assert fare['ODFares'].RouteID.tolist()==['1']*90+['4']*90
+    assert fare['StageFares'].RouteID.tolist()==['2']*4+['5']*4
+    assert (fare['StageFares'].FarePricingType==2).all()
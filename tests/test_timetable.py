@@ -0,0 +1,81 @@
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from nycu_tdx_py.timetable import TimetableIndex, WEEKDAYS, _seconds
+
+
+
+def clock(seconds):
+    return("%02d:%02d" % (seconds//3600, seconds//60%60))
+
+
+
+def timetables(seed=0, stations=5, trains=40):
+    # a station timetable (Rail_TimeTable 'station') and a general one ('general') of random trains running on random days,
+    # the first trains of the general timetable are also in the station one
+    rng=np.random.default_rng(seed)
+    station, general=[], []
+    for train in range(trains):
+        days={day:int(rng.random()<0.6) for day in WEEKDAYS}
+        start=int(rng.integers(5*60, 23*60))*60
+        for sequence, stop in enumerate(sorted(rng.choice(stations, 3, replace=False))):
+            arrival=start+sequence*600
+            row=dict({'TrainNo':str(train), 'Direction':train%2, 'StationID':str(stop), 'ArrivalTime':clock(arrival), 'DepartureTime':clock(arrival+60)}, **days)
+            if train<trains//2+5:
+                general.append(dict(row, StopSequence=sequence+1, EndingStationID=str(stations)))
+            if train>=trains//2:
+                station.append(dict(row, Sequence=sequence+1, DestinationStationID=str(stations)))
+    return(pd.DataFrame(station), pd.DataFrame(general))
+
+
+
+def brute_force(frames, station, seconds, weekday, n):
+    # departure seconds of the next n departures from 'station', each train once
+    data=pd.concat(frames, ignore_index=True)
+    data=data[(data.StationID==station) & (data[WEEKDAYS[weekday]]==1)]
+    departure=data.DepartureTime.map(lambda i: int(i[:2])*3600+int(i[3:])*60)
+    data=data.assign(departure=departure).drop_duplicates(subset=['TrainNo','Direction','departure'])
+    return(sorted(data.departure[data.departure>=seconds])[:n])
+
+
+
+def test_next_departures_match_a_brute_force_search():
+    frames=timetables()
+    index=TimetableIndex.from_frames(frames)
+    queries=[(str(station), seconds, weekday) for station in range(6) for seconds in range(4*3600, 25*3600, 2700) for weekday in range(7)]
+    positions=index.search([i[0] for i in queries], [i[1] for i in queries], [i[2] for i in queries], n=4)
+    for (station, seconds, weekday), position in zip(queries, positions):
+        expected=brute_force(frames, station, seconds, weekday, 4)
+        assert list(index.frame(position).DepartureSec)==expected
+        departures=index.next_departures(station, clock(seconds), WEEKDAYS[weekday], n=4)
+        assert list(departures.DepartureSec)==expected
+        assert (departures.StationID==station).all()
+
+
+
+def test_times_of_queries():
+    assert _seconds("8:30")==_seconds("08:30")==_seconds(" 08:30:00 ")==30600
+    assert _seconds("25:10")==90600
+    assert _seconds(datetime.datetime(2024, 1, 1, 8, 30))==_seconds(30600)==30600
+    for value in ["8.30", "08:3", "08:60", "", "noon", -1]:
+        with pytest.raises(ValueError):
+            _seconds(value)
+    index=TimetableIndex.from_frames(timetables())
+    with pytest.raises(ValueError):
+        index.next_departures("1", "8:30 am", "Monday")
+    with pytest.raises(ValueError):
+        index.search(["1"], [-60], [0])
+    frames=timetables()
+    assert list(index.next_departures("1", "8:30", "Monday").DepartureSec)==brute_force(frames, "1", 30600, 0, 5)
+
+
+
+def test_save_and_load(tmp_path):
+    index=TimetableIndex.from_frames(timetables(seed=1))
+    index.save(str(tmp_path))
+    for loaded in [TimetableIndex.load(str(tmp_path)), TimetableIndex.load(str(tmp_path), mmap=False)]:
+        assert len(loaded)==len(index)
+        assert list(loaded.columns)==list(index.columns)
+        for station in ["0", "2", "4", "9"]:
+            pd.testing.assert_frame_equal(loaded.next_departures(station, "06:00", "Saturday", n=10), index.next_departures(station, "06:00", "Saturday", n=10))
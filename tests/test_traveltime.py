@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+import synthetic
+from nycu_tdx_py import tdx
+from nycu_tdx_py.flatten import flatten
+from nycu_tdx_py.traveltime import TravelTimeIndex
+
+
+
+@pytest.fixture(scope="module")
+def index():
+    stopofroute=flatten(synthetic.bus_stopofroute(routes=2, subroutes=2, stops=5), tdx.BUS_STOPOFROUTE_SPEC)
+    traveltime=flatten(sum([synthetic.bus_traveltime(2, 14, 5, route=i) for i in range(2)], []), tdx.BUS_TRAVELTIME_SPEC)
+    return(TravelTimeIndex.from_frames(traveltime, stopofroute))
+
+
+
+def test_matrix_agrees_with_travel_time(index):
+    matrix=index.matrix("TPE0_0", 0, 1, 8)
+    assert matrix.shape==(5, 5)
+    assert matrix.loc["TPE0", "TPE4"]==index.travel_time("TPE0_0", 0, "TPE0", "TPE4", 1, 8)
+    assert np.isnan(matrix.loc["TPE4", "TPE0"])
+
+
+
+@pytest.mark.parametrize("weekday, hour, message", [(1, 24, "'hour'"), (1, -1, "'hour'"), (1, 8.5, "'hour'"), (7, 8, "'weekday'"), (-1, 8, "'weekday'"), ("Monday", 8, "'weekday'")])
+def test_matrix_rejects_an_unknown_band(index, weekday, hour, message):
+    with pytest.raises(ValueError, match=message):
+        index.matrix("TPE0_0", 0, weekday, hour)